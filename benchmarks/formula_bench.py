@@ -0,0 +1,244 @@
+"""
+formula_bench.py - Microbenchmarks for the formula tools
+
+For every tool in src/tools/formulas.py (typical, zero-rate and large-n
+inputs) this times, per call:
+
+    math        the numeric kernel the tool calls
+    validation  pydantic validation of the arguments (args_schema)
+    run         the tool's _run: math + result formatting
+    invoke      BaseTool.invoke end to end
+
+and derives formatting = run - math and framework = invoke - run - validation.
+Each stage is warmed up, then timed over several repeats; the report gives
+min/median/mean/stdev per call in microseconds. Medians are what to compare
+between commits (--compare old.json prints the ratios).
+
+Run with: python benchmarks/formula_bench.py [--quick] [--output bench.json] [--compare old.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from tools import batch                                          # noqa: E402
+from tools import core                                           # noqa: E402
+from tools import formulas                                       # noqa: E402
+from tools.projection import project_retirement                  # noqa: E402
+from tools.simulation import simulate_retirement                 # noqa: E402
+
+_PLAN = {"current_age": 35, "current_savings": 50000, "monthly_contribution": 1000, "annual_return": 0.06,
+         "retirement_age": 65, "monthly_spending": 4000, "inflation": 0.02, "life_expectancy": 95}
+
+# tool name -> {case name: arguments}
+CASES = {
+    "future_value": {
+        "typical": {"pv": 1000, "r": 0.05, "n": 10},
+        "zero_rate": {"pv": 1000, "r": 0.0, "n": 10},
+        "large_n": {"pv": 1000, "r": 0.05, "n": 1000},
+    },
+    "present_value": {
+        "typical": {"fv": 2000, "r": 0.05, "n": 10},
+        "zero_rate": {"fv": 2000, "r": 0.0, "n": 10},
+        "large_n": {"fv": 2000, "r": 0.05, "n": 1000},
+    },
+    # Rule of 72 is undefined at a zero rate, so it has no zero-rate case
+    "rule_of_72": {
+        "typical": {"r": 0.08},
+        "large_n": {"r": 0.0001},
+    },
+    "fv_annuity": {
+        "typical": {"pmt": 1000, "r": 0.05, "n": 10},
+        "zero_rate": {"pmt": 1000, "r": 0.0, "n": 10},
+        "large_n": {"pmt": 1000, "r": 0.05, "n": 1000},
+    },
+    "pv_annuity": {
+        "typical": {"pmt": 1000, "r": 0.05, "n": 10},
+        "zero_rate": {"pmt": 1000, "r": 0.0, "n": 10},
+        "large_n": {"pmt": 1000, "r": 0.05, "n": 1000},
+    },
+    "nper": {
+        "typical": {"pv": 1000, "fv": 2000, "r": 0.05},
+        "zero_rate": {"pv": 1000, "fv": 5000, "r": 0.0, "pmt": 100},
+        "large_n": {"pv": 1, "fv": 1e12, "r": 0.001},
+    },
+    "retirement_projection": {
+        "typical": _PLAN,
+        "zero_rate": {**_PLAN, "annual_return": 0.0, "inflation": 0.0},
+        "large_n": {**_PLAN, "current_age": 18, "life_expectancy": 120},
+    },
+    "retirement_monte_carlo": {
+        "typical": {**_PLAN, "n_paths": 1000},
+        "zero_rate": {**_PLAN, "annual_return": 0.0, "n_paths": 1000},
+        "large_n": {**_PLAN, "n_paths": 20000},
+    },
+    "scenario_sweep": {
+        "typical": {"formula": "future_value", "fixed": {"pv": 1000},
+                    "ranges": {"r": [0.04, 0.05, 0.06], "n": [10, 20, 30]}},
+        "zero_rate": {"formula": "fv_annuity", "fixed": {"pmt": 1000},
+                      "ranges": {"r": [0.0, 0.03, 0.06], "n": [10, 20, 30]}},
+        "large_n": {"formula": "future_value", "fixed": {"pv": 1000},
+                    "ranges": {"r": [i / 200 for i in range(20)], "n": list(range(1, 21))}},
+    },
+    "explain_calculation": {
+        "typical": {"calculation_type": "future_value", "parameters": {"pv": 1000, "r": 0.05, "n": 10}},
+    },
+}
+
+QUICK_CASES = {"retirement_monte_carlo": {"typical": {**_PLAN, "n_paths": 200}}}
+
+
+def _projection_math(a):
+    return project_retirement(a["current_age"], a["current_savings"], a["monthly_contribution"], a["annual_return"],
+                              a["retirement_age"], a["monthly_spending"], a.get("inflation", 0.0),
+                              a.get("life_expectancy", 95))
+
+
+# The numeric kernel each tool's _run calls, without the string formatting
+MATH = {
+    "future_value": lambda a: core.future_value(a["pv"], a["r"], a["n"]),
+    "present_value": lambda a: core.present_value(a["fv"], a["r"], a["n"]),
+    "rule_of_72": lambda a: core.rule_of_72(a["r"]),
+    "fv_annuity": lambda a: core.fv_annuity(a["pmt"], a["r"], a["n"]),
+    "pv_annuity": lambda a: core.pv_annuity(a["pmt"], a["r"], a["n"]),
+    "nper": lambda a: core.nper(a["pv"], a["fv"], a["r"], a.get("pmt", 0.0)),
+    "retirement_projection": _projection_math,
+    "retirement_monte_carlo": lambda a: simulate_retirement(
+        a["current_age"], a["current_savings"], a["monthly_contribution"], a["annual_return"], a["retirement_age"],
+        a["monthly_spending"], a.get("inflation", 0.0), a.get("life_expectancy", 95), n_paths=a["n_paths"]),
+    "scenario_sweep": lambda a: batch.sweep(a["formula"], a["fixed"], a["ranges"]),
+    "explain_calculation": lambda a: formulas.EXPLANATIONS.get(a["calculation_type"]),
+}
+
+
+def _time_per_call(fn, repeats: int, min_time: float) -> list:
+    """Seconds per call for each repeat, after a warm-up that also sizes the loop."""
+    number, elapsed = 1, 0.0
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return samples
+
+
+def _stats(samples: list) -> dict:
+    us = [s * 1e6 for s in samples]
+    return {
+        "min_us": round(min(us), 3),
+        "median_us": round(statistics.median(us), 3),
+        "mean_us": round(statistics.fmean(us), 3),
+        "stdev_us": round(statistics.stdev(us), 3) if len(us) > 1 else 0.0,
+    }
+
+
+def bench_case(tool_name: str, args: dict, repeats: int, min_time: float) -> dict:
+    tool = getattr(formulas, tool_name)
+    schema = tool.args_schema
+    validated = schema.model_validate(args).model_dump(exclude_unset=True)
+    stages = {
+        "math": lambda: MATH[tool_name](args),
+        "validation": lambda: schema.model_validate(args),
+        "run": lambda: tool._run(**validated),
+        "invoke": lambda: tool.invoke(args),
+    }
+    result = {stage: _stats(_time_per_call(fn, repeats, min_time)) for stage, fn in stages.items()}
+    medians = {stage: result[stage]["median_us"] for stage in stages}
+    result["derived"] = {
+        "formatting_us": round(medians["run"] - medians["math"], 3),
+        "framework_us": round(medians["invoke"] - medians["run"] - medians["validation"], 3),
+    }
+    return result
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_suite(repeats: int = 7, min_time: float = 0.02, quick: bool = False, tools=None) -> dict:
+    """Benchmark every case; ``quick`` shrinks the Monte Carlo cases for smoke runs."""
+    results = {}
+    for tool_name, cases in CASES.items():
+        if tools and tool_name not in tools:
+            continue
+        if quick:
+            cases = QUICK_CASES.get(tool_name, cases)
+        results[tool_name] = {case: bench_case(tool_name, args, repeats, min_time) for case, args in cases.items()}
+    return {
+        "commit": _git_commit(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "numpy": batch.np.__version__},
+        "settings": {"repeats": repeats, "min_time_s": min_time, "quick": quick},
+        "results": results,
+    }
+
+
+def compare(old: dict, new: dict) -> list:
+    """Rows of (tool, case, stage, old median, new median, new/old) for cases in both reports."""
+    rows = []
+    for tool_name, cases in new["results"].items():
+        for case, stages in cases.items():
+            previous = old["results"].get(tool_name, {}).get(case)
+            if previous is None:
+                continue
+            for stage in ("math", "validation", "run", "invoke"):
+                before, after = previous[stage]["median_us"], stages[stage]["median_us"]
+                rows.append((tool_name, case, stage, before, after, after / before if before else float("inf")))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.02, help="Seconds per timed repeat")
+    parser.add_argument("--quick", action="store_true", help="Fewer Monte Carlo paths, for smoke runs")
+    parser.add_argument("--tool", action="append", help="Only benchmark this tool (repeatable)")
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--compare", help="Earlier JSON report to compare medians against")
+    args = parser.parse_args()
+
+    report = run_suite(args.repeats, args.min_time, args.quick, args.tool)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    print(f"{'tool':24} {'case':10} {'math':>10} {'valid.':>10} {'format':>10} {'frmwork':>10} {'invoke':>10}  (median us/call)")
+    for tool_name, cases in report["results"].items():
+        for case, r in cases.items():
+            print(f"{tool_name:24} {case:10} {r['math']['median_us']:10.2f} {r['validation']['median_us']:10.2f} "
+                  f"{r['derived']['formatting_us']:10.2f} {r['derived']['framework_us']:10.2f} "
+                  f"{r['invoke']['median_us']:10.2f}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        print(f"\nvs {old.get('commit', args.compare)} (new/old median)")
+        for tool_name, case, stage, before, after, ratio in compare(old, report):
+            print(f"{tool_name:24} {case:10} {stage:10} {before:10.2f} -> {after:10.2f}  x{ratio:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+load_test.py - Load generator for the chat API
+
+Drives src/chat_endpoint.py in-process (ASGI transport, scripted LLM with
+configurable latency) or a running server over a local socket (--url; start
+it with LLM_BACKEND=fake and LLM_FAKE_LATENCY / LLM_FAKE_TOOL_CALLS), and
+reports throughput, latency percentiles and error rates as JSON.
+
+Run with: python benchmarks/load_test.py --concurrency 20 --conversations 100 --turns 5 --output results.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+import httpx
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# Turns a user sends in order; none is fully specified, so every turn goes through the LLM
+MESSAGES = [
+    "I'm 35 and I have $50,000 saved.",
+    "I save $1,000/month and expect a 6% return.",
+    "I'd like to retire at 62 and spend $4,000 per month.",
+    "How does my plan look?",
+    "What are my odds of running out of money?",
+    "What if I saved a bit more?",
+]
+
+
+@dataclass
+class LoadConfig:
+    endpoint: str = "chat"               # chat, sessions or stream
+    concurrency: int = 10
+    conversations: int = 50
+    turns: int = 3
+    llm_latency: float = 0.05            # seconds per scripted LLM call (in-process only)
+    token_latency: float = 0.0
+    tool_calls: list = field(default_factory=lambda: [
+        {"name": "future_value", "args": {"pv": 50000, "r": 0.06, "n": 27}},
+        {"name": "rule_of_72", "args": {"r": 0.06}},
+    ])
+    url: Optional[str] = None            # e.g. http://127.0.0.1:8000; None runs in-process
+    timeout: float = 60.0
+
+
+def _percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def _latency_summary(seconds: list) -> dict:
+    values = sorted(s * 1000 for s in seconds)
+    return {
+        "p50": round(_percentile(values, 50), 2),
+        "p95": round(_percentile(values, 95), 2),
+        "p99": round(_percentile(values, 99), 2),
+        "mean": round(sum(values) / len(values), 2) if values else 0.0,
+        "max": round(values[-1], 2) if values else 0.0,
+    }
+
+
+class _Results:
+    def __init__(self):
+        self.latencies = []
+        self.first_event = []
+        self.errors = {}
+
+    def error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+async def _turn(client: httpx.AsyncClient, config: LoadConfig, state: dict, message: str, results: _Results) -> None:
+    start = time.perf_counter()
+    first_event = None
+    try:
+        if config.endpoint == "chat":
+            response = await client.post("/chat", json={"message": message, "chat_history": state["history"]})
+            body = response.json() if response.status_code == 200 else None
+            reply = body["message"] if body else None
+        elif config.endpoint == "sessions":
+            response = await client.post("/sessions/chat", json={"message": message, "session_id": state["session_id"]})
+            body = response.json() if response.status_code == 200 else None
+            if body:
+                state["session_id"], reply = body["session_id"], body["message"]
+            else:
+                reply = None
+        else:
+            reply = None
+            payload = {"message": message, "session_id": state["session_id"]}
+            async with client.stream("POST", "/sessions/chat/stream", json=payload) as response:
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if event["type"] == "session":
+                        state["session_id"] = event["session_id"]
+                        continue
+                    if first_event is None:
+                        first_event = time.perf_counter() - start
+                    if event["type"] == "done":
+                        reply = event["message"]
+                    elif event["type"] == "error":
+                        results.error("stream_error")
+                        return
+    except httpx.HTTPError as e:
+        results.error(type(e).__name__)
+        return
+
+    if response.status_code != 200:
+        results.error(f"http_{response.status_code}")
+        return
+    if reply is None:
+        results.error("incomplete")
+        return
+    results.latencies.append(time.perf_counter() - start)
+    if first_event is not None:
+        results.first_event.append(first_event)
+    state["history"] += [{"role": "user", "content": message}, {"role": "assistant", "content": reply}]
+
+
+async def _conversation(client: httpx.AsyncClient, config: LoadConfig, results: _Results, index: int) -> None:
+    state = {"history": [], "session_id": None}
+    for i in range(config.turns):
+        # Tagged with the conversation, so concurrent conversations are not coalesced into one run
+        message = f"{MESSAGES[i % len(MESSAGES)]} (conversation {index})"
+        await _turn(client, config, state, message, results)
+
+
+def _client(config: LoadConfig) -> httpx.AsyncClient:
+    if config.url:
+        return httpx.AsyncClient(base_url=config.url, timeout=config.timeout)
+
+    if SRC not in sys.path:
+        sys.path.insert(0, SRC)
+    from chat_endpoint import app
+    from llm_backends import ScriptedLLM, set_backend
+
+    set_backend(ScriptedLLM(tool_calls=config.tool_calls, latency=config.llm_latency,
+                            token_latency=config.token_latency))
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest",
+                             timeout=config.timeout)
+
+
+async def run(config: LoadConfig) -> dict:
+    """Run ``config.conversations`` conversations, at most ``config.concurrency`` at a time."""
+    if config.endpoint not in ("chat", "sessions", "stream"):
+        raise ValueError(f"Unknown endpoint {config.endpoint!r}; use chat, sessions or stream")
+    results = _Results()
+    limit = asyncio.Semaphore(config.concurrency)
+
+    async def worker(client, index):
+        async with limit:
+            await _conversation(client, config, results, index)
+
+    async with _client(config) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client, i) for i in range(config.conversations)))
+        elapsed = time.perf_counter() - start
+
+    requests = config.conversations * config.turns
+    errors = sum(results.errors.values())
+    report = {
+        "config": asdict(config),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "requests": requests,
+        "succeeded": len(results.latencies),
+        "errors": results.errors,
+        "error_rate": round(errors / requests, 4) if requests else 0.0,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(results.latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": _latency_summary(results.latencies),
+    }
+    # The in-process ASGI transport buffers whole responses, so time-to-first-event needs a socket
+    if config.endpoint == "stream" and config.url:
+        report["first_event_ms"] = _latency_summary(results.first_event)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", choices=["chat", "sessions", "stream"], default="chat")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=3, help="Turns per conversation")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per scripted LLM call")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Seconds between streamed words")
+    parser.add_argument("--url", help="Load a running server instead of the in-process app")
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    config = LoadConfig(endpoint=args.endpoint, concurrency=args.concurrency, conversations=args.conversations,
+                        turns=args.turns, llm_latency=args.llm_latency, token_latency=args.token_latency,
+                        url=args.url)
+    # Keep stdout for the report alone
+    with contextlib.redirect_stdout(sys.stderr):
+        report = asyncio.run(run(config))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+startup_time.py - Worker start-up benchmark
+
+Imports the API modules in fresh interpreters (what a uvicorn worker does on
+spawn) with networking disabled, then times the LLM warm-up separately.
+
+Run with: python benchmarks/startup_time.py [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# Runs in the child: any connection attempt fails the import instead of reaching Gemini
+_CHILD = """
+import json, socket, sys, time
+
+def _blocked(*args, **kwargs):
+    raise RuntimeError("network access during start-up")
+
+socket.socket.connect = _blocked
+socket.create_connection = _blocked
+socket.getaddrinfo = _blocked
+
+start = time.perf_counter()
+module = __import__(sys.argv[1])
+import_s = time.perf_counter() - start
+
+warm_up_s = None
+if sys.argv[2] == "1":
+    import llm_backends
+    start = time.perf_counter()
+    llm_backends.warm_up()
+    warm_up_s = time.perf_counter() - start
+print(json.dumps({"import_s": import_s, "warm_up_s": warm_up_s}))
+"""
+
+
+def measure(module: str, warm_up: bool = False) -> dict:
+    """Import ``module`` once in a new interpreter and return its timings in seconds."""
+    env = {**os.environ, "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "benchmark-key")}
+    result = subprocess.run(
+        [sys.executable, "-c", _CHILD, module, "1" if warm_up else "0"],
+        cwd=SRC, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _summary(samples: list) -> dict:
+    return {
+        "median_ms": round(statistics.median(samples) * 1000, 1),
+        "min_ms": round(min(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    report = {"runs": args.runs}
+    for module in ("gemini", "financial_agent", "chat_endpoint"):
+        samples = [measure(module, warm_up=(module == "chat_endpoint")) for _ in range(args.runs)]
+        report[module] = {"import": _summary([s["import_s"] for s in samples])}
+        if module == "chat_endpoint":
+            report[module]["warm_up"] = _summary([s["warm_up_s"] for s in samples])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
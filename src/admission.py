@@ -0,0 +1,234 @@
+"""Admission control for LLM calls and per-client rate limits.
+
+``ConcurrencyLimiter`` caps how many LLM calls run at once. Calls beyond the
+cap wait in a FIFO queue of bounded length for at most ``queue_timeout``
+seconds; when the queue is full, or the wait runs out, the call fails fast
+with Overloaded instead of piling more load onto the provider. Overloaded
+carries a Retry-After estimate from the queue length and the recent call
+duration. Sync (thread) and async callers share one limiter.
+
+``RateLimiter`` keeps a token bucket per client: ``rate`` requests per second
+with bursts of up to ``burst``.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+import metrics
+
+
+class Overloaded(Exception):
+    """An LLM call was not admitted; retry after ``retry_after`` seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Server is busy ({reason.replace('_', ' ')}); retry in {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """A queued call; ``grant`` hands it a slot released by another call (under the limiter lock)."""
+
+    __slots__ = ("granted", "_event", "_future", "_loop")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.granted = False
+        self._loop = loop
+        self._future = loop.create_future() if loop is not None else None
+        self._event = threading.Event() if loop is None else None
+
+    def grant(self) -> None:
+        self.granted = True
+        if self._loop is None:
+            self._event.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self) -> None:
+        if not self._future.done():
+            self._future.set_result(None)
+
+    def wait(self, timeout: float) -> None:
+        self._event.wait(timeout)
+
+    async def await_(self, timeout: float) -> None:
+        await asyncio.wait_for(asyncio.shield(self._future), timeout)
+
+
+class ConcurrencyLimiter:
+    """At most ``max_concurrent`` holders, at most ``max_queue`` waiting; 0 disables the cap."""
+
+    def __init__(self, max_concurrent: int = 8, max_queue: int = 32, queue_timeout: float = 10.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+        self._holding = threading.local()
+        self._avg_hold = 1.0   # seconds; moving average of how long a call keeps its slot
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def has_capacity(self) -> bool:
+        """True when a new call would get a slot without waiting."""
+        return self.max_concurrent <= 0 or (self.active < self.max_concurrent and not self._waiters)
+
+    def saturated(self) -> bool:
+        """True when a new call would be rejected straight away."""
+        return self.max_concurrent > 0 and self.active >= self.max_concurrent and self.queued >= self.max_queue
+
+    def check(self) -> None:
+        """Raise Overloaded if a new call would be rejected, before any work is done for it."""
+        if self.saturated():
+            raise self._reject("queue_full")
+
+    def retry_after(self) -> int:
+        """Seconds until a new call would likely get a slot."""
+        slots = max(self.max_concurrent, 1)
+        return max(1, min(60, math.ceil(self._avg_hold * (self.queued + 1) / slots)))
+
+    def _reject(self, reason: str) -> Overloaded:
+        metrics.ADMISSION_REJECTIONS.labels(reason=reason).inc()
+        return Overloaded(reason, self.retry_after())
+
+    def _enter(self, loop: Optional[asyncio.AbstractEventLoop]) -> Optional[_Waiter]:
+        """Take a free slot (returns None) or join the queue (returns the waiter)."""
+        with self._lock:
+            if self.max_concurrent <= 0 or (self.active < self.max_concurrent and not self._waiters):
+                self.active += 1
+                metrics.LLM_IN_FLIGHT.set(self.active)
+                return None
+            if len(self._waiters) >= self.max_queue:
+                raise self._reject("queue_full")
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            metrics.LLM_QUEUE_DEPTH.set(len(self._waiters))
+            return waiter
+
+    def _leave_queue(self, waiter: _Waiter) -> bool:
+        """Give up waiting; True if a slot was handed over in the meantime (the caller now holds it)."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            metrics.LLM_QUEUE_DEPTH.set(len(self._waiters))
+            return False
+
+    def release(self, held_for: float) -> None:
+        with self._lock:
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * held_for
+            if self._waiters:
+                # Hand the slot straight to the next caller in line
+                self._waiters.popleft().grant()
+                metrics.LLM_QUEUE_DEPTH.set(len(self._waiters))
+            else:
+                self.active -= 1
+                metrics.LLM_IN_FLIGHT.set(self.active)
+
+    def acquire(self) -> float:
+        """Block until admitted (or raise Overloaded); returns the admission time for ``release``."""
+        start = time.perf_counter()
+        waiter = self._enter(None)
+        if waiter is not None:
+            waiter.wait(self.queue_timeout)
+            if not self._leave_queue(waiter):
+                raise self._reject("queue_timeout")
+        admitted = time.perf_counter()
+        metrics.LLM_QUEUE_WAIT.observe(admitted - start)
+        return admitted
+
+    async def aacquire(self) -> float:
+        """Async version of ``acquire``: waits without blocking the event loop."""
+        start = time.perf_counter()
+        waiter = self._enter(asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await waiter.await_(self.queue_timeout)
+            except asyncio.TimeoutError:
+                if not self._leave_queue(waiter):
+                    raise self._reject("queue_timeout")
+            except asyncio.CancelledError:
+                if self._leave_queue(waiter):
+                    self.release(0.0)
+                raise
+        admitted = time.perf_counter()
+        metrics.LLM_QUEUE_WAIT.observe(admitted - start)
+        return admitted
+
+    def __enter__(self):
+        self._holding.admitted = self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release(time.perf_counter() - self._holding.admitted)
+
+    def slot(self) -> "_AsyncSlot":
+        """``async with limiter.slot():`` holds one slot for the block."""
+        return _AsyncSlot(self)
+
+
+class _AsyncSlot:
+    __slots__ = ("_limiter", "_admitted")
+
+    def __init__(self, limiter: ConcurrencyLimiter):
+        self._limiter = limiter
+
+    async def __aenter__(self):
+        self._admitted = await self._limiter.aacquire()
+
+    async def __aexit__(self, *exc_info):
+        self._limiter.release(time.perf_counter() - self._admitted)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Spend one token; returns 0 if allowed, else the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Token bucket per client id; the least recently seen clients are forgotten past ``max_clients``."""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, client: str) -> None:
+        """Raise Overloaded if ``client`` is over its rate; a rate of 0 disables the limit."""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(client)
+            wait = bucket.take()
+        if wait > 0:
+            metrics.ADMISSION_REJECTIONS.labels(reason="rate_limited").inc()
+            raise Overloaded("rate_limited", max(1, math.ceil(wait)))
@@ -0,0 +1,205 @@
+"""The agent turn as a LangGraph state machine.
+
+One turn is a loop between two nodes: ``llm`` calls the model, and while its
+reply asks for tools and the turn has LLM steps left, ``tools`` runs them and
+hands the results back to ``llm``. The graph is compiled once at import (see
+financial_agent) and each call only supplies a ``Turn``: the per-turn runtime
+context (persona, usage counters, streaming flag), which is not checkpointed.
+
+With a checkpointer, the thread's messages are saved under the conversation
+id after every turn, so the next turn sends only the new user message and
+resumes from the saved state. At the start of a turn, ``split_turn`` drops
+the tool traffic of earlier turns from the thread (their answers already
+hold the results), and the question of any turn that failed part-way, and
+caps it at ``max_messages``.
+"""
+
+import asyncio
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Annotated, Callable, Optional, TypedDict
+
+from langchain_core.messages import BaseMessage, RemoveMessage
+from langchain_core.runnables import Runnable
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import add_messages
+
+from tools.persona import Persona
+
+
+class AgentState(TypedDict):
+    messages: Annotated[list, add_messages]
+    steps: int   # LLM calls made in the current turn
+
+
+@dataclass
+class Turn:
+    """Runtime context of one turn; shared by reference with the nodes, never checkpointed."""
+
+    persona: Optional[Persona] = None
+    usage: dict = field(default_factory=dict)
+    stream: bool = False
+    checkpointed: bool = False   # running on a saved thread, which may hold a failed turn's question
+    # System prompt, persona and history window, built by the first LLM step and reused by the rest
+    prefix: list = field(default_factory=list)
+    reply: Optional[BaseMessage] = None
+
+
+def turn_start(messages: list) -> int:
+    """Index of the last user message, where the current turn starts."""
+    start = len(messages) - 1
+    while start > 0 and messages[start].type != "human":
+        start -= 1
+    return start
+
+
+def split_turn(messages: list, max_messages: int, drop_unanswered: bool = False) -> tuple:
+    """Return ``(history, current, removals)`` for a thread whose last user message starts the turn.
+
+    ``history`` is the earlier turns without their tool calls and results,
+    trimmed to the last ``max_messages``; ``removals`` deletes everything
+    else from the checkpointed thread. With ``drop_unanswered``, user messages
+    that never got an answer (a turn that failed after it was checkpointed)
+    go too.
+    """
+    start = turn_start(messages)
+    earlier = messages[:start]
+    answered, replied = [False] * len(earlier), False
+    for i in range(len(earlier) - 1, -1, -1):
+        message = earlier[i]
+        if message.type == "ai" and not getattr(message, "tool_calls", None):
+            replied = True
+        elif message.type == "human":
+            answered[i], replied = replied, False
+    history, removals = [], []
+    for message, has_answer in zip(earlier, answered):
+        if message.type == "tool" or getattr(message, "tool_calls", None) or \
+                (drop_unanswered and message.type == "human" and not has_answer):
+            removals.append(RemoveMessage(id=message.id))
+        else:
+            history.append(message)
+    if len(history) > max_messages:
+        removals.extend(RemoveMessage(id=message.id) for message in history[:-max_messages])
+        history = history[-max_messages:]
+    return history, messages[start:], removals
+
+
+def route(max_steps: int) -> Callable[[AgentState], str]:
+    """Edge out of ``llm``: run the requested tools while the turn has steps left, else finish."""
+
+    def next_node(state: AgentState) -> str:
+        if getattr(state["messages"][-1], "tool_calls", None) and state["steps"] < max_steps:
+            return "tools"
+        return END
+
+    return next_node
+
+
+class Node(Runnable):
+    """Graph node with a sync and an async body, both called with just the state.
+
+    Lighter than RunnableLambda, which sets up callbacks and inspects the
+    function signature on every call.
+    """
+
+    def __init__(self, name: str, func: Callable, afunc: Callable):
+        self.name = name
+        self.func = func
+        self.afunc = afunc
+
+    def invoke(self, state, config=None, **kwargs):
+        return self.func(state)
+
+    async def ainvoke(self, state, config=None, **kwargs):
+        return await self.afunc(state)
+
+
+def build(llm_node, tools_node, max_steps: int) -> StateGraph:
+    """The uncompiled graph; nodes take the state and read the Turn through ``get_runtime``."""
+    graph = StateGraph(AgentState, context_schema=Turn)
+    graph.add_node("llm", llm_node)
+    graph.add_node("tools", tools_node)
+    graph.add_edge(START, "llm")
+    graph.add_conditional_edges("llm", route(max_steps), ["tools", END])
+    graph.add_edge("tools", "llm")
+    return graph
+
+
+class LatestCheckpointSaver(InMemorySaver):
+    """InMemorySaver that keeps only each thread's latest checkpoint.
+
+    Turns always resume from the latest checkpoint, so the older ones (and
+    the copies of the message list they pin) are dropped as soon as a newer
+    one is saved.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._versions: dict = {}   # thread_id -> {(checkpoint_ns, channel): version of its saved blob}
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        for checkpoint_id in [c for c in checkpoints if c != checkpoint["id"]]:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+        versions = self._versions.setdefault(thread_id, {})
+        for channel, version in new_versions.items():
+            old = versions.get((checkpoint_ns, channel))
+            if old is not None and old != version:
+                self.blobs.pop((thread_id, checkpoint_ns, channel, old), None)
+            versions[(checkpoint_ns, channel)] = version
+        return saved
+
+    def delete_thread(self, thread_id: str) -> None:
+        # Only the thread's own keys, instead of scanning every blob and write
+        for checkpoint_ns, checkpoints in self.storage.pop(thread_id, {}).items():
+            for checkpoint_id in checkpoints:
+                self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+        for (checkpoint_ns, channel), version in self._versions.pop(thread_id, {}).items():
+            self.blobs.pop((thread_id, checkpoint_ns, channel, version), None)
+
+
+def _sqlite_saver(path: str):
+    try:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+    except ImportError as e:
+        raise ImportError("AGENT_CHECKPOINTER=sqlite needs the langgraph-checkpoint-sqlite package") from e
+
+    class ThreadedSqliteSaver(SqliteSaver):
+        """SqliteSaver whose async methods run the sync ones in a worker thread."""
+
+        async def aget_tuple(self, config):
+            return await asyncio.to_thread(self.get_tuple, config)
+
+        async def alist(self, config, *, filter=None, before=None, limit=None):
+            listed = await asyncio.to_thread(
+                lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+            for item in listed:
+                yield item
+
+        async def aput(self, config, checkpoint, metadata, new_versions):
+            return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+        async def aput_writes(self, config, writes, task_id, task_path=""):
+            return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+        async def adelete_thread(self, thread_id):
+            return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    # SqliteSaver serializes access to the connection itself
+    return ThreadedSqliteSaver(sqlite3.connect(path, check_same_thread=False))
+
+
+def create_checkpointer(kind: str = "memory", path: str = "agent_checkpoints.sqlite"):
+    """Checkpointer for conversation threads: ``memory``, ``sqlite`` (at ``path``) or ``none``."""
+    if kind == "none":
+        return None
+    if kind == "memory":
+        return LatestCheckpointSaver()
+    if kind == "sqlite":
+        return _sqlite_saver(path)
+    raise ValueError(f"Unknown checkpointer {kind!r} (expected memory, sqlite or none)")
@@ -1,29 +1,63 @@
 import streamlit as st
 import requests
-import time
 import json
+import uuid
 
 # Backend URL
-BACKEND_URL = "http://127.0.0.1:8000/chat"
+BACKEND_URL = "http://127.0.0.1:8000"
+SESSIONS_URL = f"{BACKEND_URL}/sessions"
+# How long we wait for an answer; sent along so the backend stops working on it after that too
+REQUEST_TIMEOUT = 30
+
+THINKING_GRADIENT = "linear-gradient(90deg, #8e9eab, #667eea)"
+TOOL_GRADIENT = "linear-gradient(135deg, #667eea 0%, #764ba2 100%)"
+
+def stream_from_backend(message, idempotency_key):
+    """Send only the new message; the backend keeps the conversation under our session id.
+
+    Resending with the same idempotency key (e.g. after a dropped connection) replays the
+    stored answer instead of asking the model again.
+    """
+    payload = {
+        "message": message,
+        "session_id": st.session_state.session_id
+    }
+    headers = {"Idempotency-Key": idempotency_key, "X-Request-Timeout": str(REQUEST_TIMEOUT)}
 
-def send_to_backend(message, chat_history):
-    """Send message to backend with progress tracking"""
     try:
-        payload = {
-            "message": message,
-            "chat_history": chat_history
-        }
-        
-        response = requests.post(BACKEND_URL, json=payload, timeout=30)
-        
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("response", result.get("message", str(result)))
-        else:
-            return f"Backend error: {response.status_code} - {response.text}"
-            
+        with requests.post(f"{SESSIONS_URL}/chat/stream", json=payload, headers=headers, stream=True,
+                           timeout=REQUEST_TIMEOUT) as response:
+            if response.status_code == 404 and payload["session_id"]:
+                # Session expired on the server: start a new one (a new request, so a new key)
+                st.session_state.session_id = None
+                yield from stream_from_backend(message, uuid.uuid4().hex)
+                return
+            if response.status_code in (429, 503):
+                retry_after = response.headers.get("Retry-After", "a few")
+                yield {"type": "error", "detail": f"The advisor is busy right now, please try again in {retry_after} seconds."}
+                return
+            if response.status_code != 200:
+                yield {"type": "error", "detail": f"Backend error: {response.status_code} - {response.text}"}
+                return
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["type"] == "session":
+                    st.session_state.session_id = event["session_id"]
+                else:
+                    yield event
     except Exception as e:
-        return f"Error: {str(e)}"
+        yield {"type": "error", "detail": f"Error: {str(e)}"}
+
+def end_session():
+    """Drop the server-side conversation for this browser session"""
+    if st.session_state.session_id:
+        try:
+            requests.delete(f"{SESSIONS_URL}/{st.session_state.session_id}", timeout=5)
+        except Exception:
+            pass
+    st.session_state.session_id = None
 
 def check_tool_usage(message):
     """Check if message might trigger tool usage based on keywords"""
@@ -37,95 +71,22 @@ def check_tool_usage(message):
     message_lower = message.lower()
     return any(keyword in message_lower for keyword in financial_keywords)
 
-def show_thinking_animation():
-    """Show animated thinking process"""
-    thinking_container = st.empty()
-    
-    thinking_messages = [
-        "🤔 Analyzing your question...",
-        "💭 Processing financial data...",
-        "🧠 Thinking through the solution..."
-    ]
-    
-    for i, msg in enumerate(thinking_messages):
-        thinking_container.markdown(f"""
-        <div style='text-align: center; padding: 10px; 
-                    background: linear-gradient(90deg, #f0f2f6, #e8eaf0); 
-                    border-radius: 10px; margin: 5px 0;
-                    animation: pulse 1.5s infinite;'>
-            <span style='color: #1f77b4; font-weight: 500;'>{msg}</span>
-        </div>
-        """, unsafe_allow_html=True)
-        time.sleep(0.8)
-    
-    thinking_container.empty()
-
-def show_tool_usage_animation():
-    """Show animated tool usage with visual effects"""
-    tool_container = st.empty()
-    
-    # Step 1: Tool Detection
-    tool_container.markdown("""
-    <div style='text-align: center; padding: 15px; 
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                border-radius: 15px; margin: 10px 0; color: white;
-                box-shadow: 0 4px 15px rgba(102, 126, 234, 0.3);
-                animation: slideInUp 0.5s ease-out;'>
-        <div style='font-size: 1.2em; font-weight: bold; margin-bottom: 5px;'>
-            🔧 Financial Tools Activated
-        </div>
-        <div style='font-size: 0.9em; opacity: 0.9;'>
-            Initializing calculation engines...
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
-    time.sleep(1)
-    
-    # Step 2: Tool Processing
-    tool_container.markdown("""
-    <div style='text-align: center; padding: 15px; 
-                background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);
-                border-radius: 15px; margin: 10px 0; color: white;
-                box-shadow: 0 4px 15px rgba(240, 147, 251, 0.3);
-                animation: slideInUp 0.5s ease-out;'>
-        <div style='font-size: 1.2em; font-weight: bold; margin-bottom: 5px;'>
-            ⚡ Running Financial Calculations
-        </div>
-        <div style='font-size: 0.9em; opacity: 0.9;'>
-            Processing compound interest, annuities, and growth projections...
-        </div>
-        <div style='margin-top: 10px;'>
-            <div style='width: 100%; background: rgba(255,255,255,0.3); border-radius: 10px; height: 6px;'>
-                <div style='width: 0%; height: 100%; background: rgba(255,255,255,0.8); border-radius: 10px; 
-                           animation: progressBar 2s ease-out forwards;'></div>
-            </div>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
-    time.sleep(1.5)
-    
-    # Step 3: Results Ready
-    tool_container.markdown("""
-    <div style='text-align: center; padding: 15px; 
-                background: linear-gradient(135deg, #4facfe 0%, #00f2fe 100%);
-                border-radius: 15px; margin: 10px 0; color: white;
-                box-shadow: 0 4px 15px rgba(79, 172, 254, 0.3);
-                animation: slideInUp 0.5s ease-out;'>
-        <div style='font-size: 1.2em; font-weight: bold; margin-bottom: 5px;'>
-            ✅ Calculations Complete
-        </div>
-        <div style='font-size: 0.9em; opacity: 0.9;'>
-            Preparing your personalized financial analysis...
-        </div>
+def status_card(text, gradient):
+    """HTML for the live status line shown above the streamed answer"""
+    return f"""
+    <div style='text-align: center; padding: 10px;
+                background: {gradient};
+                border-radius: 10px; margin: 5px 0; color: white;
+                animation: slideInUp 0.3s ease-out;'>
+        <span style='font-weight: 500;'>{text}</span>
     </div>
-    """, unsafe_allow_html=True)
-    time.sleep(0.8)
-    
-    tool_container.empty()
+    """
 
 # Initialize chat
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "session_id" not in st.session_state:
+    st.session_state.session_id = None
 
 # Page config
 st.set_page_config(
@@ -210,33 +171,42 @@ if prompt := st.chat_input("Ask me about investments, savings, or financial calc
     with st.chat_message("user"):
         st.write(prompt)
     
-    # Get AI response with enhanced visual feedback
+    # Stream the AI response: tool activity and tokens are rendered as they arrive
     with st.chat_message("assistant"):
-        # Determine if tools will be used
-        might_use_tools = check_tool_usage(prompt)
-        
-        if might_use_tools:
-            # Show tool usage animation
-            show_tool_usage_animation()
+        status = st.empty()
+        answer_box = st.empty()
+
+        if check_tool_usage(prompt):
+            status.markdown(status_card("🔧 Running financial calculations...", TOOL_GRADIENT), unsafe_allow_html=True)
         else:
-            # Show thinking animation
-            show_thinking_animation()
-        
-        # Get response from backend
-        response = send_to_backend(prompt, st.session_state.messages[:-1])
-        
-        # Display response with success animation
-        if response and not response.startswith("Error") and not response.startswith("Backend error"):
-            st.markdown("""
-            <div style='padding: 10px; border-left: 4px solid #4CAF50; 
-                        background: linear-gradient(90deg, #f8fff8, #f0f8f0);
-                        border-radius: 5px; margin: 10px 0;'>
-            """, unsafe_allow_html=True)
-            st.write(response)
-            st.markdown("</div>", unsafe_allow_html=True)
+            status.markdown(status_card("🤔 Analyzing your question...", THINKING_GRADIENT), unsafe_allow_html=True)
+
+        response = ""
+        error = None
+        for event in stream_from_backend(prompt, uuid.uuid4().hex):
+            if event["type"] == "token":
+                status.empty()
+                response += event["content"]
+                answer_box.markdown(response + "▌")
+            elif event["type"] == "tool_start":
+                # Tool results replace whatever the model said before calling them
+                response = ""
+                answer_box.empty()
+                status.markdown(status_card(f"⚡ Running {event['name']}...", TOOL_GRADIENT), unsafe_allow_html=True)
+            elif event["type"] == "tool_end":
+                status.markdown(status_card(f"✅ {event['name']} complete", TOOL_GRADIENT), unsafe_allow_html=True)
+            elif event["type"] == "done":
+                response = event["message"]
+            elif event["type"] == "error":
+                error = event["detail"]
+
+        status.empty()
+        if error:
+            response = error
+            answer_box.error(response)
         else:
-            st.error(response)
-        
+            answer_box.markdown(response)
+
         # Add AI response to chat history
         st.session_state.messages.append({"role": "assistant", "content": response})
 
@@ -286,6 +256,7 @@ with st.sidebar:
     with col1:
         if st.button("🗑️ Clear Chat", use_container_width=True):
             st.session_state.messages = []
+            end_session()
             st.rerun()
     
     with col2:
@@ -295,7 +266,7 @@ with st.sidebar:
     # Connection Status with enhanced styling
     st.markdown("### 🔌 System Status")
     try:
-        test_response = requests.get("http://127.0.0.1:8000", timeout=5)
+        test_response = requests.get(BACKEND_URL, timeout=5)
         st.success("✅ Backend Online")
         st.markdown("""
         <div style='text-align: center; padding: 8px; 
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+def _message_payload(message) -> dict:
+    # Streamed replies are AIMessageChunks; key them like the AIMessage they stand for
+    message_type = "ai" if message.type == "AIMessageChunk" else message.type
+    payload = {"type": message_type, "content": message.content}
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        payload["tool_calls"] = [{"name": c["name"], "args": c["args"]} for c in tool_calls]
+    return payload
+
+
+def request_key(messages: list, tool_schemas: Optional[list] = None) -> str:
+    """Stable SHA-256 of an LLM request (see LLMResponseCache for what it covers)."""
+    payload = {
+        "tools": tool_schemas or [],
+        "messages": [_message_payload(m) for m in messages],
+    }
+    blob = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe LRU cache with a size bound, optional TTL and hit/miss counters."""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ToolResultCache(LRUCache):
+    """Cache of tool results keyed on the tool name and its normalized arguments.
+
+    Every tool in tools/formulas.py is a pure function of its arguments (the
+    Monte Carlo tool included, since it is seeded), so a result can be reused
+    whenever the same arguments come back. Ints and floats are keyed alike
+    (the tools coerce them anyway). With ``float_digits`` set, floats are also
+    rounded to that many significant digits, so LLM float noise such as
+    0.05 vs 0.050000001 hits the same entry.
+    """
+
+    def __init__(self, maxsize: int = 1024, float_digits: Optional[int] = None):
+        super().__init__(maxsize=maxsize)
+        self.float_digits = float_digits
+
+    def _normalize(self, value: Any) -> Hashable:
+        if isinstance(value, bool) or value is None or isinstance(value, str):
+            return value
+        if isinstance(value, (int, float)):
+            value = float(value)
+            if self.float_digits is not None:
+                value = float(f"{value:.{self.float_digits}g}")
+            return value
+        if isinstance(value, dict):
+            return tuple(sorted((str(k), self._normalize(v)) for k, v in value.items()))
+        if isinstance(value, (list, tuple)):
+            return tuple(self._normalize(v) for v in value)
+        return repr(value)
+
+    def make_key(self, tool_name: str, args: dict) -> tuple:
+        return tool_name, self._normalize(args)
+
+
+class LLMResponseCache(LRUCache):
+    """Exact-match cache of LLM responses keyed on the full request.
+
+    The key is a SHA-256 over the bound tool schemas and every message sent
+    (system prompt, formatted history, user message and, for the second call,
+    the tool calls and results). Tool call ids are left out because they are
+    generated per response; the message order already pairs calls with results.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: Optional[float] = 3600):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+
+    def make_key(self, messages: list, tool_schemas: Optional[list] = None) -> str:
+        return request_key(messages, tool_schemas)
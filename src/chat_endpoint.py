@@ -1,12 +1,100 @@
 # app/api/main.py
-from fastapi import FastAPI, HTTPException
+import asyncio
+import hmac
+import json
+import logging
+import os
+import uuid
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from financial_agent import ai_invoke
+from financial_agent import ai_ainvoke, ai_astream, forget_conversation, llm_limiter
+from admission import Overloaded, RateLimiter
+from deadlines import DeadlineExceeded, DeadlineMiddleware
+from coalescing import COMPUTED, REPLAYED, IdempotencyConflict, RequestCoalescer, fingerprint
+from llm_backends import warm_up
+from metrics import CONTENT_TYPE, REGISTRY, SHARED_REQUESTS, track_request
+from profiling import ProfileStore
+from tracing import RequestContextMiddleware, setup_logging, shutdown_logging
+from sessions import SessionStore
 from langchain_core.messages import AIMessage, HumanMessage
 
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # JSON logs through a background writer thread (LOG_LEVEL, LOG_FORMAT)
+    setup_logging()
+    # Build the LLM backend once per worker before traffic arrives; LLM_WARMUP=0 skips it and
+    # LLM_WARMUP_PING=1 also sends a tiny request to open the connection
+    if os.getenv("LLM_WARMUP", "1") == "1":
+        try:
+            await asyncio.to_thread(warm_up, os.getenv("LLM_WARMUP_PING", "0") == "1")
+        except Exception:
+            logger.warning("LLM warm-up failed, the client will be built on first use", exc_info=True)
+    yield
+    profiles.close()
+    shutdown_logging()
+
+
+app = FastAPI(title="Financial Advisor API", lifespan=lifespan)
+
+# Requests get REQUEST_TIMEOUT seconds (or less via X-Request-Timeout) and are cancelled
+# when the client disconnects; REQUEST_TIMEOUT=0 turns both off
+app.add_middleware(
+    DeadlineMiddleware,
+    default=float(os.getenv("REQUEST_TIMEOUT", "25")),
+    grace=float(os.getenv("REQUEST_TIMEOUT_GRACE", "1")),
+)
+
+# Per-request profiling of a PROFILE_SAMPLE_RATE share of requests, or with PROFILE_HEADER=1 of
+# requests sending "X-Profile: cprofile" (or "stack", or "1" for PROFILE_MODE). Both are off by
+# default: cProfile slows down the whole process while a request is profiled
+profiles = ProfileStore(maxsize=int(os.getenv("PROFILE_KEEP", "50")), directory=os.getenv("PROFILE_DIR"))
+app.add_middleware(
+    RequestContextMiddleware,
+    profiles=profiles,
+    sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+    default_mode=os.getenv("PROFILE_MODE", "cprofile"),
+    allow_header=os.getenv("PROFILE_HEADER", "0") == "1",
+    stack_interval=float(os.getenv("PROFILE_STACK_INTERVAL", "0.005")),
+)
 
-app = FastAPI(title="Financial Advisor API")
+# The /debug endpoints (stored profiles) answer 404 unless DEBUG_ENDPOINTS=1; with DEBUG_TOKEN
+# set they also need it in an X-Debug-Token header
+DEBUG_ENDPOINTS = os.getenv("DEBUG_ENDPOINTS", "0") == "1"
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN")
+
+# Each session's conversation is checkpointed by the agent under the session id; the
+# checkpoint goes when the session does
+sessions = SessionStore(
+    max_sessions=int(os.getenv("SESSION_MAX", "1000")),
+    idle_ttl=float(os.getenv("SESSION_IDLE_TTL", "1800")),
+    on_remove=forget_conversation,
+)
+
+# Identical concurrent chat requests share one agent run (COALESCE_REQUESTS=0 turns this off);
+# results of requests sent with an Idempotency-Key are replayed for IDEMPOTENCY_TTL seconds
+coalescer = RequestCoalescer(
+    enabled=os.getenv("COALESCE_REQUESTS", "1") == "1",
+    ttl=float(os.getenv("IDEMPOTENCY_TTL", "300")),
+    maxsize=int(os.getenv("IDEMPOTENCY_MAX", "1024")),
+)
+
+# Per-client token bucket of RATE_LIMIT_PER_MIN requests a minute with bursts of RATE_LIMIT_BURST
+# (0, the default, turns it off). Clients are told apart by the RATE_LIMIT_HEADER header
+# (e.g. X-API-Key) when it is configured and sent, otherwise by their address
+rate_limiter = RateLimiter(
+    rate=float(os.getenv("RATE_LIMIT_PER_MIN", "0")) / 60,
+    burst=float(os.getenv("RATE_LIMIT_BURST", "10")),
+)
+RATE_LIMIT_HEADER = os.getenv("RATE_LIMIT_HEADER")
 
 
 
@@ -18,15 +106,250 @@ class chat_history(BaseModel):
 class ChatRequest_Response(BaseModel):
     message: str
     chat_history: list[chat_history]
+    usage: Optional[Dict[str, Any]] = None  # token counts for the turn (response only)
 
+class SessionChatRequest(BaseModel):
+    message: str
+    session_id: Optional[str] = None  # omit to start a new session
 
-    
-@app.post("/chat", response_model=ChatRequest_Response)
-async def chat(request: ChatRequest_Response):
+class SessionChatResponse(BaseModel):
+    session_id: str
+    message: str
+    usage: Optional[Dict[str, Any]] = None
+
+
+def _ndjson(event: dict) -> str:
+    return json.dumps(event, default=str) + "\n"
+
+
+def _overloaded(e: Overloaded) -> HTTPException:
+    status = 429 if e.reason == "rate_limited" else 503
+    return HTTPException(status_code=status, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+def _overloaded_event(e: Overloaded) -> dict:
+    return {"type": "error", "detail": str(e), "retry_after": e.retry_after}
+
+
+def _deadline_exceeded(e: DeadlineExceeded) -> HTTPException:
+    logger.warning("chat request timed out", extra={"stage": e.stage})
+    return HTTPException(status_code=504, detail=str(e))
+
+
+def _deadline_event(e: DeadlineExceeded) -> dict:
+    logger.warning("chat stream timed out", extra={"stage": e.stage})
+    return {"type": "error", "detail": str(e)}
+
+
+def _client_id(request: Request) -> str:
+    if RATE_LIMIT_HEADER and request.headers.get(RATE_LIMIT_HEADER):
+        return request.headers[RATE_LIMIT_HEADER]
+    return request.client.host if request.client else "unknown"
+
+
+def admit(request: Request) -> None:
+    """Turn a request away before any work starts: 429 over the client's rate, 503 when the LLM queue is full."""
     try:
-        raw_history = [msg.model_dump() for msg in request.chat_history]
-        response= ai_invoke(request.message, chat_history=request.chat_history)
-        return ChatRequest_Response(message=response, chat_history=request.chat_history)
-    except Exception as e:
-        print(f"Error: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        rate_limiter.check(_client_id(request))
+        llm_limiter.check()
+    except Overloaded as e:
+        raise _overloaded(e)
+
+
+def debug_access(x_debug_token: Optional[str] = Header(None)) -> None:
+    """Hide the /debug endpoints unless they are enabled, and check the token when one is configured."""
+    if not DEBUG_ENDPOINTS:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if DEBUG_TOKEN and not hmac.compare_digest((x_debug_token or "").encode(), DEBUG_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid debug token")
+
+
+def _idempotency_key(endpoint: str, key: Optional[str]) -> Optional[str]:
+    return f"{endpoint}:{key}" if key else None
+
+
+def _record_sharing(endpoint: str, how: str, response: Optional[Response] = None) -> None:
+    if how != COMPUTED:
+        SHARED_REQUESTS.labels(endpoint=endpoint, how=how).inc()
+    if how == REPLAYED and response is not None:
+        response.headers["Idempotent-Replayed"] = "true"
+
+
+async def _shared(endpoint: str, key: str, compute, idempotency_key: Optional[str], response: Response):
+    try:
+        result, how = await coalescer.run(key, compute, _idempotency_key(endpoint, idempotency_key))
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    _record_sharing(endpoint, how, response)
+    return result
+
+
+def _shared_stream(endpoint: str, key: str, source, idempotency_key: Optional[str]) -> StreamingResponse:
+    try:
+        coalescer.check_idempotency_key(key, _idempotency_key(endpoint, idempotency_key))
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    async def events():
+        stream = coalescer.stream(key, source, lambda how: _record_sharing(endpoint, how),
+                                  _idempotency_key(endpoint, idempotency_key),
+                                  succeeded=lambda events: all(e["type"] != "error" for e in events))
+        with track_request(endpoint) as outcome:
+            async for event in stream:
+                if event["type"] == "error":
+                    outcome["status"] = "error"
+                yield _ndjson(event)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+    
+@app.post("/chat", response_model=ChatRequest_Response, dependencies=[Depends(admit)])
+async def chat(request: ChatRequest_Response, response: Response,
+               idempotency_key: Optional[str] = Header(None)):
+    raw_history = [msg.model_dump() for msg in request.chat_history]
+
+    async def compute():
+        usage = {}
+        try:
+            message = await ai_ainvoke(request.message, chat_history=request.chat_history, usage=usage)
+        except Overloaded as e:
+            raise _overloaded(e)
+        except DeadlineExceeded as e:
+            raise _deadline_exceeded(e)
+        except Exception as e:
+            logger.exception("chat request failed")
+            raise HTTPException(status_code=500, detail=str(e))
+        return message, usage
+
+    with track_request("chat"):
+        message, usage = await _shared("chat", fingerprint("chat", request.message, raw_history),
+                                       compute, idempotency_key, response)
+    return ChatRequest_Response(message=message, chat_history=request.chat_history, usage=usage)
+
+
+@app.post("/chat/stream", dependencies=[Depends(admit)])
+async def chat_stream(request: ChatRequest_Response, idempotency_key: Optional[str] = Header(None)):
+    """Stream the agent turn as NDJSON: one JSON event per line (token, tool_start, tool_end, done, error)."""
+    raw_history = [msg.model_dump() for msg in request.chat_history]
+
+    async def events():
+        try:
+            async for event in ai_astream(request.message, chat_history=request.chat_history):
+                yield event
+        except Overloaded as e:
+            yield _overloaded_event(e)
+        except DeadlineExceeded as e:
+            yield _deadline_event(e)
+        except Exception as e:
+            logger.exception("chat stream failed")
+            yield {"type": "error", "detail": str(e)}
+
+    return _shared_stream("chat_stream", fingerprint("chat_stream", request.message, raw_history), events,
+                          idempotency_key)
+
+
+def _session_key(endpoint: str, request: SessionChatRequest, idempotency_key: Optional[str]) -> str:
+    # A first message only shares a run with retries carrying the same Idempotency-Key: two
+    # clients sending the same first message must not end up in one new session
+    owner = request.session_id or idempotency_key or uuid.uuid4().hex
+    return fingerprint(endpoint, owner, request.message)
+
+
+def _get_session(session_id: Optional[str]):
+    if session_id is None:
+        return sessions.create()
+    session = sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return session
+
+
+@app.post("/sessions/chat", response_model=SessionChatResponse, dependencies=[Depends(admit)])
+async def session_chat(request: SessionChatRequest, response: Response,
+                       idempotency_key: Optional[str] = Header(None)):
+    """Delta-only chat: the history lives on the server, the client sends just the new message."""
+
+    # The session is looked up (or created) inside the shared run, so a retried first
+    # message with an Idempotency-Key does not leave an orphaned session behind
+    async def compute():
+        session = _get_session(request.session_id)
+        usage = {}
+        async with session.lock:
+            try:
+                message = await ai_ainvoke(request.message, chat_history=session.messages, usage=usage,
+                                           persona=session.persona, conversation_id=session.id)
+            except Overloaded as e:
+                raise _overloaded(e)
+            except DeadlineExceeded as e:
+                raise _deadline_exceeded(e)
+            except Exception as e:
+                logger.exception("chat request failed")
+                raise HTTPException(status_code=500, detail=str(e))
+            sessions.append(session, {"role": "user", "content": request.message},
+                            {"role": "assistant", "content": message})
+        return session.id, message, usage
+
+    with track_request("sessions_chat"):
+        key = _session_key("sessions_chat", request, idempotency_key)
+        session_id, message, usage = await _shared("sessions_chat", key, compute, idempotency_key, response)
+    return SessionChatResponse(session_id=session_id, message=message, usage=usage)
+
+
+@app.post("/sessions/chat/stream", dependencies=[Depends(admit)])
+async def session_chat_stream(request: SessionChatRequest, idempotency_key: Optional[str] = Header(None)):
+    """Streaming version of /sessions/chat; the first event carries the session id."""
+    if request.session_id is not None and sessions.get(request.session_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+
+    async def events():
+        try:
+            session = _get_session(request.session_id)
+        except HTTPException as e:
+            yield {"type": "error", "detail": e.detail}
+            return
+        yield {"type": "session", "session_id": session.id}
+        async with session.lock:
+            try:
+                async for event in ai_astream(request.message, chat_history=session.messages,
+                                              persona=session.persona, conversation_id=session.id):
+                    if event["type"] == "done":
+                        sessions.append(session, {"role": "user", "content": request.message},
+                                        {"role": "assistant", "content": event["message"]})
+                    yield event
+            except Overloaded as e:
+                yield _overloaded_event(e)
+            except DeadlineExceeded as e:
+                yield _deadline_event(e)
+            except Exception as e:
+                logger.exception("chat stream failed")
+                yield {"type": "error", "detail": str(e)}
+
+    key = _session_key("sessions_chat_stream", request, idempotency_key)
+    return _shared_stream("sessions_chat_stream", key, events, idempotency_key)
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if not sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return {"deleted": session_id}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Request, stage, tool and token metrics in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/debug/profiles", dependencies=[Depends(debug_access)])
+async def list_profiles():
+    """The stored request profiles, newest first (without their reports)."""
+    return {"profiles": profiles.list()}
+
+
+@app.get("/debug/profiles/{request_id}", response_class=PlainTextResponse, dependencies=[Depends(debug_access)])
+async def get_profile(request_id: str):
+    profile = profiles.get(request_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="No profile for this request id")
+    return PlainTextResponse(profile.report)
@@ -0,0 +1,180 @@
+"""Single-flight coalescing of identical requests and idempotency-key replay.
+
+Requests with the same fingerprint (a hash of the endpoint and payload) that
+arrive while one is already being answered attach to it instead of starting
+their own LLM calls. The computation runs in its own task, so it survives
+the client that started it going away for as long as anyone else is
+waiting; when every waiter has gone it is cancelled.
+
+Clients can also send an ``Idempotency-Key``. The completed result is kept
+for ``ttl`` seconds under that key, and a retry with the same key gets the
+stored result back. Reusing a key for a different payload raises
+IdempotencyConflict. Failed requests are not stored, so a retry tries again.
+"""
+
+import asyncio
+import hashlib
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from caching import LRUCache
+
+COMPUTED, COALESCED, REPLAYED = "computed", "coalesced", "replayed"
+
+
+class IdempotencyConflict(Exception):
+    """The idempotency key was already used for a different request."""
+
+
+def fingerprint(*parts: Any) -> str:
+    """Stable SHA-256 of JSON-serializable request parts."""
+    blob = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """One in-flight computation and the number of callers waiting on it."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+    async def wait(self):
+        self.waiters += 1
+        try:
+            return await asyncio.shield(self.task)
+        finally:
+            self.waiters -= 1
+            if self.waiters == 0 and not self.task.done():
+                self.task.cancel()
+
+
+class _Broadcast:
+    """Replays a stream's events to every subscriber, from the first event on."""
+
+    def __init__(self, source: AsyncIterator):
+        self.events: list = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Condition()
+        self.task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator) -> None:
+        try:
+            async for event in source:
+                async with self._changed:
+                    self.events.append(event)
+                    self._changed.notify_all()
+        except BaseException as e:
+            self.error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            async with self._changed:
+                self.done = True
+                self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator:
+        self.subscribers += 1
+        sent = 0
+        try:
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(lambda: sent < len(self.events) or self.done)
+                    pending = self.events[sent:]
+                    finished = self.done
+                for event in pending:
+                    yield event
+                sent += len(pending)
+                if finished and sent == len(self.events):
+                    if self.error is not None:
+                        raise self.error
+                    return
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.task.done():
+                self.task.cancel()
+
+
+class RequestCoalescer:
+    """Shares in-flight work between identical requests and replays results by idempotency key."""
+
+    def __init__(self, enabled: bool = True, ttl: float = 300, maxsize: int = 1024):
+        self.enabled = enabled
+        self.completed = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._flights: dict = {}
+        self._streams: dict = {}
+
+    @staticmethod
+    def _forget(registry: dict, key: str, entry) -> None:
+        if registry.get(key) is entry:
+            del registry[key]
+
+    def _replay(self, idempotency_key: Optional[str], key: str):
+        if idempotency_key is None:
+            return None
+        stored = self.completed.get(idempotency_key)
+        if stored is None:
+            return None
+        stored_key, result = stored
+        if stored_key != key:
+            raise IdempotencyConflict("Idempotency-Key was already used for a different request")
+        return result
+
+    def check_idempotency_key(self, key: str, idempotency_key: Optional[str]) -> None:
+        """Raise IdempotencyConflict now rather than once a response has started."""
+        self._replay(idempotency_key, key)
+
+    async def run(self, key: str, compute: Callable[[], Awaitable], idempotency_key: Optional[str] = None) -> tuple:
+        """Return ``(result, how)``, ``how`` being COMPUTED, COALESCED or REPLAYED."""
+        stored = self._replay(idempotency_key, key)
+        if stored is not None:
+            return stored, REPLAYED
+        if not self.enabled:
+            result, how = await compute(), COMPUTED
+        else:
+            flight = self._flights.get(key)
+            how = COALESCED
+            if flight is None:
+                flight = self._flights[key] = _Flight(asyncio.ensure_future(compute()))
+                flight.task.add_done_callback(lambda _: self._forget(self._flights, key, flight))
+                how = COMPUTED
+            result = await flight.wait()
+        if idempotency_key is not None:
+            self.completed.set(idempotency_key, (key, result))
+        return result, how
+
+    async def stream(self, key: str, source: Callable[[], AsyncIterator], on_start: Callable[[str], None],
+                     idempotency_key: Optional[str] = None,
+                     succeeded: Callable[[list], bool] = lambda events: True) -> AsyncIterator:
+        """Yield the events of ``source()``, shared with identical concurrent streams.
+
+        ``on_start`` is called with COMPUTED, COALESCED or REPLAYED before the first event.
+        A finished stream is stored for its idempotency key only if ``succeeded(events)``.
+        """
+        stored = self._replay(idempotency_key, key)
+        if stored is not None:
+            on_start(REPLAYED)
+            for event in stored:
+                yield event
+            return
+        if not self.enabled:
+            on_start(COMPUTED)
+            events = []
+            async for event in source():
+                events.append(event)
+                yield event
+        else:
+            broadcast = self._streams.get(key)
+            if broadcast is None:
+                broadcast = self._streams[key] = _Broadcast(source())
+                broadcast.task.add_done_callback(lambda _: self._forget(self._streams, key, broadcast))
+                on_start(COMPUTED)
+            else:
+                on_start(COALESCED)
+            async for event in broadcast.subscribe():
+                yield event
+            events = broadcast.events
+        if idempotency_key is not None and succeeded(events):
+            self.completed.set(idempotency_key, (key, list(events)))
@@ -0,0 +1,172 @@
+"""End-to-end request deadlines and cancellation of abandoned requests.
+
+Every HTTP request gets a deadline: the X-Request-Timeout header (seconds)
+or the server default, whichever is shorter. It lives in a ContextVar, so the
+agent's stages read what is left of it without passing it around; each
+stage awaits its LLM call or tools through ``within``, which gives up with
+DeadlineExceeded once the deadline passes. The sync agent can only
+``check`` the deadline between stages.
+
+``DeadlineMiddleware`` also stops the request outright when the client
+disconnects, or when the deadline (plus a short grace period for the stage
+to report it) has passed: the handler task is cancelled, and with it the
+LLM calls and tools it is waiting on.
+"""
+
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Optional, TypeVar
+
+import metrics
+
+T = TypeVar("T")
+
+# Absolute time.monotonic() by which the current request must be answered (None: no deadline)
+current_deadline: ContextVar[Optional[float]] = ContextVar("current_deadline", default=None)
+
+logger = logging.getLogger("deadlines")
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before ``stage`` finished."""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Request deadline exceeded during {stage}")
+        self.stage = stage
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline (never negative), or None without one."""
+    deadline = current_deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def expired() -> bool:
+    return remaining() == 0.0
+
+
+def _exceeded(stage: str) -> DeadlineExceeded:
+    metrics.DEADLINES_EXCEEDED.labels(stage=stage).inc()
+    return DeadlineExceeded(stage)
+
+
+def check(stage: str) -> None:
+    """Raise DeadlineExceeded if no time is left to start ``stage``."""
+    if expired():
+        raise _exceeded(stage)
+
+
+async def within(awaitable: Awaitable[T], stage: str) -> T:
+    """Await ``awaitable`` for at most the time left, cancelling it when the deadline passes."""
+    check(stage)
+    try:
+        return await asyncio.wait_for(awaitable, remaining())
+    except TimeoutError:
+        if expired():
+            raise _exceeded(stage) from None
+        raise
+
+
+async def as_completed(tasks, stage: str):
+    """Yield ``tasks`` as they finish, raising DeadlineExceeded if the deadline passes first."""
+    check(stage)
+    try:
+        async for task in asyncio.as_completed(tasks, timeout=remaining()):
+            yield task
+    except TimeoutError:
+        raise _exceeded(stage) from None
+
+
+class DeadlineMiddleware:
+    """ASGI middleware setting each request's deadline and cancelling abandoned requests.
+
+    ``default`` is the budget in seconds for requests without an
+    X-Request-Timeout header; a header can only shorten it. ``grace`` is how
+    long past the deadline the handler may take to turn a DeadlineExceeded
+    into a response before it is cancelled.
+    """
+
+    def __init__(self, app, default: float = 25.0, grace: float = 1.0,
+                 skip_paths: tuple = ("/metrics", "/debug/")):
+        self.app = app
+        self.default = default
+        self.grace = grace
+        self.skip_paths = skip_paths
+
+    def _budget(self, scope) -> float:
+        for name, value in scope["headers"]:
+            if name.lower() == b"x-request-timeout":
+                try:
+                    requested = float(value)
+                except ValueError:
+                    break
+                if requested > 0:
+                    return min(requested, self.default)
+        return self.default
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.default <= 0 or scope["path"].startswith(self.skip_paths):
+            await self.app(scope, receive, send)
+            return
+
+        budget = self._budget(scope)
+        token = current_deadline.set(time.monotonic() + budget)
+        disconnected = asyncio.Event()
+        listener: Optional[asyncio.Task] = None
+        started = finished = False
+
+        async def listen():
+            # Owns ``receive`` once the body has been read: the next message is the disconnect
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        async def receive_body():
+            nonlocal listener
+            if listener is not None:
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+            elif not message.get("more_body", False):
+                listener = asyncio.ensure_future(listen())
+            return message
+
+        async def send_tracked(message):
+            nonlocal started, finished
+            if message["type"] == "http.response.start":
+                started = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                finished = True
+            await send(message)
+
+        handler = asyncio.ensure_future(self.app(scope, receive_body, send_tracked))
+        stop = asyncio.ensure_future(disconnected.wait())
+        try:
+            await asyncio.wait({handler, stop}, timeout=budget + self.grace, return_when=asyncio.FIRST_COMPLETED)
+            if handler.done() or finished:
+                # Done, or only background work left after a complete response
+                await handler
+                return
+            reason = "disconnect" if disconnected.is_set() else "deadline"
+            handler.cancel()
+            try:
+                await handler
+            except asyncio.CancelledError:
+                pass
+            metrics.REQUESTS_ABANDONED.labels(reason=reason).inc()
+            logger.info("request abandoned", extra={"reason": reason, "path": scope["path"], "budget_s": budget})
+            if reason == "deadline" and not started:
+                await send({"type": "http.response.start", "status": 504,
+                            "headers": [(b"content-type", b"application/json")]})
+                await send({"type": "http.response.body", "body": b'{"detail":"Request deadline exceeded"}'})
+        finally:
+            for task in (handler, stop, listener):
+                if task is not None and not task.done():
+                    task.cancel()
+            current_deadline.reset(token)
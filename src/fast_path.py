@@ -0,0 +1,138 @@
+import re
+from dataclasses import dataclass, field
+from typing import Optional
+
+from tools.formulas import EXPLANATIONS
+
+_DIGITS = r"\d+(?:,\d{3})*(?:\.\d+)?"
+_NUMBER = re.compile(_DIGITS)
+_MONEY = re.compile(
+    r"\$\s*(" + _DIGITS + r")\s*(k|m|million|thousand)?\b"
+    r"|\b(" + _DIGITS + r")\s*(k|million|thousand)?\s*(?:dollars|usd)\b",
+    re.I,
+)
+# The first group is a minus sign; negative rates are left to the LLM
+_RATE = re.compile(r"([-\u2212]\s*|\b(?:minus|negative)\s+)?(\d+(?:\.\d+)?)\s*(?:%|percent\b)", re.I)
+_PERIOD = re.compile(r"(\d+(?:\.\d+)?)[\s-]*(?:years?|yrs?|periods?)\b", re.I)
+_SCALE = {"k": 1e3, "thousand": 1e3, "m": 1e6, "million": 1e6}
+
+# Besides its amounts, rate, period and the frequency phrases below, a question may only use
+# these words. Anything else (simple interest, another compounding frequency, inflation or
+# "real terms", a payment without a yearly frequency, a loss, a comparison, the user's own
+# plan) means the formulas may not fit, and the question is left to the LLM
+_WORDS = frozenset("""
+    a an the of to at for in over after from by with on is are be will do does can you me my i it
+    what what's whats how much many long when if please tell calculate compute find
+    future value present worth today today's now lump sum received receive get have need
+    invest invested investing deposit put away aside set save grow grows become end up
+    accumulate turn into reach take takes go double doubles doubling money fast rule using
+    number years periods interest rate rates return annual annuity paying
+""".split())
+_WORD = re.compile(r"[a-z]+(?:['\u2019][a-z]+)?", re.I)
+# The formulas compound once a year, and the rate is a yearly one
+_ANNUAL_COMPOUNDING = re.compile(r"\bcompound(?:ed|ing)\s+(?:annually|yearly|once a year)\b|\bannual compounding\b", re.I)
+_RATE_PER_YEAR = re.compile(r"\s*(?:(?:per|a)\s+year\b|annually\b|yearly\b)", re.I)
+# A payment frequency attached to an amount marks an annuity ("$500 per year", "annual deposits of $500")
+_YEARLY_AFTER = re.compile(r"\s*(?:/\s*(?:yr|year)\b|(?:per|a|each|every)\s+year\b|annually\b|yearly\b)", re.I)
+_YEARLY_BEFORE = re.compile(
+    r"(?:annual|yearly|year-end|end-of-year)\s+(?:payments?|deposits?|contributions?|withdrawals?|installments?)"
+    r"\s+of\s*$|payments?\s+of\s*$",
+    re.I,
+)
+
+_FV_CUES = re.compile(
+    r"\bfuture value\b|\bgrow\w*\b|\bbe worth\b|\bworth (?:in|after)\b|\bwill (?:i|it|that|this|they) (?:have|be)\b"
+    r"|\bend up\b|\bbecome\b|\baccumulate\b|\bturn into\b|\bhow much will\b",
+    re.I,
+)
+_PV_CUES = re.compile(
+    r"\bpresent value\b|\bworth today\b|\bvalue today\b|\btoday'?s value\b|\blump sum\b"
+    r"|\b(?:invest|deposit|put (?:away|aside)|set aside|need)\s+(?:today|now)\b",
+    re.I,
+)
+_NPER_CUES = re.compile(r"\bhow long\b|\bhow many (?:years|periods)\b|\bnumber of (?:years|periods)\b", re.I)
+_DOUBLE_CUES = re.compile(r"\brule of 72\b|\bdoubl\w*\b", re.I)
+
+
+@dataclass(frozen=True)
+class Intent:
+    """A fully specified calculation: the tool to call and its arguments."""
+    tool: str
+    args: dict = field(default_factory=dict)
+
+
+def _amount(number: str, scale: Optional[str]) -> float:
+    return float(number.replace(",", "")) * _SCALE.get((scale or "").lower(), 1)
+
+
+def parse_intent(message: str) -> Optional[Intent]:
+    """Recognize a fully specified FV/PV/annuity/NPER/Rule-of-72 question.
+
+    Returns None unless the question maps to exactly one tool with every
+    argument stated, no number left unexplained and no word outside the
+    phrasing it recognises; the caller then falls back to the LLM.
+    """
+    text = message.strip()
+    if not text or len(text) > 300 or text.count("?") > 1:
+        return None
+
+    money = [(m.span(), _amount(m.group(1) or m.group(3), m.group(2) or m.group(4))) for m in _MONEY.finditer(text)]
+    rate_matches = list(_RATE.finditer(text))
+    if any(m.group(1) for m in rate_matches):
+        return None
+    rates = [(m.span(), float(m.group(2)) / 100) for m in rate_matches]
+    periods = [(m.span(), float(m.group(1))) for m in _PERIOD.finditer(text)]
+
+    # Every number in the question has to be an amount, a rate or a period
+    spans = [span for span, _ in money + rates + periods]
+    spans += [m.span() for m in re.finditer(r"rule of 72", text, re.I)]
+    for number in _NUMBER.finditer(text):
+        if not any(start <= number.start() and number.end() <= end for start, end in spans):
+            return None
+
+    # ...and every other word has to be one the parser understands
+    yearly_payments = [m.span() for (start, end), _ in money
+                       for m in (_YEARLY_AFTER.match(text, end), _YEARLY_BEFORE.search(text[:start])) if m]
+    spans += yearly_payments
+    spans += [m.span() for (_, end), _ in rates for m in [_RATE_PER_YEAR.match(text, end)] if m]
+    spans += [m.span() for m in _ANNUAL_COMPOUNDING.finditer(text)]
+    rest = "".join(" " if any(start <= i < end for start, end in spans) else c for i, c in enumerate(text))
+    if any(word.lower().replace("\u2019", "'") not in _WORDS for word in _WORD.findall(rest)):
+        return None
+
+    if len(rates) != 1:
+        return None
+    r = round(rates[0][1], 10)
+    if not 0 < r <= 0.5 or any(v <= 0 for _, v in money) or any(not 0 < v <= 100 for _, v in periods):
+        return None
+
+    annuity = "annuity" in text.lower() or bool(yearly_payments)
+    wants_fv, wants_pv = bool(_FV_CUES.search(text)), bool(_PV_CUES.search(text))
+
+    if _DOUBLE_CUES.search(text):
+        if len(money) <= 1 and not periods and not annuity:
+            return Intent("rule_of_72", {"r": r})
+        return None
+
+    if _NPER_CUES.search(text):
+        if len(money) != 2 or periods or annuity:
+            return None
+        # Amounts are taken in the order given; a shrinking balance is not a growth question
+        pv, fv = money[0][1], money[1][1]
+        if fv <= pv:
+            return None
+        return Intent("nper", {"pv": pv, "fv": fv, "r": r})
+
+    if len(money) != 1 or len(periods) != 1 or wants_fv == wants_pv:
+        return None
+    amount, n = money[0][1], periods[0][1]
+    if annuity:
+        return Intent("fv_annuity" if wants_fv else "pv_annuity", {"pmt": amount, "r": r, "n": n})
+    if wants_fv:
+        return Intent("future_value", {"pv": amount, "r": r, "n": n})
+    return Intent("present_value", {"fv": amount, "r": r, "n": n})
+
+
+def render_answer(intent: Intent, tool_output: str) -> str:
+    """Templated reply: the tool result plus the one-line formula it used."""
+    return f"{tool_output}\n\n{EXPLANATIONS[intent.tool]}"
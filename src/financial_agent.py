@@ -1,20 +1,43 @@
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langgraph.config import get_stream_writer
+from langgraph.runtime import get_runtime
 from tools.formulas import (
     future_value,
     present_value,
     rule_of_72,
     fv_annuity, 
     pv_annuity,
+    retirement_projection,
+    retirement_monte_carlo,
     explain_calculation,
     nper,   
+    scenario_sweep,
 )
-from gemini import llm_with_tools
+from llm_backends import get_backend
+from admission import ConcurrencyLimiter, Overloaded
+from resilience import CircuitBreaker, HedgePolicy
+import agent_graph
+import deadlines
+import metrics
+import tracing
+from caching import LLMResponseCache, ToolResultCache
+from fast_path import Intent, parse_intent, render_answer
+from history import HistoryWindow, estimate_tokens
+from tools.persona import Persona, current_persona
 from prompts import Financial_planner
 
 from langchain_core.messages import HumanMessage, AIMessage
-from typing import Any, List, Union
+from typing import Any, List, Optional, Union
 
 def format_chat_history(history: List[Any]) :
     formatted = []
@@ -43,7 +66,7 @@ def build_agent(user_input: str, chat_history):
         MessagesPlaceholder(variable_name="chat_history"),
         ("human", "{input}")
     ])
-    return prompt | llm_with_tools
+    return prompt | get_backend()
 
 """def ai_invoke(message: str, chat_history: list) -> str:
     formatted_history = format_chat_history(chat_history)
@@ -124,89 +147,553 @@ def build_agent(user_input: str, chat_history):
     # If no tool calls, return the original response
     return ai_msg.content if hasattr(ai_msg, 'content') else str(ai_msg)"""
 
-def ai_invoke(message: str, chat_history: list):
-    formatted_history = format_chat_history(chat_history)
-    
-    # Create the prompt template
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", Financial_planner),
-        MessagesPlaceholder(variable_name="chat_history"),
-        ("human", "{input}")
-    ])
-    
-    # Create messages for the first call
-    messages = prompt.format_messages(
-        input=message,
-        chat_history=formatted_history
-    )
-    
-    # First LLM call
-    ai_msg = llm_with_tools.invoke(messages)
-    
-    # Check if AI message has tool calls
-    if hasattr(ai_msg, 'tool_calls') and ai_msg.tool_calls:
-        tool_messages = []
-        
-        # Execute each tool call
-        for tool_call in ai_msg.tool_calls:
-            tool_name = tool_call["name"]
-            tool_args = tool_call["args"]  # Use original args - no mapping needed!
-            tool_id = tool_call["id"]
-            
-            print(f"Tool {tool_name} called with args: {tool_args}")
-            
-            # Get tool function
-            tool_fn = {
-                "future_value": future_value,
-                "present_value": present_value,
-                "rule_of_72": rule_of_72,
-                "fv_annuity": fv_annuity,
-                "pv_annuity": pv_annuity,
-                "explain_calculation": explain_calculation,
-                "nper": nper,
-            }.get(tool_name)
-            
-            if tool_fn:
-                try:
-                    # Use original arguments directly - no mapping!
-                    tool_result = tool_fn.invoke(tool_args)
-                    tool_messages.append(
-                        ToolMessage(
-                            content=str(tool_result), 
-                            tool_call_id=tool_id
-                        )
-                    )
-                    print(f"Tool {tool_name} executed successfully: {tool_result}")
-                    
-                except Exception as e:
-                    error_msg = f"Error executing {tool_name}: {e}. Args: {tool_args}"
-                    print(error_msg)
-                    tool_messages.append(
-                        ToolMessage(
-                            content=error_msg, 
-                            tool_call_id=tool_id
-                        )
-                    )
+logger = logging.getLogger(__name__)
+
+TOOLS = {
+    tool.name: tool
+    for tool in [
+        future_value,
+        present_value,
+        rule_of_72,
+        fv_annuity,
+        pv_annuity,
+        retirement_projection,
+        retirement_monte_carlo,
+        explain_calculation,
+        nper,
+        scenario_sweep,
+    ]
+}
+
+# NumPy-heavy tools get their own pool so a burst of simulations cannot starve
+# the default executor that runs the cheap formula tools (NumPy releases the
+# GIL, so threads are enough to use several cores)
+CPU_BOUND_TOOLS = {"retirement_projection", "retirement_monte_carlo", "scenario_sweep"}
+# Tools that fill missing arguments from the persona, so the persona is part of their cache key
+PERSONA_TOOLS = {"retirement_projection", "retirement_monte_carlo"}
+_TOOL_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="tool")
+_CPU_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="cpu-tool")
+
+# Results of the (pure) tools, keyed on tool name + normalized args.
+# TOOL_CACHE_SIZE=0 disables it; TOOL_CACHE_FLOAT_DIGITS rounds float args for matching.
+tool_cache = ToolResultCache(
+    maxsize=int(os.getenv("TOOL_CACHE_SIZE", "1024")),
+    float_digits=int(os.environ["TOOL_CACHE_FLOAT_DIGITS"]) if os.getenv("TOOL_CACHE_FLOAT_DIGITS") else None,
+)
+
+# Optional exact-match cache of LLM responses (LLM_CACHE_SIZE=0, the default, disables it)
+llm_cache = LLMResponseCache(
+    maxsize=int(os.getenv("LLM_CACHE_SIZE", "0")),
+    ttl=float(os.getenv("LLM_CACHE_TTL", "3600")),
+)
+TOOL_SCHEMAS = [convert_to_openai_tool(tool) for tool in TOOLS.values()]
+
+# At most LLM_MAX_CONCURRENCY LLM calls at once (0 = no limit); up to LLM_QUEUE_MAX more wait
+# LLM_QUEUE_TIMEOUT seconds for a slot, anything beyond that is rejected with admission.Overloaded
+llm_limiter = ConcurrencyLimiter(
+    max_concurrent=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("LLM_QUEUE_MAX", "32")),
+    queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "5")),
+)
+
+# LLM_HEDGE=1: a call slower than the LLM_HEDGE_PERCENTILE of recent calls gets a second,
+# identical request (only while the limiter has a free slot); the first answer wins
+llm_hedge = HedgePolicy(
+    enabled=os.getenv("LLM_HEDGE", "0") == "1",
+    percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95")),
+    min_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.05")),
+)
+
+# Once LLM_BREAKER_FAILURE_RATE of the recent calls fail, LLM calls fail fast for
+# LLM_BREAKER_COOLDOWN seconds and only the fast path answers (LLM_BREAKER=0 turns this off)
+llm_breaker = CircuitBreaker(
+    enabled=os.getenv("LLM_BREAKER", "1") == "1",
+    failure_rate=float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5")),
+    window=int(os.getenv("LLM_BREAKER_WINDOW", "20")),
+    min_calls=int(os.getenv("LLM_BREAKER_MIN_CALLS", "10")),
+    cooldown=float(os.getenv("LLM_BREAKER_COOLDOWN", "30")),
+    ignore=(Overloaded, deadlines.DeadlineExceeded),
+)
+
+# Fully specified formula questions are answered without the LLM (FAST_PATH=0 turns this off)
+FAST_PATH = os.getenv("FAST_PATH", "1") == "1"
+
+# Recent turns are sent verbatim up to HISTORY_TOKEN_BUDGET tokens; older ones
+# are folded into a running summary of at most HISTORY_SUMMARY_TOKENS tokens
+history_window = HistoryWindow(
+    token_budget=int(os.getenv("HISTORY_TOKEN_BUDGET", "2000")),
+    summary_token_budget=int(os.getenv("HISTORY_SUMMARY_TOKENS", "400")),
+)
+
+# A turn makes at most AGENT_MAX_STEPS LLM calls: the first, then one after each round of tool calls
+AGENT_MAX_STEPS = int(os.getenv("AGENT_MAX_STEPS", "4"))
+# Earlier messages kept in a checkpointed conversation thread
+AGENT_MAX_MESSAGES = int(os.getenv("AGENT_MAX_MESSAGES", "200"))
+# Conversation threads are saved in memory (the default), in SQLite at AGENT_CHECKPOINT_DB, or not at all
+checkpointer = agent_graph.create_checkpointer(
+    os.getenv("AGENT_CHECKPOINTER", "memory"),
+    os.getenv("AGENT_CHECKPOINT_DB", "agent_checkpoints.sqlite"),
+)
+
+SYSTEM_PROMPT = SystemMessage(content=Financial_planner)
+# Sent instead of the model's reply when it still wants tools after its last step
+STEP_LIMIT_REPLY = "Sorry, I couldn't finish working that out. Could you ask it in smaller steps?"
+
+def _prepare_turn(message: str, chat_history: list, persona: Optional[Persona], resume: bool) -> tuple:
+    """Bring the persona up to date with ``message``; returns ``(history, persona)``.
+
+    ``history`` is the formatted chat_history, which is only needed to seed a new
+    thread. Without a stored persona (stateless requests) it is rebuilt from the
+    user turns of the history. ``message`` is read as the reply to the last
+    assistant message, so a short answer to its question is understood.
+    """
+    history = format_chat_history(chat_history) if persona is None or not resume else []
+    if persona is None:
+        persona = Persona.from_messages(history)
+    previous = format_chat_history(chat_history[-1:])
+    persona.update(message, previous[0].content if previous and previous[0].type == "ai" else None)
+    return history, persona
+
+def _tool_context(persona: Optional[Persona]) -> contextvars.Context:
+    # Tools run in this copy of the caller's context, with current_persona set for the turn
+    context = contextvars.copy_context()
+    context.run(current_persona.set, persona)
+    return context
+
+def _tool_cache_key(tool_name: str, tool_args: dict, persona: Optional[Persona]):
+    if tool_name in PERSONA_TOOLS and persona is not None:
+        tool_args = {**persona.tool_args(), **{k: v for k, v in tool_args.items() if v is not None}}
+    return tool_cache.make_key(tool_name, tool_args)
+
+def _record_llm_usage(usage: Optional[dict], response) -> None:
+    metadata = getattr(response, "usage_metadata", None)
+    if not metadata:
+        return
+    metrics.LLM_TOKENS.labels(kind="prompt").inc(metadata.get("input_tokens", 0))
+    metrics.LLM_TOKENS.labels(kind="completion").inc(metadata.get("output_tokens", 0))
+    if usage is None:
+        return
+    usage["llm_calls"] = usage.get("llm_calls", 0) + 1
+    usage["input_tokens"] = usage.get("input_tokens", 0) + metadata.get("input_tokens", 0)
+    usage["output_tokens"] = usage.get("output_tokens", 0) + metadata.get("output_tokens", 0)
+
+def _tool_label(tool_name: str) -> str:
+    # Tool names come from the LLM; keep unknown ones from creating new label values
+    return tool_name if tool_name in TOOLS else "unknown"
+
+def _tool_span(tool_name: str) -> tracing.Span:
+    return tracing.Span("tool", histogram=metrics.TOOL_SECONDS.labels(tool=tool_name), tool=tool_name)
+
+def _tool_error(error_msg: str, tool_id: str, tool_name: str) -> ToolMessage:
+    metrics.TOOL_ERRORS.labels(tool=_tool_label(tool_name)).inc()
+    logger.warning("tool failed", extra={"tool": tool_name, "detail": error_msg})
+    return ToolMessage(content=error_msg, tool_call_id=tool_id, status="error")
+
+def _execute_tool_call(tool_call: dict, persona: Optional[Persona] = None) -> ToolMessage:
+    tool_name = tool_call["name"]
+    tool_args = tool_call["args"]  # Use original args - no mapping needed!
+    tool_id = tool_call["id"]
+
+    logger.debug("tool called", extra={"tool": tool_name, "tool_args": tool_args})
+    metrics.TOOL_CALLS.labels(tool=_tool_label(tool_name)).inc()
+
+    tool_fn = TOOLS.get(tool_name)
+    if tool_fn is None:
+        return _tool_error(f"Tool {tool_name} not found in tool mapping", tool_id, tool_name)
+
+    cache_key = _tool_cache_key(tool_name, tool_args, persona)
+    cached = tool_cache.get(cache_key)
+    if cached is not None:
+        logger.debug("tool served from cache", extra={"tool": tool_name})
+        metrics.TOOL_CACHE_HITS.labels(tool=tool_name).inc()
+        return ToolMessage(content=cached, tool_call_id=tool_id)
+
+    try:
+        with _tool_span(tool_name):
+            tool_result = _tool_context(persona).run(tool_fn.invoke, tool_args)
+    except Exception as e:
+        return _tool_error(f"Error executing {tool_name}: {e}. Args: {tool_args}", tool_id, tool_name)
+
+    logger.debug("tool finished", extra={"tool": tool_name, "tool_result": tool_result})
+    tool_cache.set(cache_key, str(tool_result))
+    return ToolMessage(content=str(tool_result), tool_call_id=tool_id)
+
+async def _aexecute_tool_call(tool_call: dict, persona: Optional[Persona] = None) -> ToolMessage:
+    tool_name = tool_call["name"]
+    tool_args = tool_call["args"]
+    tool_id = tool_call["id"]
+
+    logger.debug("tool called", extra={"tool": tool_name, "tool_args": tool_args})
+    metrics.TOOL_CALLS.labels(tool=_tool_label(tool_name)).inc()
+
+    tool_fn = TOOLS.get(tool_name)
+    if tool_fn is None:
+        return _tool_error(f"Tool {tool_name} not found in tool mapping", tool_id, tool_name)
+
+    cache_key = _tool_cache_key(tool_name, tool_args, persona)
+    cached = tool_cache.get(cache_key)
+    if cached is not None:
+        logger.debug("tool served from cache", extra={"tool": tool_name})
+        metrics.TOOL_CACHE_HITS.labels(tool=tool_name).inc()
+        return ToolMessage(content=cached, tool_call_id=tool_id)
+
+    try:
+        context = _tool_context(persona)
+        with _tool_span(tool_name):
+            if tool_name in CPU_BOUND_TOOLS:
+                loop = asyncio.get_running_loop()
+                tool_result = await loop.run_in_executor(_CPU_POOL, context.run, tool_fn.invoke, tool_args)
             else:
-                error_msg = f"Tool {tool_name} not found in tool mapping"
-                print(error_msg)
-                tool_messages.append(
-                    ToolMessage(
-                        content=error_msg, 
-                        tool_call_id=tool_id
-                    )
-                )
-        
-        # Create the message sequence for final response
-        messages_with_tools = formatted_history + [
-            HumanMessage(content=message),
-            ai_msg
-        ] + tool_messages
-        
-        # Get final response from LLM with tool results
-        final_response = llm_with_tools.invoke(messages_with_tools)
-        
-        return final_response.content if hasattr(final_response, 'content') else str(final_response)
-    
-    # If no tool calls, return the original response
-    return ai_msg.content if hasattr(ai_msg, 'content') else str(ai_msg)
\ No newline at end of file
+                tool_result = await asyncio.create_task(tool_fn.ainvoke(tool_args), context=context)
+    except Exception as e:
+        return _tool_error(f"Error executing {tool_name}: {e}. Args: {tool_args}", tool_id, tool_name)
+
+    logger.debug("tool finished", extra={"tool": tool_name, "tool_result": tool_result})
+    tool_cache.set(cache_key, str(tool_result))
+    return ToolMessage(content=str(tool_result), tool_call_id=tool_id)
+
+def _execute_tool_calls(tool_calls: list, persona: Optional[Persona] = None) -> list:
+    """Run one turn's tool calls concurrently; results keep the order of tool_calls."""
+    if len(tool_calls) == 1:
+        return [_execute_tool_call(tool_calls[0], persona)]
+    futures = [
+        _TOOL_POOL.submit(contextvars.copy_context().run, _execute_tool_call, tool_call, persona)
+        for tool_call in tool_calls
+    ]
+    return [future.result() for future in futures]
+
+async def _aexecute_tool_calls(tool_calls: list, persona: Optional[Persona] = None) -> list:
+    """Async version of _execute_tool_calls."""
+    return list(await asyncio.gather(*(_aexecute_tool_call(tool_call, persona) for tool_call in tool_calls)))
+
+def _attempt_llm(messages: list):
+    with llm_limiter:
+        return get_backend().invoke(messages)
+
+async def _aattempt_llm(messages: list):
+    async with llm_limiter.slot():
+        return await get_backend().ainvoke(messages)
+
+def _call_llm(messages: list):
+    with llm_breaker:
+        return llm_hedge.run(lambda: _attempt_llm(messages), llm_limiter.has_capacity)
+
+async def _acall_llm(messages: list):
+    with llm_breaker:
+        return await llm_hedge.arun(lambda: _aattempt_llm(messages), llm_limiter.has_capacity)
+
+def _invoke_llm(messages: list, usage: Optional[dict] = None):
+    if llm_cache.maxsize <= 0:
+        response = _call_llm(messages)
+        _record_llm_usage(usage, response)
+        return response
+    key = llm_cache.make_key(messages, TOOL_SCHEMAS)
+    response = llm_cache.get(key)
+    if response is None:
+        response = _call_llm(messages)
+        _record_llm_usage(usage, response)
+        llm_cache.set(key, response)
+    return response
+
+async def _ainvoke_llm(messages: list, usage: Optional[dict] = None):
+    if llm_cache.maxsize <= 0:
+        response = await _acall_llm(messages)
+        _record_llm_usage(usage, response)
+        return response
+    key = llm_cache.make_key(messages, TOOL_SCHEMAS)
+    response = llm_cache.get(key)
+    if response is None:
+        response = await _acall_llm(messages)
+        _record_llm_usage(usage, response)
+        llm_cache.set(key, response)
+    return response
+
+def _fast_path_intent(message: str) -> Optional[Intent]:
+    # While the LLM circuit is open the fast path is all we can serve, so it is used even if disabled
+    return parse_intent(message) if FAST_PATH or llm_breaker.is_open() else None
+
+def _fast_path_call(intent: Intent) -> dict:
+    return {"name": intent.tool, "args": intent.args, "id": f"fast_path_{intent.tool}"}
+
+def _answered_by_fast_path(intent: Intent, usage: dict) -> None:
+    usage["fast_path"] = intent.tool
+    metrics.FAST_PATH.labels(tool=intent.tool).inc()
+
+def _content(response) -> str:
+    return response.content if hasattr(response, 'content') else str(response)
+
+def _text(content) -> str:
+    # Gemini chunks carry either a string or a list of content parts
+    if isinstance(content, str):
+        return content
+    return "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+
+async def _astream_llm(messages: list, usage: Optional[dict] = None, stage: str = "llm"):
+    """Stream one LLM call, yielding (token_text, None) per chunk and finally (None, full_message).
+
+    Waiting for each chunk is bounded by the request deadline (DeadlineExceeded names ``stage``).
+    """
+    key = llm_cache.make_key(messages, TOOL_SCHEMAS) if llm_cache.maxsize > 0 else None
+    if key is not None:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            text = _text(cached.content)
+            if text:
+                yield text, None
+            yield None, cached
+            return
+
+    full = None
+    # Streams are not hedged: tokens may already have reached the client. The slot is
+    # held until the whole response has streamed in
+    with llm_breaker:
+        async with llm_limiter.slot():
+            chunks = get_backend().astream(messages)
+            try:
+                while True:
+                    try:
+                        chunk = await deadlines.within(anext(chunks), stage)
+                    except StopAsyncIteration:
+                        break
+                    full = chunk if full is None else full + chunk
+                    text = _text(chunk.content)
+                    if text:
+                        yield text, None
+            finally:
+                await chunks.aclose()
+    _record_llm_usage(usage, full)
+    if key is not None and full is not None:
+        llm_cache.set(key, full)
+    yield None, full
+
+def _turn() -> agent_graph.Turn:
+    return get_runtime(agent_graph.Turn).context
+
+def _begin_turn(state: agent_graph.AgentState, turn: agent_graph.Turn) -> list:
+    """Build the turn's prompt prefix from the earlier turns; returns the removals that compact the thread."""
+    with tracing.stage("format_prompt"):
+        history, current, removals = agent_graph.split_turn(state["messages"], AGENT_MAX_MESSAGES,
+                                                            drop_unanswered=turn.checkpointed)
+        window, stats = history_window.build(history)
+        persona_block = turn.persona.to_prompt() if turn.persona is not None else ""
+        turn.prefix = [SYSTEM_PROMPT] + ([SystemMessage(content=persona_block)] if persona_block else []) + window
+        turn.usage.update(stats)
+        turn.usage["prompt_tokens_estimate"] = (
+            estimate_tokens(Financial_planner) + estimate_tokens(persona_block)
+            + stats["window_tokens"] + sum(estimate_tokens(str(m.content)) for m in current)
+        )
+    return removals
+
+def _llm_request(state: agent_graph.AgentState, turn: agent_graph.Turn) -> tuple:
+    # Every call sends the system prompt, persona and history window ahead of the turn so far
+    first = state["steps"] == 0
+    removals = _begin_turn(state, turn) if first else []
+    messages = turn.prefix + state["messages"][agent_graph.turn_start(state["messages"]):]
+    return ("llm_first" if first else "llm_final"), messages, removals
+
+def _llm_reply(state: agent_graph.AgentState, turn: agent_graph.Turn, reply, removals: list) -> dict:
+    turn.reply = reply if reply is not None else AIMessage(content="")
+    return {"messages": removals + [turn.reply], "steps": state["steps"] + 1}
+
+def _llm_node(state: agent_graph.AgentState) -> dict:
+    turn = _turn()
+    stage, messages, removals = _llm_request(state, turn)
+    # The sync agent cannot interrupt a stage, so the deadline is checked between them
+    with tracing.stage(stage):
+        deadlines.check(stage)
+        reply = _invoke_llm(messages, turn.usage)
+    return _llm_reply(state, turn, reply, removals)
+
+async def _allm_node(state: agent_graph.AgentState) -> dict:
+    turn = _turn()
+    stage, messages, removals = _llm_request(state, turn)
+    reply = None
+    # Each stage gets whatever is left of the request deadline
+    with tracing.stage(stage):
+        if not turn.stream:
+            reply = await deadlines.within(_ainvoke_llm(messages, turn.usage), stage)
+        else:
+            write = get_stream_writer()
+            async for token, full in _astream_llm(messages, turn.usage, stage):
+                if token is None:
+                    reply = full
+                else:
+                    write({"type": "token", "content": token})
+    return _llm_reply(state, turn, reply, removals)
+
+def _tools_node(state: agent_graph.AgentState) -> dict:
+    turn = _turn()
+    with tracing.stage("tools"):
+        deadlines.check("tools")
+        return {"messages": _execute_tool_calls(state["messages"][-1].tool_calls, turn.persona)}
+
+async def _atools_node(state: agent_graph.AgentState) -> dict:
+    turn = _turn()
+    tool_calls = state["messages"][-1].tool_calls
+    if not turn.stream:
+        with tracing.stage("tools"):
+            return {"messages": await deadlines.within(_aexecute_tool_calls(tool_calls, turn.persona), "tools")}
+
+    write = get_stream_writer()
+    for tool_call in tool_calls:
+        write({"type": "tool_start", "id": tool_call["id"], "name": tool_call["name"], "args": tool_call["args"]})
+    # Run the tools concurrently and report each one as it finishes
+    tasks = {asyncio.ensure_future(_aexecute_tool_call(tool_call, turn.persona)): tool_call for tool_call in tool_calls}
+    try:
+        with tracing.stage("tools"):
+            async for task in deadlines.as_completed(tasks, "tools"):
+                tool_call = tasks[task]
+                write({"type": "tool_end", "id": tool_call["id"], "name": tool_call["name"], "content": task.result().content})
+    finally:
+        for task in tasks:
+            task.cancel()
+    return {"messages": [task.result() for task in tasks]}
+
+# Compiled once: both nodes work under invoke and ainvoke, and read the Turn from the runtime
+_agent_graph = agent_graph.build(
+    agent_graph.Node("llm", _llm_node, _allm_node),
+    agent_graph.Node("tools", _tools_node, _atools_node),
+    AGENT_MAX_STEPS,
+)
+stateless_agent = _agent_graph.compile()
+checkpointed_agent = _agent_graph.compile(checkpointer=checkpointer) if checkpointer is not None else None
+# Each step is one superstep (llm or tools), plus slack for the last llm step
+_RECURSION_LIMIT = 2 * AGENT_MAX_STEPS + 2
+
+def _config(conversation_id: Optional[str]) -> dict:
+    if conversation_id is None or checkpointed_agent is None:
+        return {"recursion_limit": _RECURSION_LIMIT}
+    return {"recursion_limit": _RECURSION_LIMIT, "configurable": {"thread_id": conversation_id}}
+
+def _agent(config: dict) -> tuple:
+    # A checkpointed thread saves one checkpoint per turn, when the turn is over
+    if "configurable" in config:
+        return checkpointed_agent, {"durability": "exit"}
+    return stateless_agent, {}
+
+def _turn_input(message: str, history: list, resume: bool) -> dict:
+    # A resumed thread already holds the history; a new one is seeded with it
+    return {"messages": ([] if resume else history) + [HumanMessage(content=message)], "steps": 0}
+
+def _save_fast_path(config: dict, turn_input: dict, answer: str) -> None:
+    if "configurable" in config:
+        turn_input["messages"].append(AIMessage(content=answer))
+        checkpointed_agent.update_state(config, turn_input, as_node="llm")
+
+async def _asave_fast_path(config: dict, turn_input: dict, answer: str) -> None:
+    if "configurable" in config:
+        turn_input["messages"].append(AIMessage(content=answer))
+        await checkpointed_agent.aupdate_state(config, turn_input, as_node="llm")
+
+def _out_of_steps(turn: agent_graph.Turn) -> bool:
+    if not getattr(turn.reply, "tool_calls", None):
+        return False
+    logger.warning("agent ran out of steps", extra={"max_steps": AGENT_MAX_STEPS})
+    metrics.AGENT_STEP_LIMIT.inc()
+    return True
+
+def forget_conversation(conversation_id: str) -> None:
+    """Drop a conversation's checkpointed thread (e.g. when its session ends)."""
+    if checkpointer is not None:
+        checkpointer.delete_thread(conversation_id)
+
+def ai_invoke(message: str, chat_history: list, usage: Optional[dict] = None, persona: Optional[Persona] = None,
+              conversation_id: Optional[str] = None):
+    """Run one agent turn.
+
+    Pass a dict as ``usage`` to have the turn's token counts filled in. ``persona`` is the
+    caller's stored persona (e.g. a session's); it is updated in place from ``message``.
+    With a ``conversation_id`` the turn resumes that checkpointed thread and is saved to
+    it; ``chat_history`` then only seeds a thread that does not exist yet.
+    """
+    usage = {} if usage is None else usage
+    config = _config(conversation_id)
+    with tracing.stage("prepare"):
+        resume = "configurable" in config and checkpointer.get_tuple(config) is not None
+        history, persona = _prepare_turn(message, chat_history, persona, resume)
+    turn_input = _turn_input(message, history, resume)
+
+    # Answer fully specified formula questions directly; fall back to the LLM if the tool fails
+    intent = _fast_path_intent(message)
+    if intent is not None:
+        with tracing.stage("fast_path"):
+            tool_message = _execute_tool_call(_fast_path_call(intent), persona)
+        if tool_message.status != "error":
+            _answered_by_fast_path(intent, usage)
+            answer = render_answer(intent, tool_message.content)
+            _save_fast_path(config, turn_input, answer)
+            return answer
+
+    turn = agent_graph.Turn(persona=persona, usage=usage, checkpointed="configurable" in config)
+    agent, options = _agent(config)
+    agent.invoke(turn_input, config, context=turn, **options)
+    return STEP_LIMIT_REPLY if _out_of_steps(turn) else _content(turn.reply)
+
+async def ai_ainvoke(message: str, chat_history: list, usage: Optional[dict] = None,
+                     persona: Optional[Persona] = None, conversation_id: Optional[str] = None):
+    """Async version of ai_invoke: awaits the LLM and the tools so the event loop stays free."""
+    usage = {} if usage is None else usage
+    config = _config(conversation_id)
+    with tracing.stage("prepare"):
+        resume = "configurable" in config and await checkpointer.aget_tuple(config) is not None
+        history, persona = _prepare_turn(message, chat_history, persona, resume)
+    turn_input = _turn_input(message, history, resume)
+
+    intent = _fast_path_intent(message)
+    if intent is not None:
+        with tracing.stage("fast_path"):
+            tool_message = await _aexecute_tool_call(_fast_path_call(intent), persona)
+        if tool_message.status != "error":
+            _answered_by_fast_path(intent, usage)
+            answer = render_answer(intent, tool_message.content)
+            await _asave_fast_path(config, turn_input, answer)
+            return answer
+
+    turn = agent_graph.Turn(persona=persona, usage=usage, checkpointed="configurable" in config)
+    agent, options = _agent(config)
+    await agent.ainvoke(turn_input, config, context=turn, **options)
+    return STEP_LIMIT_REPLY if _out_of_steps(turn) else _content(turn.reply)
+
+async def ai_astream(message: str, chat_history: list, usage: Optional[dict] = None,
+                     persona: Optional[Persona] = None, conversation_id: Optional[str] = None):
+    """Streaming version of ai_ainvoke.
+
+    Yields event dicts as they happen:
+        {"type": "token", "content": ...}
+        {"type": "tool_start", "id": ..., "name": ..., "args": ...}
+        {"type": "tool_end", "id": ..., "name": ..., "content": ...}
+        {"type": "done", "message": <full assistant reply>, "usage": <token counts>}
+    """
+    usage = {} if usage is None else usage
+    config = _config(conversation_id)
+    with tracing.stage("prepare"):
+        resume = "configurable" in config and await checkpointer.aget_tuple(config) is not None
+        history, persona = _prepare_turn(message, chat_history, persona, resume)
+    turn_input = _turn_input(message, history, resume)
+
+    intent = _fast_path_intent(message)
+    if intent is not None:
+        tool_call = _fast_path_call(intent)
+        with tracing.stage("fast_path"):
+            tool_message = await _aexecute_tool_call(tool_call, persona)
+        if tool_message.status != "error":
+            _answered_by_fast_path(intent, usage)
+            answer = render_answer(intent, tool_message.content)
+            await _asave_fast_path(config, turn_input, answer)
+            yield {"type": "tool_start", "id": tool_call["id"], "name": intent.tool, "args": intent.args}
+            yield {"type": "tool_end", "id": tool_call["id"], "name": intent.tool, "content": tool_message.content}
+            yield {"type": "token", "content": answer}
+            yield {"type": "done", "message": answer, "usage": usage}
+            return
+
+    # The nodes emit the token and tool events through the graph's custom stream
+    turn = agent_graph.Turn(persona=persona, usage=usage, stream=True, checkpointed="configurable" in config)
+    agent, options = _agent(config)
+    async for event in agent.astream(turn_input, config, context=turn, stream_mode="custom", **options):
+        yield event
+
+    if _out_of_steps(turn):
+        yield {"type": "token", "content": STEP_LIMIT_REPLY}
+        yield {"type": "done", "message": STEP_LIMIT_REPLY, "usage": usage}
+        return
+    yield {"type": "done", "message": _text(turn.reply.content), "usage": usage}
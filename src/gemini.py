@@ -1,32 +1,51 @@
 
 import os
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
-from tools.formulas import (
-    future_value,
-    present_value,
-    rule_of_72,
-    fv_annuity, 
-    pv_annuity,
-    explain_calculation,
-    nper,   
-)
+import threading
+
 from dotenv import load_dotenv
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+# Every retry is another call against the provider quota; admission control already sheds excess load
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "1"))
+# Per-call timeout in seconds; async callers are also bounded by the request deadline
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "20"))
+
+_llm_with_tools = None
+_lock = threading.Lock()
+
+
+def build_llm():
+    """Construct the Gemini chat client. No request is sent until the client is used."""
+    # Imported here: langchain_google_genai alone takes over a second to import
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(
+        model=GEMINI_MODEL,
+        temperature=0,
+        max_tokens=None,
+        timeout=GEMINI_TIMEOUT,
+        max_retries=GEMINI_MAX_RETRIES,
+        api_key=GEMINI_API_KEY
+    )
+
+
+def get_llm_with_tools():
+    """Return the shared tool-bound client, building it on first use."""
+    global _llm_with_tools
+    if _llm_with_tools is None:
+        # The agent's tool table is the one list of tools the model is offered
+        from financial_agent import TOOLS
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    temperature=0,
-    max_tokens=None,
-    timeout=None,
-    max_retries=3,
-    api_key=GEMINI_API_KEY
-    
-)
+        with _lock:
+            if _llm_with_tools is None:
+                _llm_with_tools = build_llm().bind_tools(list(TOOLS.values()), tool_choice="auto")
+    return _llm_with_tools
 
-llm_with_tools = llm.bind_tools([future_value, present_value, rule_of_72, fv_annuity, pv_annuity, explain_calculation, nper],
-                                tool_choice="auto",)
 
-print(llm_with_tools.invoke("What is the future value of $1000 invested at 5% for 10 years?"))
\ No newline at end of file
+def __getattr__(name):
+    # Keeps `from gemini import llm_with_tools` working without building the client at import
+    if name == "llm_with_tools":
+        return get_llm_with_tools()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
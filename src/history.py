@@ -0,0 +1,116 @@
+import hashlib
+import re
+from typing import Callable, Optional
+
+from langchain_core.messages import SystemMessage
+
+from caching import LRUCache
+
+SUMMARY_HEADER = "Summary of the earlier conversation (older turns, condensed):"
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text), no tokenizer call."""
+    return (len(text) + 3) // 4
+
+
+def _condense(text: str, limit: int = 200) -> str:
+    # Keep the sentences that carry numbers (ages, amounts, rates); they are what later turns need
+    sentences = [s.strip() for s in _SENTENCE_END.split(text) if s.strip()]
+    facts = [s for s in sentences if any(ch.isdigit() for ch in s)] or sentences[:1]
+    condensed = " ".join(facts)
+    return condensed if len(condensed) <= limit else condensed[:limit - 1] + "…"
+
+
+def extractive_summarizer(summary: str, messages: list, token_budget: int) -> str:
+    """Fold ``messages`` into ``summary`` without an LLM call.
+
+    Each message is condensed to its number-bearing sentences; once the
+    summary exceeds ``token_budget`` the oldest lines are dropped.
+    """
+    lines = summary.splitlines() if summary else []
+    for message in messages:
+        text = _condense(str(message.content))
+        if text:
+            speaker = "User" if message.type == "human" else "Assistant"
+            lines.append(f"{speaker}: {text}")
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > token_budget:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class HistoryWindow:
+    """Keeps the most recent messages verbatim within a token budget and folds
+    everything older into a running summary.
+
+    Summaries are cached under a rolling hash of the folded prefix, so each
+    turn only summarizes the messages that newly fell out of the window and
+    the cache works for both server-side sessions and clients that resend
+    their full history.
+    """
+
+    def __init__(
+        self,
+        token_budget: Optional[int] = 2000,
+        summary_token_budget: int = 400,
+        summarizer: Optional[Callable[[str, list, int], str]] = None,
+        cache_size: int = 1024,
+    ):
+        self.token_budget = token_budget
+        self.summary_token_budget = summary_token_budget
+        self.summarizer = summarizer or extractive_summarizer
+        self._summaries = LRUCache(maxsize=cache_size)
+
+    def build(self, history: list) -> tuple:
+        """Return ``(messages, stats)`` for a list of LangChain Human/AI messages."""
+        tokens = [estimate_tokens(str(m.content)) for m in history]
+        stats = {
+            "history_messages": len(history),
+            "history_tokens": sum(tokens),
+        }
+
+        cut = 0
+        if self.token_budget is not None:
+            used = 0
+            cut = len(history)
+            while cut > 0 and used + tokens[cut - 1] <= self.token_budget:
+                cut -= 1
+                used += tokens[cut]
+            # Start the window on a user turn so roles keep alternating
+            while cut < len(history) and history[cut].type != "human":
+                cut += 1
+
+        summary = self._summarize(history[:cut]) if cut else ""
+        window = history[cut:]
+        if summary:
+            window = [SystemMessage(content=f"{SUMMARY_HEADER}\n{summary}")] + window
+
+        stats.update({
+            "window_messages": len(history) - cut,
+            "summarized_messages": cut,
+            "summary_tokens": estimate_tokens(summary),
+            "window_tokens": sum(tokens[cut:]) + estimate_tokens(summary),
+        })
+        return window, stats
+
+    def _summarize(self, folded: list) -> str:
+        prefix_keys = []
+        digest = b""
+        for message in folded:
+            digest = hashlib.sha256(digest + message.type.encode() + b"\0" + str(message.content).encode()).digest()
+            prefix_keys.append(digest)
+
+        # Resume from the longest prefix summarized on an earlier turn
+        summary, start = "", 0
+        for i in range(len(folded), 0, -1):
+            cached = self._summaries.get(prefix_keys[i - 1])
+            if cached is not None:
+                summary, start = cached, i
+                break
+
+        if start < len(folded):
+            summary = self.summarizer(summary, folded[start:], self.summary_token_budget)
+            self._summaries.set(prefix_keys[-1], summary)
+        return summary
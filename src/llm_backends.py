@@ -0,0 +1,296 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from typing import AsyncIterator, Callable, Optional, Protocol, runtime_checkable
+
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    HumanMessage,
+    message_to_dict,
+    messages_from_dict,
+)
+
+from caching import request_key
+
+
+@runtime_checkable
+class LLMBackend(Protocol):
+    """What the agent needs from a chat model with the tools already bound.
+
+    The tool-bound Gemini runnable satisfies it as is; so do the offline
+    backends below.
+    """
+
+    def invoke(self, messages: list) -> BaseMessage: ...
+
+    async def ainvoke(self, messages: list) -> BaseMessage: ...
+
+    def astream(self, messages: list) -> AsyncIterator[BaseMessage]: ...
+
+
+def _estimate_tokens(messages: list) -> int:
+    return sum(len(str(m.content)) for m in messages) // 4 + 1
+
+
+class ScriptedLLM:
+    """Deterministic offline model with configurable latency.
+
+    For a new user message it emits ``tool_calls`` (or, without any, the
+    answer straight away); once tool results come back it answers with
+    ``answer``, where ``{tool_results}`` is replaced by the tool outputs. The
+    reply depends only on the messages, so concurrent requests can't disturb
+    each other. Pass ``responder`` to script anything else.
+    """
+
+    def __init__(
+        self,
+        tool_calls: Optional[list] = None,
+        answer: str = "Here is what I found:\n{tool_results}",
+        latency: float = 0.0,
+        token_latency: float = 0.0,
+        responder: Optional[Callable[[list], AIMessage]] = None,
+    ):
+        self.tool_calls = tool_calls or []
+        self.answer = answer
+        self.latency = latency
+        self.token_latency = token_latency
+        self.responder = responder
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def respond(self, messages: list) -> AIMessage:
+        with self._lock:
+            self.calls += 1
+        if self.responder is not None:
+            response = self.responder(messages)
+        elif messages[-1].type != "tool" and self.tool_calls:
+            response = AIMessage(content="", tool_calls=[
+                {"name": call["name"], "args": call["args"], "id": call.get("id", f"call_{i}")}
+                for i, call in enumerate(self.tool_calls)
+            ])
+        else:
+            results = [str(m.content) for m in messages if m.type == "tool"]
+            response = AIMessage(content=self.answer.format(tool_results="\n".join(results)))
+        if response.usage_metadata is None:
+            input_tokens = _estimate_tokens(messages)
+            output_tokens = _estimate_tokens([response])
+            response.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                                       "total_tokens": input_tokens + output_tokens}
+        return response
+
+    def invoke(self, messages: list) -> AIMessage:
+        time.sleep(self.latency)
+        return self.respond(messages)
+
+    async def ainvoke(self, messages: list) -> AIMessage:
+        await asyncio.sleep(self.latency)
+        return self.respond(messages)
+
+    async def astream(self, messages: list) -> AsyncIterator[AIMessageChunk]:
+        await asyncio.sleep(self.latency)
+        response = self.respond(messages)
+        words = str(response.content).split(" ")
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            yield AIMessageChunk(content=word if i == 0 else " " + word)
+        yield AIMessageChunk(
+            content="",
+            tool_call_chunks=[
+                {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                for i, c in enumerate(response.tool_calls)
+            ],
+            usage_metadata=response.usage_metadata,
+        )
+
+
+class FlakyLLM:
+    """Wraps ``backend`` with injected latency and failures, to exercise hedging and the circuit breaker.
+
+    Before each call it sleeps ``delay()`` seconds, then raises ConnectionError if ``fail()`` is true.
+    """
+
+    def __init__(self, backend: LLMBackend, delay: Callable[[], float] = lambda: 0.0,
+                 fail: Callable[[], bool] = lambda: False):
+        self.backend = backend
+        self.delay = delay
+        self.fail = fail
+
+    @classmethod
+    def with_rates(cls, backend: LLMBackend, slow_rate: float = 0.0, slow_latency: float = 0.0,
+                   error_rate: float = 0.0, seed: Optional[int] = None) -> "FlakyLLM":
+        """A ``slow_rate`` share of calls take ``slow_latency`` extra seconds, an ``error_rate`` share fail."""
+        rng = random.Random(seed)
+        return cls(backend, delay=lambda: slow_latency if rng.random() < slow_rate else 0.0,
+                   fail=lambda: rng.random() < error_rate)
+
+    def _check(self) -> None:
+        if self.fail():
+            raise ConnectionError("Injected LLM failure")
+
+    def invoke(self, messages: list) -> BaseMessage:
+        time.sleep(self.delay())
+        self._check()
+        return self.backend.invoke(messages)
+
+    async def ainvoke(self, messages: list) -> BaseMessage:
+        await asyncio.sleep(self.delay())
+        self._check()
+        return await self.backend.ainvoke(messages)
+
+    async def astream(self, messages: list) -> AsyncIterator[BaseMessage]:
+        await asyncio.sleep(self.delay())
+        self._check()
+        async for chunk in self.backend.astream(messages):
+            yield chunk
+
+
+class RecordingLLM:
+    """Passes calls through to ``backend`` and appends each exchange to a JSONL file.
+
+    Every line holds the request key, the call kind and the response exactly as
+    returned (every chunk, for streamed calls), so ReplayLLM can serve it back.
+    """
+
+    def __init__(self, backend: LLMBackend, path: str):
+        self.backend = backend
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _record(self, messages: list, kind: str, responses: list) -> None:
+        line = json.dumps({
+            "key": request_key(messages),
+            "kind": kind,
+            "responses": [message_to_dict(r) for r in responses],
+        }, sort_keys=True)
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def invoke(self, messages: list) -> BaseMessage:
+        response = self.backend.invoke(messages)
+        self._record(messages, "invoke", [response])
+        return response
+
+    async def ainvoke(self, messages: list) -> BaseMessage:
+        response = await self.backend.ainvoke(messages)
+        self._record(messages, "invoke", [response])
+        return response
+
+    async def astream(self, messages: list) -> AsyncIterator[BaseMessage]:
+        chunks = []
+        async for chunk in self.backend.astream(messages):
+            chunks.append(chunk)
+            yield chunk
+        self._record(messages, "stream", chunks)
+
+
+class ReplayLLM:
+    """Serves responses recorded by RecordingLLM without any network access.
+
+    Requests are matched on their key; when the same request was recorded more
+    than once, the recordings are served in order and the last one repeats.
+    Unknown requests raise LookupError.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._recordings: dict = defaultdict(deque)
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._recordings[entry["key"]].append(entry)
+        self._lock = threading.Lock()
+
+    def _lookup(self, messages: list) -> dict:
+        key = request_key(messages)
+        with self._lock:
+            entries = self._recordings.get(key)
+            if not entries:
+                raise LookupError(f"No recorded response for request {key[:12]} in {self.path}")
+            return entries.popleft() if len(entries) > 1 else entries[0]
+
+    def _chunks(self, messages: list) -> list:
+        return messages_from_dict(self._lookup(messages)["responses"])
+
+    def invoke(self, messages: list) -> BaseMessage:
+        chunks = self._chunks(messages)
+        if len(chunks) == 1:
+            return chunks[0]
+        merged = chunks[0]
+        for chunk in chunks[1:]:
+            merged = merged + chunk
+        return merged
+
+    async def ainvoke(self, messages: list) -> BaseMessage:
+        return self.invoke(messages)
+
+    async def astream(self, messages: list) -> AsyncIterator[BaseMessage]:
+        for chunk in self._chunks(messages):
+            yield chunk
+
+
+def create_backend(name: Optional[str] = None) -> LLMBackend:
+    """Build the backend named by ``name`` or the LLM_BACKEND env var.
+
+    gemini (default): the live model. fake: ScriptedLLM with LLM_FAKE_LATENCY
+    seconds per call, asking for the LLM_FAKE_TOOL_CALLS JSON list of
+    {"name", "args"} calls; LLM_FAKE_SLOW_RATE of its calls take LLM_FAKE_SLOW_LATENCY
+    seconds longer and LLM_FAKE_ERROR_RATE of them fail (see FlakyLLM).
+    record / replay: write to / read from LLM_RECORDING.
+    """
+    name = name or os.getenv("LLM_BACKEND", "gemini")
+    recording = os.getenv("LLM_RECORDING", "recordings/llm.jsonl")
+    if name == "gemini":
+        from gemini import get_llm_with_tools
+        return get_llm_with_tools()
+    if name == "fake":
+        backend = ScriptedLLM(tool_calls=json.loads(os.getenv("LLM_FAKE_TOOL_CALLS", "[]")),
+                              latency=float(os.getenv("LLM_FAKE_LATENCY", "0")),
+                              token_latency=float(os.getenv("LLM_FAKE_TOKEN_LATENCY", "0")))
+        slow_rate, error_rate = float(os.getenv("LLM_FAKE_SLOW_RATE", "0")), float(os.getenv("LLM_FAKE_ERROR_RATE", "0"))
+        if slow_rate or error_rate:
+            return FlakyLLM.with_rates(backend, slow_rate, float(os.getenv("LLM_FAKE_SLOW_LATENCY", "0")), error_rate)
+        return backend
+    if name == "record":
+        from gemini import get_llm_with_tools
+        return RecordingLLM(get_llm_with_tools(), recording)
+    if name == "replay":
+        return ReplayLLM(recording)
+    raise ValueError(f"Unknown LLM_BACKEND {name!r}; use gemini, fake, record or replay")
+
+
+_backend: Optional[LLMBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> LLMBackend:
+    """Return the backend the agent talks to, creating it from LLM_BACKEND on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+    return _backend
+
+
+def set_backend(backend: Optional[LLMBackend]) -> None:
+    """Swap the agent's backend (None goes back to LLM_BACKEND on next use)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def warm_up(ping: bool = False) -> None:
+    """Create the backend ahead of the first request; ``ping`` only applies to the live model."""
+    backend = get_backend()
+    if ping and not isinstance(backend, (ScriptedLLM, FlakyLLM, ReplayLLM)):
+        backend.invoke([HumanMessage(content="ping")])
@@ -0,0 +1,279 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+A deliberately small subset of prometheus_client: counters, gauges and
+histograms with labels, kept in a registry that renders them for /metrics.
+Recording a value is a dict lookup and a short lock, so instrumenting the
+request path costs a few microseconds per observation.
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional, Sequence
+
+# Stage and request latencies: LLM calls take from a fraction of a second to tens of seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Tool executions: formulas take microseconds, simulations up to seconds
+TOOL_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        """The child for one combination of label values (created on first use)."""
+        key = tuple([str(labels[name]) for name in self.labelnames])
+        try:
+            return self._children[key]
+        except KeyError:
+            with self._lock:
+                return self._children.setdefault(key, self._new_child())
+
+    def _default(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} has labels {list(self.labelnames)}; use .labels()")
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for key, child in children:
+            lines += child.samples(self.name, _label_text(self.labelnames, key), self.labelnames, key)
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self.value = value
+
+    def samples(self, name: str, labels: str, labelnames, key) -> list:
+        return [f"{name}{labels} {_number(self.value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only go up")
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._default().dec(amount)
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+    @contextmanager
+    def track(self, **labels) -> Iterator[None]:
+        """Count the block as in progress while it runs."""
+        child = self.labels(**labels)
+        child.inc()
+        try:
+            yield
+        finally:
+            child.dec()
+
+
+class _Buckets:
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # the last slot is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self, name: str, labels: str, labelnames, key) -> list:
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.bounds + (math.inf,), counts):
+            cumulative += count
+            le = _label_text(labelnames, key, f'le="{_number(bound)}"')
+            lines.append(f"{name}_bucket{le} {cumulative}")
+        lines.append(f"{name}_sum{labels} {_number(total)}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        self.labels(**labels).observe(value)
+
+    def time(self, **labels) -> "_Timer":
+        """Context manager observing how long the block takes, in seconds (also when it raises)."""
+        return _Timer(self.labels(**labels))
+
+
+class _Timer:
+    # A plain class rather than @contextmanager: this wraps every stage of every request
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child: _Buckets):
+        self._child = child
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self._child.observe(time.perf_counter() - self._start)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text format (version 0.0.4)."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "chat_request_seconds", "End-to-end chat request latency by endpoint", ["endpoint"]))
+REQUESTS = REGISTRY.register(Counter(
+    "chat_requests_total", "Chat requests by endpoint and outcome (ok or error)", ["endpoint", "status"]))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "chat_requests_in_flight", "Chat requests currently being served, by endpoint", ["endpoint"]))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "chat_stage_seconds",
+    "Time spent per pipeline stage (prepare, format_prompt, llm_first, tools, llm_final, fast_path)", ["stage"]))
+TOOL_SECONDS = REGISTRY.register(Histogram(
+    "tool_execution_seconds", "Tool execution time by tool (cache hits excluded)", ["tool"], buckets=TOOL_BUCKETS))
+TOOL_CALLS = REGISTRY.register(Counter("tool_calls_total", "Tool calls by tool, including cache hits", ["tool"]))
+TOOL_ERRORS = REGISTRY.register(Counter("tool_errors_total", "Tool calls that failed, by tool", ["tool"]))
+TOOL_CACHE_HITS = REGISTRY.register(Counter("tool_cache_hits_total", "Tool calls served from the cache", ["tool"]))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "llm_tokens_total", "Tokens reported by the LLM, by kind (prompt or completion)", ["kind"]))
+FAST_PATH = REGISTRY.register(Counter(
+    "chat_fast_path_total", "Turns answered without the LLM, by tool", ["tool"]))
+SHARED_REQUESTS = REGISTRY.register(Counter(
+    "chat_requests_shared_total",
+    "Requests answered from another request's run (coalesced) or a stored result (replayed)", ["endpoint", "how"]))
+LLM_IN_FLIGHT = REGISTRY.register(Gauge("llm_calls_in_flight", "LLM calls currently holding an admission slot"))
+LLM_QUEUE_DEPTH = REGISTRY.register(Gauge("llm_queue_depth", "LLM calls waiting for an admission slot"))
+LLM_QUEUE_WAIT = REGISTRY.register(Histogram(
+    "llm_queue_wait_seconds", "Time LLM calls spent waiting for an admission slot"))
+ADMISSION_REJECTIONS = REGISTRY.register(Counter(
+    "admission_rejections_total", "Requests turned away, by reason (queue_full, queue_timeout, rate_limited or circuit_open)",
+    ["reason"]))
+DEADLINES_EXCEEDED = REGISTRY.register(Counter(
+    "deadlines_exceeded_total", "Stages given up on because the request deadline passed, by stage", ["stage"]))
+REQUESTS_ABANDONED = REGISTRY.register(Counter(
+    "chat_requests_abandoned_total", "Requests cancelled mid-flight, by reason (disconnect or deadline)", ["reason"]))
+LLM_HEDGES = REGISTRY.register(Counter(
+    "llm_hedged_requests_total",
+    "LLM calls that were slow enough to get a second request, by which answered first (primary, hedge or none)",
+    ["winner"]))
+LLM_CIRCUIT_STATE = REGISTRY.register(Gauge(
+    "llm_circuit_state", "State of the LLM circuit breaker: 0 closed, 1 half-open, 2 open"))
+AGENT_STEP_LIMIT = REGISTRY.register(Counter(
+    "agent_step_limit_total", "Turns that used up AGENT_MAX_STEPS with tool calls still pending"))
+
+
+@contextmanager
+def track_request(endpoint: str) -> Iterator[dict]:
+    """In-flight gauge, latency histogram and outcome counter around one chat request.
+
+    The outcome is "error" if the block raises; streams that report errors as
+    events set ``outcome["status"] = "error"`` on the yielded dict instead.
+    """
+    outcome = {"status": "ok"}
+    with IN_FLIGHT.track(endpoint=endpoint), REQUEST_SECONDS.time(endpoint=endpoint):
+        try:
+            yield outcome
+        except BaseException:
+            outcome["status"] = "error"
+            raise
+        finally:
+            REQUESTS.labels(endpoint=endpoint, status=outcome["status"]).inc()
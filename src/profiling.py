@@ -0,0 +1,191 @@
+"""Opt-in profiling of single requests.
+
+A request is profiled when it carries an ``X-Profile`` header (``cprofile``,
+``stack`` or ``1`` for the default mode) or is picked by the
+PROFILE_SAMPLE_RATE sampling rate. Two modes are available:
+
+    cprofile  deterministic cProfile of the process while the request runs;
+              the report lists the top functions by cumulative time
+    stack     wall-clock stack samples of the thread serving the request,
+              every PROFILE_STACK_INTERVAL seconds, in the folded
+              "frame;frame;frame count" format flame graph tools read
+
+Both see everything the process does meanwhile, including other requests on
+the same event loop, so at most one request is profiled at a time; others go
+unprofiled rather than wait. Reports are kept in memory (the last
+PROFILE_KEEP) and, when PROFILE_DIR is set, written there as well by a
+background thread, off the event loop.
+"""
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+MODES = ("cprofile", "stack")
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Profile:
+    request_id: str
+    mode: str
+    path: str
+    duration_ms: float = 0.0
+    created: float = field(default_factory=time.time)
+    report: str = ""
+
+    def summary(self) -> dict:
+        return {k: v for k, v in asdict(self).items() if k != "report"}
+
+
+class ProfileStore:
+    """The most recent ``maxsize`` profiles, by request id."""
+
+    def __init__(self, maxsize: int = 50, directory: Optional[str] = None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self._profiles: "OrderedDict[str, Profile]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writer: Optional[ThreadPoolExecutor] = None
+
+    def add(self, profile: Profile) -> None:
+        with self._lock:
+            self._profiles[profile.request_id] = profile
+            while len(self._profiles) > self.maxsize:
+                self._profiles.popitem(last=False)
+            if self.directory:
+                if self._writer is None:
+                    self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profile-writer")
+                self._writer.submit(self._write, profile)
+
+    def _write(self, profile: Profile) -> None:
+        extension = "folded" if profile.mode == "stack" else "txt"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f"{profile.request_id}.{extension}"), "w") as f:
+                f.write(profile.report)
+        except OSError:
+            logger.warning("Could not write the profile of request %s", profile.request_id, exc_info=True)
+
+    def close(self) -> None:
+        """Wait for pending report files to be written."""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.shutdown(wait=True)
+
+    def get(self, request_id: str) -> Optional[Profile]:
+        with self._lock:
+            return self._profiles.get(request_id)
+
+    def list(self) -> list:
+        with self._lock:
+            return [p.summary() for p in reversed(self._profiles.values())]
+
+
+class StackSampler:
+    """Samples one thread's stack from a background thread and counts identical stacks."""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> str:
+        self._stop.set()
+        self._thread.join()
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+class RequestProfiler:
+    """Profiles one request in the given mode (see the module docstring)."""
+
+    def __init__(self, mode: str, stack_interval: float = 0.005, top: int = 50):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}; use one of {MODES}")
+        self.mode = mode
+        self.stack_interval = stack_interval
+        self.top = top
+        self._profiler: Optional[cProfile.Profile] = None
+        self._sampler: Optional[StackSampler] = None
+
+    def start(self) -> None:
+        if self.mode == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._sampler = StackSampler(threading.get_ident(), self.stack_interval)
+            self._sampler.start()
+
+    def stop(self) -> str:
+        if self._sampler is not None:
+            return self._sampler.stop()
+        self._profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(self.top)
+        return out.getvalue()
+
+
+_active = threading.Lock()
+
+
+def choose_mode(header: Optional[str], sample_rate: float, default_mode: str = "cprofile") -> Optional[str]:
+    """The profile mode for a request, or None to leave it unprofiled."""
+    if header:
+        value = header.strip().lower()
+        if value in MODES:
+            return value
+        if value in ("1", "true", "yes"):
+            return default_mode
+        return None
+    if sample_rate > 0 and random.random() < sample_rate:
+        return default_mode
+    return None
+
+
+def try_start(mode: str, stack_interval: float = 0.005) -> Optional[RequestProfiler]:
+    """Start profiling unless another request is already being profiled."""
+    if not _active.acquire(blocking=False):
+        return None
+    profiler = RequestProfiler(mode, stack_interval)
+    try:
+        profiler.start()
+    except ValueError:
+        # Some other profiler (a debugger, coverage) already owns the profiling hooks
+        _active.release()
+        return None
+    return profiler
+
+
+def finish(profiler: RequestProfiler) -> str:
+    try:
+        return profiler.stop()
+    finally:
+        _active.release()
@@ -0,0 +1,254 @@
+"""Hedged LLM requests and a circuit breaker for the LLM provider.
+
+``HedgePolicy`` cuts tail latency: when a call has not returned within a
+percentile of recent call latencies, it sends one more identical request and
+uses whichever answers first, cancelling (or, for threads, ignoring) the
+other. Until ``min_samples`` calls have been seen it never hedges.
+
+``CircuitBreaker`` watches the error rate of the last ``window`` calls. Once
+it reaches ``failure_rate`` the circuit opens: calls fail at once with
+CircuitOpen, an Overloaded carrying the remaining cooldown as Retry-After,
+instead of waiting on a failing provider. After ``cooldown`` seconds a
+single trial call is let through; its outcome closes the circuit or opens
+it again.
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import metrics
+from admission import Overloaded
+
+T = TypeVar("T")
+
+logger = logging.getLogger("resilience")
+
+
+class LatencyWindow:
+    """The last ``size`` call durations, for percentile estimates."""
+
+    def __init__(self, size: int = 200):
+        self._samples: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """The ``q`` quantile (0..1) of the window, or None while it is empty."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class HedgePolicy:
+    """Sends a second identical request when the first is slower than the ``percentile`` of recent calls."""
+
+    def __init__(self, enabled: bool = True, percentile: float = 0.95, min_delay: float = 0.05,
+                 min_samples: int = 20, window: int = 200, max_workers: int = 8):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.latencies = LatencyWindow(window)
+        self._max_workers = max_workers
+        self._pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None to send a single request."""
+        if not self.enabled or len(self.latencies) < max(self.min_samples, 1):
+            return None
+        return max(self.min_delay, self.latencies.percentile(self.percentile))
+
+    def _timed(self, attempt: Callable[[], T]) -> T:
+        start = time.perf_counter()
+        result = attempt()
+        self.latencies.add(time.perf_counter() - start)
+        return result
+
+    async def _atimed(self, attempt: Callable[[], Awaitable[T]]) -> T:
+        start = time.perf_counter()
+        result = await attempt()
+        self.latencies.add(time.perf_counter() - start)
+        return result
+
+    def _hedged(self, winner: str, started: float) -> None:
+        metrics.LLM_HEDGES.labels(winner=winner).inc()
+        if winner == "hedge":
+            # The primary was cut short: its elapsed time is a lower bound on its latency
+            self.latencies.add(time.perf_counter() - started)
+
+    async def arun(self, attempt: Callable[[], Awaitable[T]], can_hedge: Callable[[], bool] = lambda: True) -> T:
+        """Await ``attempt()``, racing a second ``attempt()`` against it if it is slow and ``can_hedge()``."""
+        delay = self.delay()
+        if delay is None:
+            return await self._atimed(attempt)
+
+        started = time.perf_counter()
+        primary = asyncio.ensure_future(self._atimed(attempt))
+        attempts = [primary]
+        try:
+            await asyncio.wait(attempts, timeout=delay)
+            if not primary.done() and can_hedge():
+                attempts.append(asyncio.ensure_future(self._atimed(attempt)))
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in attempts:
+                    if task in done and task.exception() is None:
+                        if len(attempts) > 1:
+                            self._hedged("primary" if task is primary else "hedge", started)
+                        return task.result()
+            if len(attempts) > 1:
+                self._hedged("none", started)
+            return primary.result()   # both failed: raise the primary's error
+        finally:
+            for task in attempts:
+                task.cancel()
+
+    def run(self, attempt: Callable[[], T], can_hedge: Callable[[], bool] = lambda: True) -> T:
+        """Blocking version of ``arun``; attempts run on a small thread pool once hedging is on.
+
+        A losing thread cannot be interrupted: it finishes in the background and its result is dropped.
+        """
+        delay = self.delay()
+        if delay is None:
+            return self._timed(attempt)
+
+        if self._pool is None:
+            self._pool = concurrent.futures.ThreadPoolExecutor(self._max_workers, thread_name_prefix="llm-hedge")
+        started = time.perf_counter()
+        context = contextvars.copy_context()
+        primary = self._pool.submit(context.copy().run, self._timed, attempt)
+        attempts = [primary]
+        try:
+            concurrent.futures.wait(attempts, timeout=delay)
+            if not primary.done() and can_hedge():
+                attempts.append(self._pool.submit(context.copy().run, self._timed, attempt))
+            pending = set(attempts)
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in attempts:
+                    if future in done and future.exception() is None:
+                        if len(attempts) > 1:
+                            self._hedged("primary" if future is primary else "hedge", started)
+                        return future.result()
+            if len(attempts) > 1:
+                self._hedged("none", started)
+            return primary.result()
+        finally:
+            for future in attempts:
+                future.cancel()
+
+
+class CircuitOpen(Overloaded):
+    """The LLM circuit is open; retry once the cooldown is over."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("circuit_open", retry_after)
+
+
+class CircuitBreaker:
+    """Closed, open or half-open depending on the error rate of recent calls.
+
+    Use as a context manager around one call. Exceptions in ``ignore`` (by
+    default Overloaded, i.e. admission rejections) and cancellations do not
+    count as failures.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    _GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, enabled: bool = True, failure_rate: float = 0.5, window: int = 20, min_calls: int = 10,
+                 cooldown: float = 30.0, ignore: tuple = (Overloaded,)):
+        self.enabled = enabled
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.ignore = ignore
+        self.state = self.CLOSED
+        self._failures: deque = deque(maxlen=window)   # True for a failed call
+        self._opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            log = logger.warning if state == self.OPEN else logger.info
+            log("LLM circuit %s", state.replace("_", "-"), extra={"circuit": state})
+        self.state = state
+        metrics.LLM_CIRCUIT_STATE.set(self._GAUGE[state])
+
+    def _open(self) -> None:
+        self._opened_at = time.monotonic()
+        self._trial = False
+        self._set_state(self.OPEN)
+
+    def is_open(self) -> bool:
+        """True unless calls are flowing normally (open, or half-open waiting on its trial)."""
+        return self.state != self.CLOSED
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.cooldown - (time.monotonic() - self._opened_at)))
+
+    def allow(self) -> None:
+        """Raise CircuitOpen unless a call may go ahead now."""
+        if not self.enabled or self.state == self.CLOSED:
+            return
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._trial:
+                self._trial = True
+                return
+            if self.state == self.CLOSED:
+                return
+        metrics.ADMISSION_REJECTIONS.labels(reason="circuit_open").inc()
+        raise CircuitOpen(self.retry_after())
+
+    def record(self, failed: bool) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if failed:
+                    self._open()
+                else:
+                    self._failures.clear()
+                    self._set_state(self.CLOSED)
+            elif self.state == self.CLOSED:
+                self._failures.append(failed)
+                if len(self._failures) >= self.min_calls and \
+                        sum(self._failures) / len(self._failures) >= self.failure_rate:
+                    self._open()
+
+    def _abandon(self) -> None:
+        # A call that neither succeeded nor failed; let another one be the trial
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial = False
+
+    def __enter__(self) -> "CircuitBreaker":
+        self.allow()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.record(False)
+        elif issubclass(exc_type, Exception) and not issubclass(exc_type, self.ignore):
+            self.record(True)
+        else:
+            self._abandon()
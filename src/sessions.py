@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from tools.persona import Persona
+
+
+@dataclass
+class Session:
+    id: str
+    messages: list = field(default_factory=list)   # [{"role": ..., "content": ...}]
+    # Extracted from the user's messages as they arrive, so it outlives trimmed history
+    persona: Persona = field(default_factory=Persona)
+    last_seen: float = field(default_factory=time.monotonic)
+    # Serializes turns so two requests on one session can't interleave history
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+
+
+class SessionStore:
+    """Bounded in-memory conversation store.
+
+    Sessions idle for longer than ``idle_ttl`` seconds are dropped, and once
+    ``max_sessions`` is reached the least recently used session is evicted.
+    Each session keeps at most ``max_messages`` messages. ``on_remove`` is
+    called with the id of every session that is evicted or deleted.
+    """
+
+    def __init__(self, max_sessions: int = 1000, idle_ttl: float = 1800, max_messages: int = 200,
+                 on_remove: Optional[Callable[[str], None]] = None):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_messages = max_messages
+        self.on_remove = on_remove
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict_idle(self, now: float) -> list:
+        # Oldest-accessed sessions are at the front
+        evicted = []
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_seen < self.idle_ttl:
+                break
+            evicted.append(self._sessions.popitem(last=False)[0])
+        return evicted
+
+    def _removed(self, session_ids: list) -> None:
+        # Called outside the lock
+        if self.on_remove is not None:
+            for session_id in session_ids:
+                self.on_remove(session_id)
+
+    def create(self) -> Session:
+        now = time.monotonic()
+        with self._lock:
+            evicted = self._evict_idle(now)
+            session = Session(id=uuid.uuid4().hex, last_seen=now)
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                evicted.append(self._sessions.popitem(last=False)[0])
+        self._removed(evicted)
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        now = time.monotonic()
+        with self._lock:
+            evicted = self._evict_idle(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_seen = now
+                self._sessions.move_to_end(session_id)
+        self._removed(evicted)
+        return session
+
+    def append(self, session: Session, *messages: dict) -> None:
+        session.messages.extend(messages)
+        if len(session.messages) > self.max_messages:
+            del session.messages[:-self.max_messages]
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            deleted = self._sessions.pop(session_id, None) is not None
+        if deleted:
+            self._removed([session_id])
+        return deleted
+
+    def __len__(self) -> int:
+        return len(self._sessions)
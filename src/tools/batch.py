@@ -0,0 +1,125 @@
+# tools/batch.py - NumPy-backed batch versions of the formulas in tools/formulas.py
+
+"""Vectorized financial formulas.
+
+Every function accepts scalars, arrays or any broadcastable mix of the two for
+``pv``/``fv``/``pmt``/``r``/``n`` and returns a float64 ``numpy.ndarray`` with
+the broadcast shape (0-d when every input is a scalar).
+
+Elements for which a formula is undefined (e.g. Rule of 72 at a 0% rate) come
+back as ``inf``/``nan`` instead of raising, so one bad row cannot abort a whole
+sweep. The scalar versions in ``tools/core.py`` turn those into errors.
+"""
+
+import inspect
+
+import numpy as np
+
+
+def _as_arrays(*values):
+    """Convert inputs to float64 arrays broadcast against each other."""
+    return np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in values))
+
+
+def future_value(pv, r, n):
+    """FV = PV * (1 + r)^n"""
+    pv, r, n = _as_arrays(pv, r, n)
+    with np.errstate(over="ignore", invalid="ignore"):
+        return pv * (1 + r) ** n
+
+
+def present_value(fv, r, n):
+    """PV = FV / (1 + r)^n"""
+    fv, r, n = _as_arrays(fv, r, n)
+    with np.errstate(divide="ignore", over="ignore", invalid="ignore"):
+        return fv / (1 + r) ** n
+
+
+def rule_of_72(r):
+    """Years ≈ 72 / (r * 100)"""
+    (r,) = _as_arrays(r)
+    with np.errstate(divide="ignore"):
+        return 72 / (r * 100)
+
+
+def fv_annuity(pmt, r, n):
+    """FV = PMT * [((1 + r)^n - 1) / r], or PMT * n when r == 0"""
+    pmt, r, n = _as_arrays(pmt, r, n)
+    zero_rate = r == 0
+    safe_r = np.where(zero_rate, 1.0, r)
+    with np.errstate(over="ignore", invalid="ignore"):
+        growth = pmt * (((1 + safe_r) ** n - 1) / safe_r)
+    return np.where(zero_rate, pmt * n, growth)
+
+
+def pv_annuity(pmt, r, n):
+    """PV = PMT * [1 - (1 + r)^(-n)] / r, or PMT * n when r == 0"""
+    pmt, r, n = _as_arrays(pmt, r, n)
+    zero_rate = r == 0
+    safe_r = np.where(zero_rate, 1.0, r)
+    with np.errstate(divide="ignore", over="ignore", invalid="ignore"):
+        discounted = pmt * (1 - (1 + safe_r) ** (-n)) / safe_r
+    return np.where(zero_rate, pmt * n, discounted)
+
+
+def nper(pv, fv, r, pmt=0.0):
+    """Number of periods to grow PV into FV.
+
+    pmt == 0:           n = ln(FV / PV) / ln(1 + r)
+    pmt != 0, r == 0:   n = (FV - PV) / PMT
+    pmt != 0, r != 0:   n = ln((FV * r + PMT) / (PV * r + PMT)) / ln(1 + r)
+    """
+    pv, fv, r, pmt = _as_arrays(pv, fv, r, pmt)
+    no_payment = pmt == 0
+    zero_rate = r == 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_growth = np.log(1 + r)
+        compound = np.log(fv / pv) / log_growth
+        linear = (fv - pv) / pmt
+        annuity = np.log((fv * r + pmt) / (pv * r + pmt)) / log_growth
+    return np.where(no_payment, compound, np.where(zero_rate, linear, annuity))
+
+
+FORMULAS = {
+    "future_value": future_value,
+    "present_value": present_value,
+    "rule_of_72": rule_of_72,
+    "fv_annuity": fv_annuity,
+    "pv_annuity": pv_annuity,
+    "nper": nper,
+}
+
+
+def sweep(formula: str, fixed: dict, ranges: dict) -> np.ndarray:
+    """Evaluate ``formula`` over the Cartesian product of ``ranges``.
+
+    ``fixed`` maps parameter names to scalars and ``ranges`` maps parameter
+    names to sequences of values. The result has one axis per entry of
+    ``ranges``, in insertion order, and is computed in a single broadcast call
+    (no meshgrid copies are made).
+    """
+    if formula not in FORMULAS:
+        raise ValueError(f"Unknown formula {formula!r}; expected one of {sorted(FORMULAS)}")
+    fn = FORMULAS[formula]
+    parameters = inspect.signature(fn).parameters
+
+    unknown = (set(fixed) | set(ranges)) - set(parameters)
+    if unknown:
+        raise ValueError(f"{formula} has no parameter(s) {sorted(unknown)}")
+    both = set(fixed) & set(ranges)
+    if both:
+        raise ValueError(f"Parameter(s) {sorted(both)} given as both fixed and ranged")
+    missing = [
+        name for name, p in parameters.items()
+        if p.default is inspect.Parameter.empty and name not in fixed and name not in ranges
+    ]
+    if missing:
+        raise ValueError(f"{formula} is missing parameter(s) {missing}")
+
+    axes = len(ranges)
+    kwargs = dict(fixed)
+    for axis, (name, values) in enumerate(ranges.items()):
+        shape = [1] * axes
+        shape[axis] = -1
+        kwargs[name] = np.asarray(values, dtype=np.float64).reshape(shape)
+    return fn(**kwargs)
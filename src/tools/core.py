@@ -0,0 +1,110 @@
+# tools/core.py - Framework-free scalar versions of the formulas in tools/formulas.py
+
+"""Plain-float financial formulas.
+
+Only the standard library is used: no LangChain, pydantic or NumPy. Batch jobs,
+endpoints and other services can call these directly; the tools in
+``tools/formulas.py`` are thin adapters that validate arguments, call one of
+these and format the result. For many inputs at once use ``tools/batch.py``,
+which evaluates the same formulas over arrays.
+
+Each function returns a float and raises where the result is not a finite
+number: ValueError when the formula is undefined for the inputs (e.g. a
+negative growth factor raised to a fractional power) and ZeroDivisionError
+when it diverges (e.g. Rule of 72 at a 0% rate). Up to rounding the values
+match ``tools/batch.py`` element for element.
+"""
+
+import math
+
+
+def _div(a: float, b: float) -> float:
+    """a / b with IEEE semantics: ±inf or nan instead of ZeroDivisionError."""
+    if b == 0:
+        if a == 0 or math.isnan(a):
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+    return a / b
+
+
+def _pow(base: float, exponent: float) -> float:
+    """base ** exponent with IEEE semantics: inf on overflow, nan where undefined."""
+    try:
+        return math.pow(base, exponent)
+    except OverflowError:
+        return math.inf
+    except ValueError:
+        # 0 to a negative power, or a negative base to a fractional power
+        return math.inf if base == 0 else math.nan
+
+
+def _log(x: float) -> float:
+    """Natural log with IEEE semantics: -inf at 0, nan below."""
+    if x == 0:
+        return -math.inf
+    if x < 0:
+        return math.nan
+    return math.log(x)
+
+
+def _finite(value: float, label: str) -> float:
+    if math.isnan(value):
+        raise ValueError(f"{label} is undefined for these inputs")
+    if math.isinf(value):
+        raise ZeroDivisionError(f"{label} diverges for these inputs")
+    return value
+
+
+def future_value(pv: float, r: float, n: float) -> float:
+    """FV = PV * (1 + r)^n"""
+    return _finite(pv * _pow(1 + r, n), "Future value")
+
+
+def present_value(fv: float, r: float, n: float) -> float:
+    """PV = FV / (1 + r)^n"""
+    return _finite(_div(fv, _pow(1 + r, n)), "Present value")
+
+
+def rule_of_72(r: float) -> float:
+    """Years ≈ 72 / (r * 100)"""
+    return _finite(_div(72, r * 100), "Rule of 72")
+
+
+def fv_annuity(pmt: float, r: float, n: float) -> float:
+    """FV = PMT * [((1 + r)^n - 1) / r], or PMT * n when r == 0"""
+    if r == 0:
+        return _finite(pmt * n, "Future value of annuity")
+    return _finite(pmt * ((_pow(1 + r, n) - 1) / r), "Future value of annuity")
+
+
+def pv_annuity(pmt: float, r: float, n: float) -> float:
+    """PV = PMT * [1 - (1 + r)^(-n)] / r, or PMT * n when r == 0"""
+    if r == 0:
+        return _finite(pmt * n, "Present value of annuity")
+    return _finite(pmt * (1 - _pow(1 + r, -n)) / r, "Present value of annuity")
+
+
+def nper(pv: float, fv: float, r: float, pmt: float = 0.0) -> float:
+    """Number of periods to grow PV into FV.
+
+    pmt == 0:           n = ln(FV / PV) / ln(1 + r)
+    pmt != 0, r == 0:   n = (FV - PV) / PMT
+    pmt != 0, r != 0:   n = ln((FV * r + PMT) / (PV * r + PMT)) / ln(1 + r)
+    """
+    if pmt == 0:
+        periods = _div(_log(_div(fv, pv)), _log(1 + r))
+    elif r == 0:
+        periods = (fv - pv) / pmt
+    else:
+        periods = _div(_log(_div(fv * r + pmt, pv * r + pmt)), _log(1 + r))
+    return _finite(periods, "Number of periods")
+
+
+FORMULAS = {
+    "future_value": future_value,
+    "present_value": present_value,
+    "rule_of_72": rule_of_72,
+    "fv_annuity": fv_annuity,
+    "pv_annuity": pv_annuity,
+    "nper": nper,
+}
@@ -5,10 +5,19 @@
 
 # tools/formulas.py - Updated to match Gemini's parameter names
 
+import math
+
+import numpy as np
 from langchain_core.tools import BaseTool
-from typing import Type
+from typing import Literal, Optional, Type
 from pydantic import BaseModel, Field
 
+from . import batch, core
+from .persona import current_persona
+from .projection import project_retirement
+from .simulation import PARALLEL_MIN_PATHS, simulate_retirement
+
+
 class FutureValueInput(BaseModel):
     pv: float = Field(description="Present value (initial investment)")
     r: float = Field(description="Interest rate as decimal (e.g., 0.05 for 5%)")
@@ -20,7 +29,7 @@ class FutureValueTool(BaseTool):
     args_schema: Type[BaseModel] = FutureValueInput
 
     def _run(self, pv: float, r: float, n: float) -> str:
-        future_val = pv * (1 + r) ** n
+        future_val = core.future_value(pv, r, n)
         return f"Future Value: ${future_val:.2f} (Principal: ${pv}, Rate: {r*100}%, Periods: {n})"
 
 class PresentValueInput(BaseModel):
@@ -34,7 +43,7 @@ class PresentValueTool(BaseTool):
     args_schema: Type[BaseModel] = PresentValueInput
 
     def _run(self, fv: float, r: float, n: float) -> str:
-        present_val = fv / (1 + r) ** n
+        present_val = core.present_value(fv, r, n)
         return f"Present Value: ${present_val:.2f} (Future Value: ${fv}, Rate: {r*100}%, Periods: {n})"
 
 class RuleOf72Input(BaseModel):
@@ -46,7 +55,7 @@ class RuleOf72Tool(BaseTool):
     args_schema: Type[BaseModel] = RuleOf72Input
 
     def _run(self, r: float) -> str:
-        years = 72 / (r * 100)
+        years = core.rule_of_72(r)
         return f"Rule of 72: Investment will double in approximately {years:.1f} years at {r*100}% interest"
 
 class FVAnnuityInput(BaseModel):
@@ -60,10 +69,7 @@ class FVAnnuityTool(BaseTool):
     args_schema: Type[BaseModel] = FVAnnuityInput
 
     def _run(self, pmt: float, r: float, n: float) -> str:
-        if r == 0:
-            fv = pmt * n
-        else:
-            fv = pmt * (((1 + r) ** n - 1) / r)
+        fv = core.fv_annuity(pmt, r, n)
         return f"Future Value of Annuity: ${fv:.2f} (Payment: ${pmt}, Rate: {r*100}%, Periods: {n})"
 
 class PVAnnuityInput(BaseModel):
@@ -77,12 +83,116 @@ class PVAnnuityTool(BaseTool):
     args_schema: Type[BaseModel] = PVAnnuityInput
 
     def _run(self, pmt: float, r: float, n: float) -> str:
-        if r == 0:
-            pv = pmt * n
-        else:
-            pv = pmt * (1 - (1 + r) ** (-n)) / r
+        pv = core.pv_annuity(pmt, r, n)
         return f"Present Value of Annuity: ${pv:.2f} (Payment: ${pmt}, Rate: {r*100}%, Periods: {n})"
 
+# The persona fields default to None: anything the LLM leaves out is read from the stored persona
+class RetirementProjectionInput(BaseModel):
+    current_age: Optional[float] = Field(description="User's current age in years", default=None)
+    current_savings: Optional[float] = Field(description="Current retirement savings balance", default=None)
+    monthly_contribution: Optional[float] = Field(description="Amount saved per month until retirement", default=None)
+    annual_return: Optional[float] = Field(description="Expected annual investment return as decimal (e.g., 0.06 for 6%)", default=None)
+    retirement_age: Optional[float] = Field(description="Age at which the user plans to retire", default=None)
+    monthly_spending: Optional[float] = Field(description="Monthly spending in retirement, in today's dollars", default=None)
+    inflation: float = Field(description="Annual inflation rate as decimal", default=0.0)
+    life_expectancy: float = Field(description="Age the savings need to last until", default=95)
+
+def _with_persona(**values) -> dict:
+    """Fill arguments left as None from the current persona; raise if any are still missing."""
+    persona = current_persona.get()
+    known = persona.tool_args() if persona is not None else {}
+    values = {name: known.get(name) if value is None else value for name, value in values.items()}
+    missing = [name for name, value in values.items() if value is None]
+    if missing:
+        raise ValueError(f"Missing {', '.join(missing)}; ask the user for them")
+    return values
+
+class RetirementProjectionTool(BaseTool):
+    name: str = "retirement_projection"
+    description: str = (
+        "Project a retirement plan month by month: balance at retirement, the age savings run out, "
+        "savings needed at retirement and the monthly contribution required to get there. "
+        "Use this instead of chaining fv_annuity/pv_annuity/nper for retirement timing, "
+        "savings longevity and savings target questions."
+    )
+    args_schema: Type[BaseModel] = RetirementProjectionInput
+
+    def _run(self, current_age: Optional[float] = None, current_savings: Optional[float] = None,
+             monthly_contribution: Optional[float] = None, annual_return: Optional[float] = None,
+             retirement_age: Optional[float] = None, monthly_spending: Optional[float] = None,
+             inflation: float = 0.0, life_expectancy: float = 95) -> str:
+        values = _with_persona(current_age=current_age, current_savings=current_savings,
+                               monthly_contribution=monthly_contribution, annual_return=annual_return,
+                               retirement_age=retirement_age, monthly_spending=monthly_spending)
+        plan = project_retirement(**values, inflation=inflation, life_expectancy=life_expectancy)
+
+        if plan.depletion_age is None:
+            longevity = f"Savings last past age {life_expectancy:g} with ${plan.final_balance:,.2f} remaining"
+        else:
+            longevity = f"Savings run out at age {plan.depletion_age:.1f}"
+
+        lines = [
+            f"Retirement Projection (Age {values['current_age']:g} -> {values['retirement_age']:g}, "
+            f"Return: {values['annual_return']*100}%, "
+            f"Inflation: {inflation*100}%)",
+            f"Balance at retirement: ${plan.balance_at_retirement:,.2f}",
+            longevity,
+            f"Needed at retirement to fund ${values['monthly_spending']:,.2f}/month (today's dollars) to age "
+            f"{life_expectancy:g}: ${plan.required_savings:,.2f}",
+        ]
+        if plan.required_monthly_contribution is not None:
+            lines.append(f"Required monthly contribution: ${plan.required_monthly_contribution:,.2f} "
+                         f"(current: ${values['monthly_contribution']:,.2f})")
+
+        # One balance per 5 years keeps the tool message short for the LLM
+        milestones = range(59, len(plan.balances), 60)
+        lines.append("Balance by age: " + ", ".join(
+            f"{plan.ages[i]:.0f}: ${plan.balances[i]:,.0f}" for i in milestones))
+        return "\n".join(lines)
+
+class MonteCarloRetirementInput(RetirementProjectionInput):
+    return_volatility: float = Field(description="Annual standard deviation of returns as decimal", default=0.15)
+    inflation_volatility: float = Field(description="Annual standard deviation of inflation as decimal (0 = fixed inflation)", default=0.0)
+    n_paths: int = Field(description="Number of simulated paths", default=10000, ge=100, le=PARALLEL_MIN_PATHS)
+    seed: int = Field(description="Random seed; the same seed always gives the same result", default=42)
+
+class MonteCarloRetirementTool(BaseTool):
+    name: str = "retirement_monte_carlo"
+    description: str = (
+        "Simulate thousands of random market (and optionally inflation) paths for a retirement plan and report "
+        "the probability that savings last until life expectancy, plus percentile balances. "
+        "Use this for 'what are my odds' questions."
+    )
+    args_schema: Type[BaseModel] = MonteCarloRetirementInput
+
+    def _run(self, current_age: Optional[float] = None, current_savings: Optional[float] = None,
+             monthly_contribution: Optional[float] = None, annual_return: Optional[float] = None,
+             retirement_age: Optional[float] = None, monthly_spending: Optional[float] = None,
+             inflation: float = 0.0, life_expectancy: float = 95, return_volatility: float = 0.15,
+             inflation_volatility: float = 0.0, n_paths: int = 10000, seed: int = 42) -> str:
+        values = _with_persona(current_age=current_age, current_savings=current_savings,
+                               monthly_contribution=monthly_contribution, annual_return=annual_return,
+                               retirement_age=retirement_age, monthly_spending=monthly_spending)
+        result = simulate_retirement(
+            **values, inflation=inflation, life_expectancy=life_expectancy, return_volatility=return_volatility,
+            # Tool calls already run on a worker thread; they stay inline rather than fan out to processes
+            inflation_volatility=inflation_volatility, n_paths=n_paths, seed=seed, workers=1,
+        )
+
+        def spread(values):
+            return ", ".join(f"P{p:g}: ${v:,.0f}" for p, v in zip(result.percentiles, values))
+
+        lines = [
+            f"Monte Carlo Retirement ({result.n_paths:,} paths, Return: {values['annual_return']*100}% ± "
+            f"{return_volatility*100}%, Inflation: {inflation*100}%, Seed: {seed})",
+            f"Probability savings last to age {life_expectancy:g}: {result.success_rate*100:.1f}%",
+            f"Balance at retirement (age {values['retirement_age']:g}): {spread(result.balance_at_retirement)}",
+            f"Balance at age {life_expectancy:g}: {spread(result.final_balance)}",
+        ]
+        if result.median_depletion_age is not None:
+            lines.append(f"When savings run out, the median age is {result.median_depletion_age:.1f}")
+        return "\n".join(lines)
+
 class NPERInput(BaseModel):
     pv: float = Field(description="Present value")
     fv: float = Field(description="Future value")
@@ -95,39 +205,86 @@ class NPERTool(BaseTool):
     args_schema: Type[BaseModel] = NPERInput
 
     def _run(self, pv: float, fv: float, r: float, pmt: float = 0) -> str:
-        import math
-        if pmt == 0:
-            # Simple compound interest: n = ln(FV/PV) / ln(1+r)
-            periods = math.log(fv / pv) / math.log(1 + r)
-        else:
-            # With payments - more complex calculation
-            if r == 0:
-                periods = (fv - pv) / pmt
-            else:
-                periods = math.log((fv * r + pmt) / (pv * r + pmt)) / math.log(1 + r)
-        
+        periods = core.nper(pv, fv, r, pmt)
+
         return f"Number of Periods: {periods:.2f} (PV: ${pv}, FV: ${fv}, Rate: {r*100}%, Payment: ${pmt})"
 
+class ScenarioSweepInput(BaseModel):
+    formula: Literal["future_value", "present_value", "rule_of_72", "fv_annuity", "pv_annuity", "nper"] = Field(
+        description="Formula to evaluate over the grid")
+    ranges: dict[str, list[float]] = Field(
+        description="Parameters to vary, mapped to the values to try, e.g. {\"r\": [0.05, 0.06, 0.07], \"n\": [10, 20, 30]}")
+    fixed: dict[str, float] = Field(
+        description="Remaining parameters held constant, e.g. {\"pv\": 1000}", default_factory=dict)
+
+class ScenarioSweepTool(BaseTool):
+    name: str = "scenario_sweep"
+    description: str = (
+        "Evaluate one formula over every combination of several parameter values (e.g. rates 5%, 6%, 7% x "
+        "10, 20, 30 years) and return a table. Use this instead of calling a formula once per combination."
+    )
+    args_schema: Type[BaseModel] = ScenarioSweepInput
+
+    max_cells: int = 400
+
+    def _run(self, formula: str, ranges: dict, fixed: Optional[dict] = None) -> str:
+        fixed = fixed or {}
+        cells = math.prod(len(values) for values in ranges.values())
+        if cells > self.max_cells:
+            raise ValueError(f"Sweep of {cells} combinations exceeds the limit of {self.max_cells}")
+
+        grid = batch.sweep(formula, fixed, ranges)
+        money = formula in {"future_value", "present_value", "fv_annuity", "pv_annuity"}
+
+        def cell(value) -> str:
+            if not math.isfinite(value):
+                return "n/a"
+            return f"${value:,.2f}" if money else f"{value:,.2f}"
+
+        held = ", ".join(f"{k}={v:g}" for k, v in fixed.items())
+        title = f"Scenario Sweep: {formula}" + (f" ({held})" if held else "")
+        names = list(ranges)
+
+        if len(names) == 2:
+            # Matrix layout: first parameter down the rows, second across the columns
+            rows, cols = names
+            header = f"| {rows} \\ {cols} | " + " | ".join(f"{v:g}" for v in ranges[cols]) + " |"
+            lines = [title, header, "|" + "---|" * (len(ranges[cols]) + 1)]
+            for i, row_value in enumerate(ranges[rows]):
+                lines.append(f"| {row_value:g} | " + " | ".join(cell(v) for v in grid[i]) + " |")
+        else:
+            lines = [title, "| " + " | ".join(names + [formula]) + " |", "|" + "---|" * (len(names) + 1)]
+            for index in np.ndindex(grid.shape):
+                values = [ranges[name][i] for name, i in zip(names, index)]
+                lines.append("| " + " | ".join(f"{v:g}" for v in values) + f" | {cell(grid[index])} |")
+        return "\n".join(lines)
+
 class ExplainCalculationInput(BaseModel):
     calculation_type: str = Field(description="Type of calculation to explain")
     parameters: dict = Field(description="Parameters used in the calculation")
 
+# One-line formula per calculation, shared with the fast path answers
+EXPLANATIONS = {
+    "future_value": "Future Value calculation uses compound interest: FV = PV × (1 + r)^n",
+    "present_value": "Present Value discounts future money to today's value: PV = FV ÷ (1 + r)^n",
+    "rule_of_72": "Rule of 72 estimates doubling time: Years ≈ 72 ÷ (interest rate %)",
+    "fv_annuity": "Future Value of Annuity: FV = PMT × [((1 + r)^n - 1) ÷ r]",
+    "pv_annuity": "Present Value of Annuity: PV = PMT × [1 - (1 + r)^(-n)] ÷ r",
+    "nper": "Number of Periods: n = ln(FV/PV) ÷ ln(1 + r)",
+    "retirement_projection": "Retirement Projection: each month B = B × (1 + r/12) + contribution before "
+                             "retirement, then B = B × (1 + r/12) - spending × (1 + inflation)^(years from now)",
+    "scenario_sweep": "Scenario Sweep: evaluates the chosen formula once for every combination of the listed parameter values",
+    "retirement_monte_carlo": "Monte Carlo Retirement: repeats the retirement projection with monthly returns drawn from "
+                              "Normal(r/12, volatility/√12); success rate = share of paths whose balance never drops below 0"
+}
+
 class ExplainCalculationTool(BaseTool):
     name: str = "explain_calculation"
     description: str = "Provide detailed explanation of financial calculation"
     args_schema: Type[BaseModel] = ExplainCalculationInput
 
     def _run(self, calculation_type: str, parameters: dict) -> str:
-        explanations = {
-            "future_value": "Future Value calculation uses compound interest: FV = PV × (1 + r)^n",
-            "present_value": "Present Value discounts future money to today's value: PV = FV ÷ (1 + r)^n",
-            "rule_of_72": "Rule of 72 estimates doubling time: Years ≈ 72 ÷ (interest rate %)",
-            "fv_annuity": "Future Value of Annuity: FV = PMT × [((1 + r)^n - 1) ÷ r]",
-            "pv_annuity": "Present Value of Annuity: PV = PMT × [1 - (1 + r)^(-n)] ÷ r",
-            "nper": "Number of Periods: n = ln(FV/PV) ÷ ln(1 + r)"
-        }
-        
-        explanation = explanations.get(calculation_type, f"Explanation for {calculation_type}")
+        explanation = EXPLANATIONS.get(calculation_type, f"Explanation for {calculation_type}")
         return f"{explanation}\nParameters used: {parameters}"
 
 # Create tool instances
@@ -136,5 +293,8 @@ present_value = PresentValueTool()
 rule_of_72 = RuleOf72Tool()
 fv_annuity = FVAnnuityTool()
 pv_annuity = PVAnnuityTool()
+retirement_projection = RetirementProjectionTool()
+retirement_monte_carlo = MonteCarloRetirementTool()
 nper = NPERTool()
+scenario_sweep = ScenarioSweepTool()
 explain_calculation = ExplainCalculationTool()
\ No newline at end of file
@@ -0,0 +1,235 @@
+import re
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+_AMOUNT = r"\$?\s*(\d[\d,]*(?:\.\d+)?)\s*(k|m|million|thousand)?\b"
+_PER_MONTH = r"\s*(?:(?:/|per|a|an|each|every)\s*(?:month|mo)\b|monthly\b)"
+
+# Each pattern reads one persona field from a user message; the first group is the value
+_PATTERNS = {
+    "age": [
+        re.compile(r"\b(?:i am|i'm|im|age[d]?)\s+(\d{2})(?!\s*(?:%|k\b|,\d))", re.I),
+        re.compile(r"\b(\d{2})\s*(?:years?|yrs?)[\s-]*old\b", re.I),
+    ],
+    "retirement_age": [
+        re.compile(r"\bretir(?:e|ing|ement)\s+(?:at|by)\s+(?:age\s+)?(\d{2})\b", re.I),
+    ],
+    "annual_income": [
+        re.compile(r"\b(?:earn|make|income|salary)\D{0,20}?" + _AMOUNT + r"(" + _PER_MONTH + r")?", re.I),
+    ],
+    "current_savings": [
+        # After "have" only money counts ("$50k", "2 million"), not "I have 2 kids"
+        re.compile(r"\bhave\s+(?:about\s+|around\s+)?(?=\$|\d[\d,]*(?:\.\d+)?\s*(?:k|m|million|thousand)\b)"
+                   + _AMOUNT + r"(?!" + _PER_MONTH + r")(?!\s*%)", re.I),
+        re.compile(r"\b(?:savings|saved|nest egg|portfolio)\s+(?:of\s+|is\s+|are\s+|about\s+|around\s+)?" + _AMOUNT
+                   + r"(?!" + _PER_MONTH + r")(?!\s*%)", re.I),
+        re.compile(_AMOUNT + r"\s+(?:saved|in savings)\b", re.I),
+        re.compile(r"\bretired with\s+" + _AMOUNT + r"(?!" + _PER_MONTH + r")", re.I),
+    ],
+    "monthly_contribution": [
+        re.compile(r"\b(?:save|saving|contribute|contributing|invest|investing|put away)\s+(?:about\s+|around\s+)?"
+                   + _AMOUNT + _PER_MONTH, re.I),
+    ],
+    "expected_return": [
+        re.compile(r"(\d+(?:\.\d+)?)\s*%\s*(?:annual\s+|average\s+|expected\s+)?(?:return|growth)", re.I),
+        re.compile(r"\breturns?\s+(?:of\s+|is\s+|around\s+|about\s+)?(\d+(?:\.\d+)?)\s*%", re.I),
+    ],
+    "monthly_spending": [
+        re.compile(r"\b(?:spend|spending|withdraw|withdrawing|live on|need)\s+(?:about\s+|around\s+)?"
+                   + _AMOUNT + _PER_MONTH, re.I),
+    ],
+}
+
+_GOALS = {
+    "college": re.compile(r"\b(?:college|university|tuition)\b", re.I),
+    "home": re.compile(r"\b(?:buy(?:ing)? a (?:house|home)|down payment)\b", re.I),
+    "mortgage payoff": re.compile(r"\bpay (?:off|down) (?:my |the )?mortgage\b", re.I),
+    "emergency fund": re.compile(r"\bemergency fund\b", re.I),
+    "travel": re.compile(r"\btravel\b", re.I),
+    "early retirement": re.compile(r"\bretire early\b", re.I),
+}
+
+# "retire at age 65" gives the retirement age, not the user's age
+_RETIREMENT_BEFORE = re.compile(r"\bretir(?:e|ing|ement)\s+(?:at|by|when)\s*$", re.I)
+# "I need $1 million saved by 65" is a target, not a balance
+_GOAL_BEFORE = re.compile(r"\b(?:need|needs|want|wants|goal|target|aim|aiming|hope|hoping|plan|planning|like)\b"
+                          r"(?:\s+\w+){0,3}\s*$", re.I)
+_GOAL_AFTER = re.compile(r"\s*(?:saved\s+)?(?:by|before)\s+(?:age\b|the time\b|retirement\b|then\b|\d)", re.I)
+
+# The field an assistant question asks for, most specific first. A short reply to it ("35",
+# "6%", "About $4,000 a month") is read as that field
+_QUESTIONS = [
+    ("monthly_spending", re.compile(r"\b(?:spend|spending|expenses|live on)\b|\bneed\b.*\bmonth", re.I)),
+    ("monthly_contribution", re.compile(
+        r"\b(?:save|contribute|put away|set aside|invest)\b.*\bmonth|\bmonthly (?:savings|contributions?)\b", re.I)),
+    ("expected_return", re.compile(r"\breturns?\b|\bgrowth\b|\binterest rate\b", re.I)),
+    ("retirement_age", re.compile(r"\bretire\b", re.I)),
+    ("current_savings", re.compile(r"\b(?:savings|saved|nest egg|portfolio)\b", re.I)),
+    ("annual_income", re.compile(r"\b(?:income|earn|salary|make)\b", re.I)),
+    ("age", re.compile(r"\bhow old\b|\bage\b", re.I)),
+]
+_QUESTION = re.compile(r"[^.!?\n]*\?")
+_NUMBER = re.compile(r"\d[\d,]*(?:\.\d+)?")
+# How a bare answer gives each kind of field; same groups as the patterns above
+_AGE_ANSWER = re.compile(r"(?<![$\d.,])(\d{2})(?![\d,.]|\s*(?:%|k\b|thousand|million))", re.I)
+_RATE_ANSWER = re.compile(r"(\d+(?:\.\d+)?)\s*(?:%|percent\b)", re.I)
+_MONEY_ANSWER = re.compile(_AMOUNT + r"(" + _PER_MONTH + r")?(?!\s*%)", re.I)
+
+_SCALE = {"k": 1e3, "thousand": 1e3, "m": 1e6, "million": 1e6}
+
+# Persona field -> argument name used by the retirement tools
+TOOL_ARGUMENTS = {
+    "age": "current_age",
+    "current_savings": "current_savings",
+    "monthly_contribution": "monthly_contribution",
+    "expected_return": "annual_return",
+    "retirement_age": "retirement_age",
+    "monthly_spending": "monthly_spending",
+}
+
+
+def _amount(number: str, scale: Optional[str]) -> float:
+    return float(number.replace(",", "")) * _SCALE.get((scale or "").lower(), 1)
+
+
+@dataclass
+class Persona:
+    """What the user has told us about themselves, kept as typed fields.
+
+    Updated incrementally from each user message, so later turns (and the
+    tools) don't need the raw transcript to recover these numbers.
+    """
+
+    age: Optional[float] = None
+    annual_income: Optional[float] = None
+    current_savings: Optional[float] = None
+    monthly_contribution: Optional[float] = None
+    expected_return: Optional[float] = None      # decimal, 0.06 for 6%
+    retirement_age: Optional[float] = None
+    monthly_spending: Optional[float] = None
+    goals: list = field(default_factory=list)
+
+    def update(self, text: str, question: Optional[str] = None) -> list:
+        """Read persona values from one user message; returns the names of the fields that changed.
+
+        ``question`` is the assistant message the user is replying to; when it
+        asks for one field, a reply holding a single number is read as that field.
+        """
+        changed = []
+        for name, patterns in _PATTERNS.items():
+            value = self._read(name, patterns, text)
+            if value is not None and value != getattr(self, name):
+                setattr(self, name, value)
+                changed.append(name)
+        asked = self._asked(question)
+        if asked is not None and asked not in changed:
+            value = self._answer(asked, text)
+            if value is not None and value != getattr(self, asked):
+                setattr(self, asked, value)
+                changed.append(asked)
+        for goal, pattern in _GOALS.items():
+            if goal not in self.goals and pattern.search(text):
+                self.goals.append(goal)
+                changed.append("goals")
+        return changed
+
+    @classmethod
+    def _read(cls, name: str, patterns: list, text: str) -> Optional[float]:
+        # The first plausible match of the first pattern that has one
+        for pattern in patterns:
+            for match in pattern.finditer(text):
+                value = cls._parse(name, match)
+                if value is not None:
+                    return value
+        return None
+
+    @staticmethod
+    def _asked(question: Optional[str]) -> Optional[str]:
+        # The field the last question of the assistant's message asks for
+        questions = _QUESTION.findall(question or "")
+        if not questions:
+            return None
+        for name, pattern in _QUESTIONS:
+            if pattern.search(questions[-1]):
+                return name
+        return None
+
+    @classmethod
+    def _answer(cls, name: str, text: str) -> Optional[float]:
+        # Only a reply with a single number is unambiguous
+        if len(_NUMBER.findall(text)) != 1:
+            return None
+        if name in ("age", "retirement_age"):
+            pattern = _AGE_ANSWER
+        elif name == "expected_return":
+            pattern = _RATE_ANSWER
+        else:
+            pattern = _MONEY_ANSWER
+        match = pattern.search(text)
+        if match is None or (name == "current_savings" and match.group(3)):
+            return None
+        return cls._parse(name, match)
+
+    @staticmethod
+    def _parse(name: str, match: re.Match) -> Optional[float]:
+        if name == "age" and _RETIREMENT_BEFORE.search(match.string, 0, match.start()):
+            return None
+        if name == "current_savings" and (_GOAL_BEFORE.search(match.string, 0, match.start())
+                                          or _GOAL_AFTER.match(match.string, match.end())):
+            return None
+        if name in ("age", "retirement_age"):
+            age = float(match.group(1))
+            return age if 16 <= age <= 100 else None
+        if name == "expected_return":
+            rate = round(float(match.group(1)) / 100, 6)
+            return rate if rate <= 0.5 else None
+        value = _amount(match.group(1), match.group(2))
+        if name == "annual_income" and match.group(3):
+            value *= 12
+        return value
+
+    @classmethod
+    def from_messages(cls, messages: list) -> "Persona":
+        """Build a persona from the user turns of a LangChain message list, each read
+        with the assistant message before it."""
+        persona, question = cls(), None
+        for message in messages:
+            if message.type == "human":
+                persona.update(str(message.content), question)
+            question = str(message.content) if message.type == "ai" else None
+        return persona
+
+    def tool_args(self) -> dict:
+        """Known values under the argument names the retirement tools use."""
+        return {arg: getattr(self, name) for name, arg in TOOL_ARGUMENTS.items() if getattr(self, name) is not None}
+
+    def to_prompt(self) -> str:
+        """Compact block for the system prompt; empty when nothing is known yet."""
+        parts = []
+        if self.age is not None:
+            parts.append(f"age {self.age:g}")
+        if self.annual_income is not None:
+            parts.append(f"income ${self.annual_income:,.0f}/yr")
+        if self.current_savings is not None:
+            parts.append(f"savings ${self.current_savings:,.0f}")
+        if self.monthly_contribution is not None:
+            parts.append(f"saves ${self.monthly_contribution:,.0f}/mo")
+        if self.expected_return is not None:
+            parts.append(f"expected return {self.expected_return*100:g}%")
+        if self.retirement_age is not None:
+            parts.append(f"retire at {self.retirement_age:g}")
+        if self.monthly_spending is not None:
+            parts.append(f"retirement spending ${self.monthly_spending:,.0f}/mo")
+        if self.goals:
+            parts.append("goals: " + ", ".join(self.goals))
+        if not parts:
+            return ""
+        return "Known persona (from earlier turns; use unless the user changes it): " + "; ".join(parts)
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+# Persona of the turn being processed; tools read it to fill in arguments the LLM left out
+current_persona: ContextVar[Optional[Persona]] = ContextVar("current_persona", default=None)
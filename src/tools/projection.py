@@ -0,0 +1,109 @@
+# tools/projection.py - Month-by-month retirement projection
+
+"""Deterministic accumulation + drawdown projection for a single persona.
+
+The whole path is computed in one vectorized pass. With a constant monthly
+rate ``r`` and end-of-month cash flows ``f_k`` (contributions before
+retirement, inflated withdrawals after), the balance after month ``t`` is
+
+    B_t = (1 + r)^t * (B_0 + sum_{k<=t} f_k / (1 + r)^k)
+
+so the recurrence collapses to a cumulative sum instead of a Python loop.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from . import batch
+
+
+@dataclass(frozen=True)
+class RetirementProjection:
+    ages: np.ndarray                  # age at the end of each month
+    balances: np.ndarray              # end-of-month balance, 0 once savings run out
+    cash_flows: np.ndarray            # +contribution / -withdrawal for each month
+    retirement_month: int             # number of accumulation months
+    balance_at_retirement: float
+    depletion_age: Optional[float]    # None when savings last to life expectancy
+    final_balance: float
+    required_savings: float           # nest egg needed at retirement to fund spending
+    required_monthly_contribution: Optional[float]  # None when already retired
+
+    @property
+    def shortfall(self) -> float:
+        return max(self.required_savings - self.balance_at_retirement, 0.0)
+
+
+def project_retirement(
+    current_age: float,
+    current_savings: float,
+    monthly_contribution: float,
+    annual_return: float,
+    retirement_age: float,
+    monthly_spending: float,
+    inflation: float = 0.0,
+    life_expectancy: float = 95,
+) -> RetirementProjection:
+    """Project savings month by month from today to ``life_expectancy``.
+
+    ``annual_return`` is compounded monthly (``annual_return / 12`` per month),
+    matching the monthly annuity convention used by ``fv_annuity``.
+    ``monthly_spending`` is in today's dollars and grows with ``inflation``
+    from now until it is withdrawn.
+    """
+    if retirement_age < current_age:
+        raise ValueError("retirement_age must not be before current_age")
+    if life_expectancy <= retirement_age:
+        raise ValueError("life_expectancy must be after retirement_age")
+
+    total_months = int(round((life_expectancy - current_age) * 12))
+    if total_months < 1:
+        raise ValueError("life_expectancy must be at least a month after current_age")
+    retirement_month = int(round((retirement_age - current_age) * 12))
+    r = annual_return / 12
+
+    months = np.arange(1, total_months + 1)
+    growth = (1 + r) ** months
+    retired = months > retirement_month
+    spending = monthly_spending * (1 + inflation) ** (months / 12)
+    cash_flows = np.where(retired, -spending, monthly_contribution)
+
+    balances = growth * (current_savings + np.cumsum(cash_flows / growth))
+
+    depleted = retired & (balances < 0)
+    depletion_age = None
+    if depleted.any():
+        first = int(np.argmax(depleted))
+        balances[first:] = 0.0
+        depletion_age = current_age + months[first] / 12
+
+    if retirement_month:
+        balance_at_retirement = float(balances[retirement_month - 1])
+    else:
+        balance_at_retirement = float(current_savings)
+
+    # Present value at retirement of the inflated withdrawal stream
+    drawdown = months[retired] - retirement_month
+    required_savings = float(np.sum(spending[retired] / (1 + r) ** drawdown))
+
+    required_monthly_contribution = None
+    if retirement_month:
+        grown_savings = float(batch.future_value(current_savings, r, retirement_month))
+        annuity_factor = float(batch.fv_annuity(1.0, r, retirement_month))
+        required_monthly_contribution = max(
+            (required_savings - grown_savings) / annuity_factor, 0.0
+        )
+
+    return RetirementProjection(
+        ages=current_age + months / 12,
+        balances=balances,
+        cash_flows=cash_flows,
+        retirement_month=retirement_month,
+        balance_at_retirement=balance_at_retirement,
+        depletion_age=depletion_age,
+        final_balance=float(balances[-1]),
+        required_savings=required_savings,
+        required_monthly_contribution=required_monthly_contribution,
+    )
@@ -0,0 +1,189 @@
+# tools/simulation.py - Monte Carlo retirement success simulation
+
+"""Stochastic counterpart of ``tools/projection.py``.
+
+Monthly returns (and optionally monthly inflation) are drawn from normal
+distributions and every path is evaluated with the same cumulative-sum
+closed form as the deterministic projection, as ``(paths, months)`` matrix
+operations.
+
+Paths are generated in fixed-size blocks, each with its own child of
+``SeedSequence(seed)``. Blocks are independent of how they are scheduled, so
+a given seed produces identical results whether the blocks run inline or are
+split across any number of worker processes.
+
+Worker processes come from one long-lived pool, created on first use with the
+``forkserver`` start method (``spawn`` where it is unavailable): the caller is
+usually a thread of a multi-threaded server, where ``fork`` is unsafe.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+
+BLOCK_SIZE = 2048                # paths per RNG stream / unit of work
+PARALLEL_MIN_PATHS = 50_000      # below this a process pool costs more than it saves
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _process_pool() -> ProcessPoolExecutor:
+    """The shared pool of ``os.cpu_count()`` worker processes, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                        mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+@dataclass(frozen=True)
+class _Scenario:
+    current_savings: float
+    monthly_contribution: float
+    annual_return: float
+    return_volatility: float
+    monthly_spending: float
+    inflation: float
+    inflation_volatility: float
+    retirement_month: int
+    total_months: int
+
+
+@dataclass(frozen=True)
+class MonteCarloResult:
+    n_paths: int
+    success_rate: float                   # share of paths that never run out of money
+    percentiles: tuple                    # e.g. (10, 50, 90)
+    balance_at_retirement: np.ndarray     # balance at retirement for each percentile
+    final_balance: np.ndarray             # balance at life expectancy for each percentile
+    median_depletion_age: Optional[float] # among failed paths, None if none failed
+
+
+def _simulate_block(scenario: _Scenario, seed: np.random.SeedSequence, n_paths: int):
+    """Simulate one block of paths; returns per-path arrays."""
+    rng = np.random.default_rng(seed)
+    shape = (n_paths, scenario.total_months)
+
+    monthly_returns = rng.normal(
+        scenario.annual_return / 12, scenario.return_volatility / np.sqrt(12), shape
+    )
+    # A month can lose at most 99% so the growth index stays positive
+    growth = np.cumprod(1 + np.maximum(monthly_returns, -0.99), axis=1)
+
+    months = np.arange(1, scenario.total_months + 1)
+    if scenario.inflation_volatility > 0:
+        monthly_inflation = rng.normal(
+            scenario.inflation / 12, scenario.inflation_volatility / np.sqrt(12), shape
+        )
+        price_index = np.cumprod(1 + monthly_inflation, axis=1)
+    else:
+        price_index = (1 + scenario.inflation) ** (months / 12)
+
+    retired = months > scenario.retirement_month
+    cash_flows = np.where(retired, -scenario.monthly_spending * price_index,
+                          scenario.monthly_contribution)
+    balances = growth * (scenario.current_savings + np.cumsum(cash_flows / growth, axis=1))
+
+    depleted = retired & (balances < 0)
+    failed = depleted.any(axis=1)
+    depletion_month = np.where(failed, np.argmax(depleted, axis=1) + 1, 0)
+
+    if scenario.retirement_month:
+        at_retirement = balances[:, scenario.retirement_month - 1]
+    else:
+        at_retirement = np.full(n_paths, float(scenario.current_savings))
+    final = np.where(failed, 0.0, balances[:, -1])
+    return failed, depletion_month, at_retirement, final
+
+
+def _simulate_blocks(scenario: _Scenario, seeds: list, sizes: list) -> list:
+    """Simulate consecutive blocks in one worker."""
+    return [_simulate_block(scenario, s, n) for s, n in zip(seeds, sizes)]
+
+
+def simulate_retirement(
+    current_age: float,
+    current_savings: float,
+    monthly_contribution: float,
+    annual_return: float,
+    retirement_age: float,
+    monthly_spending: float,
+    inflation: float = 0.0,
+    life_expectancy: float = 95,
+    return_volatility: float = 0.15,
+    inflation_volatility: float = 0.0,
+    n_paths: int = 10_000,
+    seed: int = 42,
+    workers: Optional[int] = None,
+    percentiles: Sequence[float] = (10, 50, 90),
+) -> MonteCarloResult:
+    """Estimate the probability that savings last until ``life_expectancy``.
+
+    Conventions match ``project_retirement``: end-of-month cash flows and
+    spending in today's dollars. ``return_volatility`` and
+    ``inflation_volatility`` are annualized standard deviations.
+
+    ``workers`` defaults to one process for small runs and ``os.cpu_count()``
+    once ``n_paths`` reaches ``PARALLEL_MIN_PATHS``; with more than one, the
+    blocks are split into that many consecutive runs on the shared pool.
+    """
+    if retirement_age < current_age:
+        raise ValueError("retirement_age must not be before current_age")
+    if life_expectancy <= retirement_age:
+        raise ValueError("life_expectancy must be after retirement_age")
+    if n_paths < 1:
+        raise ValueError("n_paths must be at least 1")
+    if int(round((life_expectancy - current_age) * 12)) < 1:
+        raise ValueError("life_expectancy must be at least a month after current_age")
+
+    scenario = _Scenario(
+        current_savings=current_savings,
+        monthly_contribution=monthly_contribution,
+        annual_return=annual_return,
+        return_volatility=return_volatility,
+        monthly_spending=monthly_spending,
+        inflation=inflation,
+        inflation_volatility=inflation_volatility,
+        retirement_month=int(round((retirement_age - current_age) * 12)),
+        total_months=int(round((life_expectancy - current_age) * 12)),
+    )
+
+    sizes = [BLOCK_SIZE] * (n_paths // BLOCK_SIZE)
+    if n_paths % BLOCK_SIZE:
+        sizes.append(n_paths % BLOCK_SIZE)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    if workers is None:
+        workers = (os.cpu_count() or 1) if n_paths >= PARALLEL_MIN_PATHS else 1
+    workers = min(workers, len(sizes))
+
+    if workers > 1:
+        bounds = np.linspace(0, len(sizes), workers + 1).astype(int)
+        runs = [_process_pool().submit(_simulate_blocks, scenario, seeds[lo:hi], sizes[lo:hi])
+                for lo, hi in zip(bounds[:-1], bounds[1:])]
+        blocks = [block for run in runs for block in run.result()]
+    else:
+        blocks = _simulate_blocks(scenario, seeds, sizes)
+
+    failed, depletion_month, at_retirement, final = (np.concatenate(parts) for parts in zip(*blocks))
+
+    median_depletion_age = None
+    if failed.any():
+        median_depletion_age = current_age + float(np.median(depletion_month[failed])) / 12
+
+    return MonteCarloResult(
+        n_paths=n_paths,
+        success_rate=float(1 - failed.mean()),
+        percentiles=tuple(percentiles),
+        balance_at_retirement=np.percentile(at_retirement, percentiles),
+        final_balance=np.percentile(final, percentiles),
+        median_depletion_age=median_depletion_age,
+    )
@@ -0,0 +1,226 @@
+"""Structured logging, request ids and per-stage spans.
+
+Log records go through a QueueHandler, so callers only pay for building the
+record; a QueueListener thread formats and writes them (JSON lines by
+default). Every record carries the id of the request it belongs to.
+
+Each agent stage runs inside a span. A span feeds the stage histogram in
+``metrics``, is logged at DEBUG level and is added to the request's trace,
+which is logged once at INFO level when the request finishes.
+"""
+
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+
+import metrics
+import profiling
+
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+# Spans of the current request, in the order they finish (None outside a request)
+current_trace: ContextVar[Optional[list]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[str]] = ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+logger = logging.getLogger("tracing")
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps records with the request and span they were logged from.
+
+    Attached to the QueueHandler, so it runs in the caller's context rather
+    than on the listener thread.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        record.span_id = _current_span.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request/span ids and any extras."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None, stream=None) -> None:
+    """Route the root logger through a queue to a background writer thread.
+
+    ``level`` defaults to LOG_LEVEL (INFO) and ``fmt`` to LOG_FORMAT: ``json``
+    (the default) or ``text``. Calling it again replaces the previous setup.
+    """
+    global _listener
+    shutdown_logging()
+
+    fmt = fmt or os.getenv("LOG_FORMAT", "json")
+    output = logging.StreamHandler(stream or sys.stderr)
+    if fmt == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(records)
+    handler.addFilter(RequestContextFilter())
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.handlers = [h for h in root.handlers if not isinstance(h, logging.handlers.QueueHandler)]
+    root.addHandler(handler)
+    root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class Span:
+    """Times a block as one stage of the current request.
+
+    A plain class rather than @contextmanager: spans wrap every stage of every
+    request. ``histogram`` is a labelled metrics child to observe the duration into.
+    """
+
+    __slots__ = ("name", "fields", "histogram", "span_id", "_parent", "_start")
+
+    def __init__(self, name: str, histogram=None, **fields):
+        self.name = name
+        self.fields = fields
+        self.histogram = histogram
+
+    def __enter__(self) -> "Span":
+        self.span_id = f"{next(_span_ids):x}"
+        self._parent = _current_span.get()
+        _current_span.set(self.span_id)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        elapsed = time.perf_counter() - self._start
+        # Restore rather than reset: async generators may finish in another context
+        _current_span.set(self._parent)
+        if self.histogram is not None:
+            self.histogram.observe(elapsed)
+        entry = {"span": self.name, "span_id": self.span_id, "parent_id": self._parent,
+                 "duration_ms": round(elapsed * 1000, 3), **self.fields}
+        if exc_type is not None:
+            entry["error"] = exc_type.__name__
+        trace = current_trace.get()
+        if trace is not None:
+            trace.append(entry)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("span finished", extra=entry)
+
+
+def span(name: str, **fields) -> Span:
+    return Span(name, **fields)
+
+
+def stage(name: str) -> Span:
+    """Span for one agent stage, also recorded in the ``chat_stage_seconds`` histogram."""
+    return Span("stage", histogram=metrics.STAGE_SECONDS.labels(stage=name), stage=name)
+
+
+def _header_id(value: Optional[str]) -> Optional[str]:
+    # Client-supplied ids end up in logs and file names: keep them short and plain
+    if value and len(value) <= 64 and all(c.isalnum() or c in "-_." for c in value):
+        return value
+    return None
+
+
+class RequestContextMiddleware:
+    """ASGI middleware giving each HTTP request an id, a trace and, on demand, a profile.
+
+    The id comes from the X-Request-ID header or is generated, and is echoed
+    back in the response headers. When the request finishes one INFO record
+    logs its method, path, status, duration and spans. Profiling follows
+    ``profiling.choose_mode``; a profiled response carries an X-Profile header
+    and its report is stored in ``profiles`` under the request id.
+    """
+
+    def __init__(self, app, profiles, sample_rate: float = 0.0, default_mode: str = "cprofile",
+                 allow_header: bool = True, stack_interval: float = 0.005,
+                 skip_paths: tuple = ("/metrics", "/debug/")):
+        self.app = app
+        self.profiles = profiles
+        self.sample_rate = sample_rate
+        self.default_mode = default_mode
+        self.allow_header = allow_header
+        self.stack_interval = stack_interval
+        self.skip_paths = skip_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.skip_paths):
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        rid = _header_id(headers.get("x-request-id")) or new_request_id()
+        trace: list = []
+        id_token, trace_token = request_id.set(rid), current_trace.set(trace)
+
+        mode = profiling.choose_mode(headers.get("x-profile") if self.allow_header else None,
+                                     self.sample_rate, self.default_mode)
+        profiler = profiling.try_start(mode, self.stack_interval) if mode else None
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                extra = [(b"x-request-id", rid.encode())]
+                if profiler is not None:
+                    extra.append((b"x-profile", mode.encode()))
+                message = {**message, "headers": list(message.get("headers", [])) + extra}
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            duration_ms = round((time.perf_counter() - start) * 1000, 3)
+            if profiler is not None:
+                self.profiles.add(profiling.Profile(rid, mode, scope["path"], duration_ms,
+                                                    report=profiling.finish(profiler)))
+            logger.info("request finished", extra={
+                "method": scope["method"], "path": scope["path"], "status": status,
+                "duration_ms": duration_ms, "spans": trace, "profile": mode if profiler else None,
+            })
+            request_id.reset(id_token)
+            current_trace.reset(trace_token)
@@ -0,0 +1,208 @@
+"""
+test_admission.py - Tests for LLM concurrency limits, the wait queue and per-client rate limits
+Run with: pytest test_admission.py -v
+"""
+
+import asyncio
+import threading
+import time
+import sys
+import os
+import httpx
+import pytest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+import chat_endpoint
+import financial_agent
+import metrics
+from admission import ConcurrencyLimiter, Overloaded, RateLimiter
+from chat_endpoint import app
+from llm_backends import ScriptedLLM, set_backend
+
+
+@pytest.fixture
+def llm():
+    backend = ScriptedLLM(latency=0.1)
+    set_backend(backend)
+    financial_agent.tool_cache.clear()
+    yield backend
+    set_backend(None)
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    """One LLM call at a time and no queue: a second concurrent call is rejected."""
+    small = ConcurrencyLimiter(max_concurrent=1, max_queue=0, queue_timeout=1)
+    monkeypatch.setattr(financial_agent, "llm_limiter", small)
+    monkeypatch.setattr(chat_endpoint, "llm_limiter", small)
+    return small
+
+
+def client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+class TestConcurrencyLimiter:
+    """Bounded concurrency with a bounded, time-limited wait queue"""
+
+    def test_caps_concurrent_calls(self):
+        limiter = ConcurrencyLimiter(max_concurrent=2, max_queue=10, queue_timeout=1)
+        running, peak = 0, 0
+
+        async def call():
+            nonlocal running, peak
+            async with limiter.slot():
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.02)
+                running -= 1
+
+        async def main():
+            await asyncio.gather(*(call() for _ in range(6)))
+
+        asyncio.run(main())
+        assert peak == 2
+        assert limiter.active == 0 and limiter.queued == 0
+
+    def test_full_queue_rejects_immediately(self):
+        limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=1, queue_timeout=5)
+
+        async def hold():
+            async with limiter.slot():
+                await asyncio.sleep(0.05)
+
+        async def main():
+            holder = asyncio.ensure_future(hold())
+            waiter = asyncio.ensure_future(hold())
+            await asyncio.sleep(0.01)
+            start = time.perf_counter()
+            with pytest.raises(Overloaded) as rejected:
+                await limiter.aacquire()
+            elapsed = time.perf_counter() - start
+            await asyncio.gather(holder, waiter)
+            return rejected.value, elapsed
+
+        rejected, elapsed = asyncio.run(main())
+        assert rejected.reason == "queue_full" and rejected.retry_after >= 1
+        assert elapsed < 0.01
+
+    def test_queue_timeout(self):
+        limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=5, queue_timeout=0.02)
+
+        async def main():
+            async with limiter.slot():
+                with pytest.raises(Overloaded) as rejected:
+                    await limiter.aacquire()
+            return rejected.value
+
+        assert asyncio.run(main()).reason == "queue_timeout"
+        assert limiter.active == 0 and limiter.queued == 0
+
+    def test_cancelled_waiter_leaves_the_queue(self):
+        limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=5, queue_timeout=1)
+
+        async def main():
+            async with limiter.slot():
+                waiter = asyncio.ensure_future(limiter.aacquire())
+                await asyncio.sleep(0.01)
+                assert limiter.queued == 1
+                waiter.cancel()
+                await asyncio.sleep(0)
+            async with limiter.slot():
+                pass
+
+        asyncio.run(main())
+        assert limiter.active == 0 and limiter.queued == 0
+
+    def test_threads_and_tasks_share_slots(self):
+        limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=5, queue_timeout=1)
+        order = []
+
+        def sync_call():
+            with limiter:
+                order.append("thread")
+
+        async def main():
+            async with limiter.slot():
+                thread = threading.Thread(target=sync_call)
+                thread.start()
+                await asyncio.sleep(0.02)
+                order.append("task")
+            await asyncio.to_thread(thread.join)
+
+        asyncio.run(main())
+        assert order == ["task", "thread"]
+
+
+class TestRateLimiter:
+    """Token bucket per client"""
+
+    def test_burst_then_reject(self):
+        limiter = RateLimiter(rate=1, burst=2)
+        limiter.check("a")
+        limiter.check("a")
+        with pytest.raises(Overloaded) as rejected:
+            limiter.check("a")
+        assert rejected.value.reason == "rate_limited" and rejected.value.retry_after == 1
+        limiter.check("b")
+
+    def test_refills_over_time(self):
+        limiter = RateLimiter(rate=100, burst=1)
+        limiter.check("a")
+        time.sleep(0.02)
+        limiter.check("a")
+
+    def test_zero_rate_disables(self):
+        limiter = RateLimiter(rate=0, burst=1)
+        for _ in range(100):
+            limiter.check("a")
+
+    def test_forgets_least_recent_clients(self):
+        limiter = RateLimiter(rate=1, burst=1, max_clients=2)
+        for name in "abc":
+            limiter.check(name)
+        limiter.check("a")   # forgotten, so it starts with a full bucket again
+
+
+class TestAPI:
+    """Fast 429/503 responses with Retry-After"""
+
+    def test_rate_limited_client_gets_429(self, llm, monkeypatch):
+        monkeypatch.setattr(chat_endpoint, "rate_limiter", RateLimiter(rate=0.01, burst=1))
+
+        async def main():
+            async with client() as c:
+                first = await c.post("/chat", json={"message": "First", "chat_history": []})
+                second = await c.post("/chat", json={"message": "Second", "chat_history": []})
+                return first, second
+
+        first, second = asyncio.run(main())
+        assert first.status_code == 200
+        assert second.status_code == 429 and int(second.headers["retry-after"]) >= 1
+
+    def test_overload_gets_503(self, llm, limiter):
+        rejected_before = metrics.ADMISSION_REJECTIONS.labels(reason="queue_full").value
+
+        async def main():
+            async with client() as c:
+                return await asyncio.gather(*(c.post("/chat", json={"message": f"Question {i}", "chat_history": []})
+                                              for i in range(3)))
+
+        statuses = sorted(r.status_code for r in asyncio.run(main()))
+        assert statuses == [200, 503, 503]
+        assert metrics.ADMISSION_REJECTIONS.labels(reason="queue_full").value == rejected_before + 2
+
+    def test_overloaded_stream_reports_retry_after(self, llm, limiter):
+        async def main():
+            async with limiter.slot():
+                async with client() as c:
+                    return await c.post("/chat/stream", json={"message": "Hi", "chat_history": []})
+
+        response = asyncio.run(main())
+        assert response.status_code == 503 and "retry-after" in response.headers
+
+
+if __name__ == "__main__":
+
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,183 @@
+"""
+test_agent.py - Offline tests for the agent loop and the API, using the scripted LLM backend
+Run with: pytest test_agent.py -v
+"""
+
+import asyncio
+import json
+import time
+import pytest
+import sys
+import os
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+import financial_agent
+from caching import LLMResponseCache
+from chat_endpoint import app
+from llm_backends import ScriptedLLM, set_backend
+
+SLOW, FAST = 0.4, 0.1
+# The slow call comes first, so its result is the last one ready
+PARALLEL_CALLS = [{"name": "slow_tool", "args": {"x": 1}, "id": "slow"},
+                  {"name": "fast_tool", "args": {"x": 2}, "id": "fast"}]
+FV_CALL = {"name": "future_value", "args": {"pv": 1000, "r": 0.05, "n": 10}}
+R72_CALL = {"name": "rule_of_72", "args": {"r": 0.08}}
+QUESTION = "How is my money doing?"
+
+
+@pytest.fixture
+def llm():
+    backend = ScriptedLLM(tool_calls=[FV_CALL, R72_CALL])
+    set_backend(backend)
+    financial_agent.tool_cache.clear()
+    yield backend
+    set_backend(None)
+
+
+@pytest.fixture
+def timed_tools(monkeypatch):
+    @tool
+    def slow_tool(x: int) -> str:
+        """Sleep, then echo x."""
+        time.sleep(SLOW)
+        return f"slow {x}"
+
+    @tool
+    def fast_tool(x: int) -> str:
+        """Sleep briefly, then echo x."""
+        time.sleep(FAST)
+        return f"fast {x}"
+
+    monkeypatch.setitem(financial_agent.TOOLS, "slow_tool", slow_tool)
+    monkeypatch.setitem(financial_agent.TOOLS, "fast_tool", fast_tool)
+    financial_agent.tool_cache.clear()
+
+
+async def collect(stream):
+    return [event async for event in stream]
+
+
+class TestAgentLoop:
+    """Tests for ai_invoke / ai_ainvoke / ai_astream"""
+
+    def test_tool_round_trip(self, llm):
+        """Test one turn calls the LLM, runs every tool and answers with the results"""
+        usage = {}
+        answer = financial_agent.ai_invoke(QUESTION, [], usage=usage)
+        assert "Future Value: $1628.89" in answer
+        assert "double in approximately 9.0 years" in answer
+        assert llm.calls == 2
+        assert usage["llm_calls"] == 2 and usage["input_tokens"] > 0
+
+    def test_async_matches_sync(self, llm):
+        """Test ai_ainvoke gives the same answer as ai_invoke"""
+        assert asyncio.run(financial_agent.ai_ainvoke(QUESTION, [])) == financial_agent.ai_invoke(QUESTION, [])
+
+    def test_tool_results_are_cached(self, llm):
+        """Test repeated tool calls are served from the tool cache"""
+        financial_agent.ai_invoke(QUESTION, [])
+        financial_agent.ai_invoke(QUESTION, [])
+        assert financial_agent.tool_cache.hits == 2
+
+    def test_llm_cache(self, llm, monkeypatch):
+        """Test an identical turn is answered from the LLM cache"""
+        monkeypatch.setattr(financial_agent, "llm_cache", LLMResponseCache(maxsize=16))
+        first = financial_agent.ai_invoke(QUESTION, [])
+        assert financial_agent.ai_invoke(QUESTION, []) == first
+        assert llm.calls == 2
+
+    def test_fast_path_skips_llm(self, llm):
+        """Test a fully specified formula question never reaches the LLM"""
+        usage = {}
+        answer = financial_agent.ai_invoke("What is the future value of $1000 invested at 5% for 10 years?", [],
+                                           usage=usage)
+        assert answer.startswith("Future Value: $1628.89")
+        assert usage["fast_path"] == "future_value"
+        assert llm.calls == 0
+
+    def test_persona_reaches_prompt_and_tools(self, llm):
+        """Test the persona is injected into the prompt and fills tool arguments"""
+        llm.tool_calls = [{"name": "retirement_projection", "args": {"retirement_age": 65}}]
+        history = [{"role": "user", "content": "I'm 35, I have $50,000 saved and save $1,000/month"},
+                   {"role": "assistant", "content": "Thanks! What return do you expect?"}]
+        answer = financial_agent.ai_invoke("6% return, and I'll spend $4,000 per month in retirement", history)
+        assert "Retirement Projection (Age 35 -> 65" in answer
+
+    def test_stream_events(self, llm):
+        """Test the stream reports tools as they run, then tokens, then done with usage"""
+        events = asyncio.run(collect(financial_agent.ai_astream(QUESTION, [])))
+        types = [event["type"] for event in events]
+        assert types[:4] == ["tool_start", "tool_start", "tool_end", "tool_end"]
+        assert set(types[4:-1]) == {"token"} and types[-1] == "done"
+        assert "".join(e["content"] for e in events if e["type"] == "token") == events[-1]["message"]
+        assert events[-1]["usage"]["llm_calls"] == 2
+
+
+class TestParallelTools:
+    """Tool calls of one step run concurrently and come back in the order they were made"""
+
+    def test_sync(self, timed_tools):
+        start = time.perf_counter()
+        results = financial_agent._execute_tool_calls(PARALLEL_CALLS)
+        elapsed = time.perf_counter() - start
+        assert [(m.tool_call_id, m.content) for m in results] == [("slow", "slow 1"), ("fast", "fast 2")]
+        assert elapsed < SLOW + FAST
+
+    def test_async(self, timed_tools):
+        start = time.perf_counter()
+        results = asyncio.run(financial_agent._aexecute_tool_calls(PARALLEL_CALLS))
+        elapsed = time.perf_counter() - start
+        assert [(m.tool_call_id, m.content) for m in results] == [("slow", "slow 1"), ("fast", "fast 2")]
+        assert elapsed < SLOW + FAST
+
+
+class TestAPI:
+    """Tests for the FastAPI endpoints"""
+
+    def test_chat(self, llm):
+        """Test /chat answers and reports usage"""
+        with TestClient(app) as client:
+            response = client.post("/chat", json={"message": QUESTION, "chat_history": []})
+        assert response.status_code == 200
+        assert "Future Value: $1628.89" in response.json()["message"]
+        assert response.json()["usage"]["llm_calls"] == 2
+
+    def test_session_keeps_history(self, llm):
+        """Test a session sends the earlier turns to the LLM"""
+        seen, plain = [], ScriptedLLM()
+        llm.responder = lambda messages: seen.append(messages) or plain.respond(messages)
+        with TestClient(app) as client:
+            first = client.post("/sessions/chat", json={"message": "I'm 40"}).json()
+            client.post("/sessions/chat", json={"message": "Go on", "session_id": first["session_id"]})
+            assert client.delete(f"/sessions/{first['session_id']}").status_code == 200
+            missing = client.post("/sessions/chat", json={"message": "Hi", "session_id": first["session_id"]})
+        assert [m.content for m in seen[-1] if m.type == "human"] == ["I'm 40", "Go on"]
+        assert missing.status_code == 404
+
+    def test_session_answers_fill_the_persona(self, llm):
+        """Test short answers to the assistant's questions reach the persona block of the prompt"""
+        seen, questions = [], iter(["How old are you?", "How much do you currently have saved?", "Thanks!"])
+        llm.responder = lambda messages: seen.append(messages) or AIMessage(content=next(questions))
+        with TestClient(app) as client:
+            first = client.post("/sessions/chat", json={"message": "Help me plan my retirement"}).json()
+            for answer in ["35", "$50,000"]:
+                client.post("/sessions/chat", json={"message": answer, "session_id": first["session_id"]})
+        persona_block = [m.content for m in seen[-1] if m.type == "system" and m.content.startswith("Known persona")]
+        assert persona_block and persona_block[0].endswith("age 35; savings $50,000")
+
+    def test_session_stream(self, llm):
+        """Test the streaming session endpoint announces the session first"""
+        with TestClient(app) as client:
+            response = client.post("/sessions/chat/stream", json={"message": QUESTION})
+        events = [json.loads(line) for line in response.text.splitlines()]
+        assert events[0]["type"] == "session"
+        assert events[-1]["type"] == "done"
+
+
+if __name__ == "__main__":
+
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,186 @@
+"""
+test_agent_graph.py - Tests for the agent graph: the tool loop, its step budget and checkpointed conversations
+Run with: pytest test_agent_graph.py -v
+"""
+
+import asyncio
+import sys
+import os
+import httpx
+import pytest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+import agent_graph
+import financial_agent
+import metrics
+from chat_endpoint import app
+from llm_backends import ScriptedLLM, set_backend
+from prompts import Financial_planner
+
+FV_CALL = {"name": "future_value", "args": {"pv": 1000, "r": 0.05, "n": 10}}
+R72_CALL = {"name": "rule_of_72", "args": {"r": 0.08}}
+QUESTION = "How is my money doing?"
+
+
+class Planner:
+    """Responder asking for one tool per step from ``steps``, then answering with every result so far."""
+
+    def __init__(self, *steps: dict):
+        self.steps = steps
+        self.requests = []
+
+    def __call__(self, messages: list) -> AIMessage:
+        self.requests.append(messages)
+        turn = messages[agent_graph.turn_start(messages):]
+        done = sum(1 for m in turn if m.type == "tool")
+        if done < len(self.steps):
+            return AIMessage(content="", tool_calls=[{**self.steps[done], "id": f"call_{done}"}])
+        return AIMessage(content="Results: " + " | ".join(str(m.content) for m in turn if m.type == "tool"))
+
+
+@pytest.fixture
+def planner():
+    responder = Planner(FV_CALL, R72_CALL)
+    set_backend(ScriptedLLM(responder=responder))
+    financial_agent.tool_cache.clear()
+    yield responder
+    set_backend(None)
+
+
+async def collect(stream):
+    return [event async for event in stream]
+
+
+class TestToolLoop:
+    """The LLM and tool nodes loop until the model answers or the step budget runs out"""
+
+    def test_second_tool_step(self, planner):
+        answer = financial_agent.ai_invoke(QUESTION, [])
+        assert "Future Value: $1628.89" in answer and "9.0 years" in answer
+        assert len(planner.requests) == 3
+
+    def test_every_call_has_the_system_prompt(self, planner):
+        asyncio.run(financial_agent.ai_ainvoke(QUESTION, [{"role": "user", "content": "I'm 35"}]))
+        assert len(planner.requests) == 3
+        for messages in planner.requests:
+            assert messages[0].type == "system" and messages[0].content == Financial_planner
+            assert [m.content for m in messages if m.type == "human"] == ["I'm 35", QUESTION]
+
+    def test_stream_reports_each_round(self, planner):
+        events = asyncio.run(collect(financial_agent.ai_astream(QUESTION, [])))
+        assert [e["name"] for e in events if e["type"] == "tool_end"] == ["future_value", "rule_of_72"]
+        assert "9.0 years" in events[-1]["message"]
+
+    def test_step_budget(self, planner):
+        planner.steps = [FV_CALL] * 10
+        exhausted = metrics.AGENT_STEP_LIMIT.labels().value
+        answer = financial_agent.ai_invoke(QUESTION, [])
+        assert answer == financial_agent.STEP_LIMIT_REPLY
+        assert len(planner.requests) == financial_agent.AGENT_MAX_STEPS
+        assert metrics.AGENT_STEP_LIMIT.labels().value == exhausted + 1
+
+
+class TestSplitTurn:
+    """Earlier turns lose their tool traffic and are capped"""
+
+    def test_drops_tool_messages_of_earlier_turns(self):
+        thread = [
+            HumanMessage(content="q1", id="1"),
+            AIMessage(content="", tool_calls=[{**FV_CALL, "id": "c"}], id="2"),
+            ToolMessage(content="r", tool_call_id="c", id="3"),
+            AIMessage(content="a1", id="4"),
+            HumanMessage(content="q2", id="5"),
+        ]
+        history, current, removals = agent_graph.split_turn(thread, max_messages=10)
+        assert [m.content for m in history] == ["q1", "a1"]
+        assert [m.content for m in current] == ["q2"]
+        assert [r.id for r in removals] == ["2", "3"]
+
+        history, _, removals = agent_graph.split_turn(thread, max_messages=1)
+        assert [m.content for m in history] == ["a1"]
+        assert [r.id for r in removals] == ["2", "3", "1"]
+
+    def test_drops_unanswered_questions(self):
+        thread = [
+            HumanMessage(content="q1", id="1"),
+            AIMessage(content="", tool_calls=[{**FV_CALL, "id": "c"}], id="2"),
+            ToolMessage(content="r", tool_call_id="c", id="3"),
+            HumanMessage(content="q1", id="4"),
+            AIMessage(content="a1", id="5"),
+            HumanMessage(content="q2", id="6"),
+        ]
+        history, _, removals = agent_graph.split_turn(thread, max_messages=10, drop_unanswered=True)
+        assert [m.id for m in history] == ["4", "5"]
+        assert [r.id for r in removals] == ["1", "2", "3"]
+        # Client-supplied history is left as it is
+        history, _, _ = agent_graph.split_turn(thread, max_messages=10)
+        assert [m.id for m in history] == ["1", "4", "5"]
+
+
+class TestCheckpoints:
+    """Conversations resume from their checkpointed thread"""
+
+    def test_turn_resumes_saved_thread(self, planner):
+        financial_agent.ai_invoke(QUESTION, [], conversation_id="resume")
+        answer = financial_agent.ai_invoke("And after that?", [], conversation_id="resume")
+        assert "9.0 years" in answer
+        sent = planner.requests[-1]
+        assert [m.type for m in sent[:4]] == ["system", "human", "ai", "human"]
+        assert sent[1].content == QUESTION and sent[2].content.startswith("Results:")
+        # Only the latest checkpoint of the thread is kept
+        assert len(financial_agent.checkpointer.storage["resume"][""]) == 1
+        financial_agent.forget_conversation("resume")
+        assert financial_agent.checkpointer.get_tuple({"configurable": {"thread_id": "resume"}}) is None
+
+    def test_history_seeds_a_new_thread_only(self, planner):
+        history = [{"role": "user", "content": "Old question"}, {"role": "assistant", "content": "Old answer"}]
+        asyncio.run(financial_agent.ai_ainvoke(QUESTION, history, conversation_id="seeded"))
+        asyncio.run(financial_agent.ai_ainvoke("Next", history, conversation_id="seeded"))
+        humans = [m.content for m in planner.requests[-1] if m.type == "human"]
+        assert humans == ["Old question", QUESTION, "Next"]
+        financial_agent.forget_conversation("seeded")
+
+    def test_fast_path_turn_is_saved(self, planner):
+        question = "What is the future value of $1000 invested at 5% for 10 years?"
+        financial_agent.ai_invoke(question, [], conversation_id="fast")
+        financial_agent.ai_invoke(QUESTION, [], conversation_id="fast")
+        sent = planner.requests[0]
+        assert sent[1].content == question and sent[2].content.startswith("Future Value: $1628.89")
+        financial_agent.forget_conversation("fast")
+
+    def test_failed_turn_leaves_no_trace(self, planner):
+        calls = []
+
+        def fail_second_call(messages):
+            calls.append(1)
+            if len(calls) == 2:
+                raise ConnectionError("provider down")
+            return planner(messages)
+
+        set_backend(ScriptedLLM(responder=fail_second_call))
+        with pytest.raises(ConnectionError):
+            asyncio.run(financial_agent.ai_ainvoke(QUESTION, [], conversation_id="failed"))
+        asyncio.run(financial_agent.ai_ainvoke(QUESTION, [], conversation_id="failed"))
+        asyncio.run(financial_agent.ai_ainvoke("Thanks", [], conversation_id="failed"))
+        first_call = next(r for r in planner.requests if r[-1].content == "Thanks")
+        assert [m.type for m in first_call[1:]] == ["human", "ai", "human"]
+        financial_agent.forget_conversation("failed")
+
+    def test_session_thread_ends_with_the_session(self, planner):
+        async def main():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+                first = (await c.post("/sessions/chat", json={"message": QUESTION})).json()
+                await c.post("/sessions/chat", json={"message": "Thanks", "session_id": first["session_id"]})
+                await c.delete(f"/sessions/{first['session_id']}")
+                return first["session_id"]
+
+        session_id = asyncio.run(main())
+        assert [m.content for m in planner.requests[-1] if m.type == "human"] == [QUESTION, "Thanks"]
+        assert financial_agent.checkpointer.get_tuple({"configurable": {"thread_id": session_id}}) is None
+
+
+if __name__ == "__main__":
+
+    pytest.main([__file__, "-v", "--tb=short"])
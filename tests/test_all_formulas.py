@@ -402,20 +402,22 @@ class TestAllFinancialFormulas:
     
     @pytest.mark.performance
     def test_calculation_speed(self):
-        """Test that calculations complete quickly"""
-        import time
-        
-        start_time = time.time()
-        
-        # Run multiple calculations
-        for i in range(100):
-            future_value.invoke({"pv": 1000 + i, "r": 0.05, "n": 10})
-            present_value.invoke({"fv": 2000 + i, "r": 0.05, "n": 10})
-        
-        elapsed_time = time.time() - start_time
-        
-        # Should complete 200 calculations in under 1 second
-        assert elapsed_time < 1.0
+        """Test the benchmark suite covers every tool and splits math, validation and formatting"""
+        from langchain_core.tools import BaseTool
+        from benchmarks.formula_bench import CASES, run_suite
+        import src.tools.formulas as formulas_module
+
+        tools = {obj.name for obj in vars(formulas_module).values() if isinstance(obj, BaseTool)}
+        assert set(CASES) == tools
+
+        report = run_suite(repeats=2, min_time=0.001, quick=True)
+        for tool_name, cases in report["results"].items():
+            assert "typical" in cases
+            for stages in cases.values():
+                for stage in ("math", "validation", "run", "invoke"):
+                    assert stages[stage]["median_us"] > 0
+                assert stages["invoke"]["median_us"] >= stages["validation"]["median_us"]
+                assert set(stages["derived"]) == {"formatting_us", "framework_us"}
 
 
 # ================================
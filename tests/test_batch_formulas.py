@@ -0,0 +1,152 @@
+"""
+test_batch_formulas.py - Tests for the vectorized formulas in tools/batch.py
+Run with: pytest test_batch_formulas.py -v
+"""
+
+import pytest
+import numpy as np
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.tools import batch
+from src.tools.formulas import (
+    future_value,
+    present_value,
+    fv_annuity,
+    pv_annuity,
+    nper,
+    scenario_sweep,
+)
+
+
+class TestBatchFormulas:
+    """Batch results must match the single-call tools element by element"""
+
+    def test_future_value_arrays(self):
+        """Test FV over parallel arrays"""
+        result = batch.future_value([1000, 5000, 10000], [0.05, 0.12, 0.07], [10, 5, 30])
+        np.testing.assert_allclose(result, [1628.894627, 8811.708416, 76122.550423])
+
+    def test_broadcast_scalar_and_array(self):
+        """Test scalar inputs broadcast against an array"""
+        rates = np.array([0.03, 0.05, 0.07])
+        years = np.array([[5], [10]])
+        result = batch.present_value(1000, rates, years)
+        assert result.shape == (2, 3)
+        np.testing.assert_allclose(result[1, 1], 1000 / 1.05 ** 10)
+
+    def test_scalar_inputs_return_zero_dim_array(self):
+        """Test all-scalar inputs still return an ndarray"""
+        result = batch.fv_annuity(1000, 0.05, 10)
+        assert isinstance(result, np.ndarray)
+        assert result.shape == ()
+
+    @pytest.mark.parametrize("fn,tool,label", [
+        (batch.fv_annuity, fv_annuity, "Future Value of Annuity"),
+        (batch.pv_annuity, pv_annuity, "Present Value of Annuity"),
+    ])
+    def test_annuity_zero_rate_per_element(self, fn, tool, label):
+        """Test the r == 0 branch is applied only to the zero-rate elements"""
+        rates = [0.0, 0.05, 0.0, 0.004167]
+        result = fn(1000, rates, 10)
+        for rate, value in zip(rates, result):
+            single = tool.invoke({"pmt": 1000, "r": rate, "n": 10})
+            assert f"{label}: ${value:.2f}" in single
+        assert result[0] == result[2] == 10000
+
+    def test_nper_branches_per_element(self):
+        """Test pmt == 0, r == 0 and general NPER branches in one call"""
+        pv = [1000, 1000, 5000, 0]
+        fv = [2000, 5000, 50000, 10000]
+        r = [0.07, 0.0, 0.08, 0.05]
+        pmt = [0, 200, 1000, 500]
+        result = batch.nper(pv, fv, r, pmt)
+        for args, value in zip(zip(pv, fv, r, pmt), result):
+            single = nper.invoke(dict(zip(("pv", "fv", "r", "pmt"), args)))
+            assert f"Number of Periods: {value:.2f}" in single
+        assert result[1] == pytest.approx(20.0)
+
+    def test_undefined_elements_do_not_abort_batch(self):
+        """Test undefined rows come back as inf/nan while others are computed"""
+        years = batch.rule_of_72([0.0, 0.06])
+        assert np.isinf(years[0])
+        assert years[1] == pytest.approx(12.0)
+
+        periods = batch.nper([1000, 1000], [2000, 2000], [0.0, 0.07], 0)
+        assert not np.isfinite(periods[0])
+        assert periods[1] == pytest.approx(10.24, abs=0.01)
+
+    def test_large_batch_matches_scalar_tool(self):
+        """Test a large random batch against the scalar tool"""
+        rng = np.random.default_rng(7)
+        pv = rng.uniform(100, 100000, 10000)
+        r = rng.uniform(0, 0.15, 10000)
+        n = rng.integers(1, 40, 10000)
+        result = batch.future_value(pv, r, n)
+        for i in (0, 4999, 9999):
+            single = future_value.invoke({"pv": float(pv[i]), "r": float(r[i]), "n": int(n[i])})
+            assert f"Future Value: ${result[i]:.2f}" in single
+
+    def test_scalar_tool_rejects_undefined_result(self):
+        """Test the single-call wrapper still raises for undefined inputs"""
+        with pytest.raises(ZeroDivisionError):
+            nper.invoke({"pv": 1000, "fv": 2000, "r": 0.0, "pmt": 0})
+        with pytest.raises(ValueError):
+            present_value.invoke({"fv": 1000, "r": -2.0, "n": 0.5})
+
+
+class TestScenarioSweep:
+    """Tests for batch.sweep and the scenario_sweep tool"""
+
+    def test_grid_shape_and_values(self):
+        """Test the grid has one axis per ranged parameter in order"""
+        grid = batch.sweep("future_value", {"pv": 1000}, {"r": [0.05, 0.06, 0.07], "n": [10, 20]})
+        assert grid.shape == (3, 2)
+        assert grid[0, 0] == pytest.approx(1628.894627)
+        assert grid[2, 1] == pytest.approx(1000 * 1.07 ** 20)
+
+    def test_three_axes_with_default_parameter(self):
+        """Test a 3-D grid over NPER, leaving pmt at its default"""
+        grid = batch.sweep("nper", {"pv": 1000}, {"fv": [2000, 4000], "r": [0.05, 0.06, 0.07, 0.08], "pmt": [0]})
+        assert grid.shape == (2, 4, 1)
+        assert grid[0, 2, 0] == pytest.approx(10.24, abs=0.01)
+
+    @pytest.mark.parametrize("fixed,ranges", [
+        ({"pv": 1000}, {"r": [0.05]}),                      # missing n
+        ({"pv": 1000, "n": 10}, {"r": [0.05], "x": [1]}),   # unknown parameter
+        ({"pv": 1000, "r": 0.05}, {"r": [0.05], "n": [1]}),  # fixed and ranged
+    ])
+    def test_invalid_parameters(self, fixed, ranges):
+        """Test parameter validation"""
+        with pytest.raises(ValueError):
+            batch.sweep("future_value", fixed, ranges)
+
+    def test_tool_matrix_table(self):
+        """Test a 2-parameter sweep renders as a matrix"""
+        result = scenario_sweep.invoke({
+            "formula": "future_value",
+            "fixed": {"pv": 1000},
+            "ranges": {"r": [0.05, 0.06], "n": [10, 20]},
+        })
+        assert "Scenario Sweep: future_value (pv=1000)" in result
+        assert "| 0.05 | $1,628.89 | $2,653.30 |" in result
+
+    def test_tool_long_table_marks_undefined(self):
+        """Test a 1-parameter sweep renders rows and marks undefined cells"""
+        result = scenario_sweep.invoke({"formula": "rule_of_72", "ranges": {"r": [0, 0.06]}})
+        assert "| 0 | n/a |" in result
+        assert "| 0.06 | 12.00 |" in result
+
+    def test_tool_rejects_oversized_grid(self):
+        """Test the tool refuses grids too large to return to the LLM"""
+        with pytest.raises(ValueError):
+            scenario_sweep.invoke({
+                "formula": "future_value",
+                "fixed": {"pv": 1000},
+                "ranges": {"r": list(np.linspace(0.01, 0.1, 50)), "n": list(range(1, 51))},
+            })
+
+
+if __name__ == "__main__":
+
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,146 @@
+"""
+test_caching.py - Tests for the LRU caches in caching.py
+Run with: pytest test_caching.py -v
+"""
+
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage, ToolMessage
+from src.caching import LLMResponseCache, LRUCache, ToolResultCache
+
+
+class TestLRUCache:
+    """Tests for the shared LRU cache"""
+
+    def test_hit_and_miss_counters(self):
+        """Test hits and misses are counted"""
+        cache = LRUCache(maxsize=4)
+        assert cache.get("a") is None
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+        assert cache.stats() == {"size": 1, "maxsize": 4, "hits": 1, "misses": 1, "evictions": 0}
+
+    def test_evicts_least_recently_used(self):
+        """Test the least recently used entry is evicted at the size bound"""
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")          # "b" is now least recently used
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert len(cache) == 2
+        assert cache.evictions == 1
+
+    def test_ttl_expiry(self, monkeypatch):
+        """Test entries expire after the TTL"""
+        now = [1000.0]
+        monkeypatch.setattr("src.caching.time.monotonic", lambda: now[0])
+        cache = LRUCache(maxsize=4, ttl=60)
+        cache.set("a", 1)
+        now[0] += 59
+        assert cache.get("a") == 1
+        now[0] += 2
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_zero_size_disables_cache(self):
+        """Test maxsize=0 never stores anything"""
+        cache = LRUCache(maxsize=0)
+        cache.set("a", 1)
+        assert cache.get("a") is None
+
+
+class TestToolResultCache:
+    """Tests for tool result keying"""
+
+    def test_key_ignores_argument_order_and_int_float(self):
+        """Test equivalent argument dicts share a key"""
+        cache = ToolResultCache()
+        assert cache.make_key("future_value", {"pv": 1000, "r": 0.05, "n": 10}) == \
+            cache.make_key("future_value", {"n": 10.0, "r": 0.05, "pv": 1000.0})
+
+    def test_key_includes_tool_name(self):
+        """Test different tools never share a key"""
+        cache = ToolResultCache()
+        args = {"pmt": 1000, "r": 0.05, "n": 10}
+        assert cache.make_key("fv_annuity", args) != cache.make_key("pv_annuity", args)
+
+    def test_float_noise_is_exact_by_default(self):
+        """Test float noise misses unless rounding is enabled"""
+        exact = ToolResultCache()
+        assert exact.make_key("rule_of_72", {"r": 0.05}) != exact.make_key("rule_of_72", {"r": 0.050000001})
+
+        rounded = ToolResultCache(float_digits=6)
+        rounded.set(rounded.make_key("rule_of_72", {"r": 0.05}), "14.4 years")
+        assert rounded.get(rounded.make_key("rule_of_72", {"r": 0.050000001})) == "14.4 years"
+        assert rounded.get(rounded.make_key("rule_of_72", {"r": 0.0501})) is None
+
+    def test_nested_arguments(self):
+        """Test dict and list arguments (scenario_sweep) are hashable keys"""
+        cache = ToolResultCache()
+        key = cache.make_key("scenario_sweep", {
+            "formula": "future_value",
+            "fixed": {"pv": 1000},
+            "ranges": {"r": [0.05, 0.06], "n": [10, 20]},
+        })
+        cache.set(key, "table")
+        assert cache.get(key) == "table"
+
+
+class TestLLMResponseCache:
+    """Tests for LLM response keying"""
+
+    def first_turn(self, question="What is the future value of $1000 at 5% for 10 years?"):
+        return [SystemMessage(content="You are a planner"), HumanMessage(content=question)]
+
+    def test_same_request_same_key(self):
+        """Test identical requests produce the same stable key"""
+        cache = LLMResponseCache()
+        tools = [{"type": "function", "function": {"name": "future_value"}}]
+        assert cache.make_key(self.first_turn(), tools) == cache.make_key(self.first_turn(), tools)
+        assert len(cache.make_key(self.first_turn(), tools)) == 64
+
+    def test_key_covers_prompt_tools_history_and_message(self):
+        """Test every part of the request changes the key"""
+        cache = LLMResponseCache()
+        tools = [{"type": "function", "function": {"name": "future_value"}}]
+        base = cache.make_key(self.first_turn(), tools)
+        assert cache.make_key(self.first_turn("Something else"), tools) != base
+        assert cache.make_key([SystemMessage(content="Other prompt")] + self.first_turn()[1:], tools) != base
+        assert cache.make_key(self.first_turn(), []) != base
+        history = [self.first_turn()[0], HumanMessage(content="hi"), AIMessage(content="hello"), self.first_turn()[1]]
+        assert cache.make_key(history, tools) != base
+
+    def test_tool_call_ids_are_ignored(self):
+        """Test per-response tool call ids do not change the key"""
+        cache = LLMResponseCache()
+
+        def second_call(call_id, message_cls=AIMessage):
+            call = {"name": "future_value", "args": {"pv": 1000, "r": 0.05, "n": 10}, "id": call_id}
+            return self.first_turn() + [
+                message_cls(content="", tool_calls=[call]),
+                ToolMessage(content="Future Value: $1628.89", tool_call_id=call_id),
+            ]
+
+        assert cache.make_key(second_call("a")) == cache.make_key(second_call("b"))
+        assert cache.make_key(second_call("a")) == cache.make_key(second_call("c", AIMessageChunk))
+
+    def test_stores_responses_with_ttl(self, monkeypatch):
+        """Test a cached response is served until the TTL passes"""
+        now = [0.0]
+        monkeypatch.setattr("src.caching.time.monotonic", lambda: now[0])
+        cache = LLMResponseCache(maxsize=2, ttl=10)
+        key = cache.make_key(self.first_turn())
+        cache.set(key, AIMessage(content="$1,628.89"))
+        assert cache.get(key).content == "$1,628.89"
+        now[0] = 11
+        assert cache.get(key) is None
+
+
+if __name__ == "__main__":
+
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,243 @@
+"""
+test_coalescing.py - Tests for single-flight request coalescing and idempotency keys
+Run with: pytest test_coalescing.py -v
+"""
+
+import asyncio
+import json
+import sys
+import os
+import httpx
+import pytest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+import chat_endpoint
+import financial_agent
+from chat_endpoint import app
+from coalescing import COALESCED, COMPUTED, REPLAYED, IdempotencyConflict, RequestCoalescer
+from llm_backends import ScriptedLLM, set_backend
+
+FV_CALL = {"name": "future_value", "args": {"pv": 1000, "r": 0.05, "n": 10}}
+CHAT = {"message": "How is my money doing?", "chat_history": []}
+
+
+@pytest.fixture
+def llm():
+    backend = ScriptedLLM(tool_calls=[FV_CALL], latency=0.05)
+    set_backend(backend)
+    financial_agent.tool_cache.clear()
+    chat_endpoint.coalescer.completed.clear()
+    yield backend
+    set_backend(None)
+
+
+def client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+class TestRequestCoalescer:
+    """Single-flight and idempotency behaviour of RequestCoalescer"""
+
+    def test_concurrent_identical_requests_share_one_run(self):
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.02)
+            return "answer"
+
+        async def main():
+            coalescer = RequestCoalescer()
+            return await asyncio.gather(*(coalescer.run("k", compute) for _ in range(5)))
+
+        results = asyncio.run(main())
+        assert calls == 1
+        assert [r for r, _ in results] == ["answer"] * 5
+        assert sorted(how for _, how in results) == [COALESCED] * 4 + [COMPUTED]
+
+    def test_sequential_requests_are_not_coalesced(self):
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            return calls
+
+        async def main():
+            coalescer = RequestCoalescer()
+            return [await coalescer.run("k", compute) for _ in range(2)]
+
+        assert asyncio.run(main()) == [(1, COMPUTED), (2, COMPUTED)]
+
+    def test_errors_reach_every_waiter_and_are_not_stored(self):
+        async def compute():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("LLM down")
+
+        async def main():
+            coalescer = RequestCoalescer()
+            results = await asyncio.gather(*(coalescer.run("k", compute, "idem") for _ in range(3)),
+                                           return_exceptions=True)
+            return coalescer, results
+
+        coalescer, results = asyncio.run(main())
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert coalescer.completed.get("idem") is None
+
+    def test_cancelled_waiter_does_not_cancel_the_others(self):
+        async def compute():
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        async def main():
+            coalescer = RequestCoalescer()
+            first = asyncio.ensure_future(coalescer.run("k", compute))
+            second = asyncio.ensure_future(coalescer.run("k", compute))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second
+
+        assert asyncio.run(main()) == ("answer", COALESCED)
+
+    def test_run_is_cancelled_when_every_waiter_leaves(self):
+        finished = False
+
+        async def compute():
+            nonlocal finished
+            await asyncio.sleep(0.05)
+            finished = True
+
+        async def main():
+            coalescer = RequestCoalescer()
+            waiter = asyncio.ensure_future(coalescer.run("k", compute))
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            await asyncio.sleep(0.08)
+
+        asyncio.run(main())
+        assert not finished
+
+    def test_idempotency_key_replays_and_conflicts(self):
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            return "answer"
+
+        async def main():
+            coalescer = RequestCoalescer()
+            first = await coalescer.run("k", compute, "idem")
+            again = await coalescer.run("k", compute, "idem")
+            with pytest.raises(IdempotencyConflict):
+                await coalescer.run("other", compute, "idem")
+            return first, again
+
+        assert asyncio.run(main()) == (("answer", COMPUTED), ("answer", REPLAYED))
+        assert calls == 1
+
+    def test_stream_late_joiner_gets_every_event(self):
+        async def source():
+            for i in range(3):
+                yield {"type": "token", "content": str(i)}
+                await asyncio.sleep(0.01)
+
+        async def consume(coalescer, starts):
+            return [e async for e in coalescer.stream("k", source, starts.append)]
+
+        async def main():
+            coalescer = RequestCoalescer()
+            starts = []
+            first = asyncio.ensure_future(consume(coalescer, starts))
+            await asyncio.sleep(0.015)
+            second = await consume(coalescer, starts)
+            return await first, second, starts
+
+        first, second, starts = asyncio.run(main())
+        assert first == second == [{"type": "token", "content": str(i)} for i in range(3)]
+        assert starts == [COMPUTED, COALESCED]
+
+
+class TestAPI:
+    """Coalescing and idempotency on the chat endpoints"""
+
+    def test_duplicate_chats_share_llm_calls(self, llm):
+        async def main():
+            async with client() as c:
+                return await asyncio.gather(*(c.post("/chat", json=CHAT) for _ in range(5)))
+
+        responses = asyncio.run(main())
+        assert all(r.status_code == 200 for r in responses)
+        assert len({r.json()["message"] for r in responses}) == 1
+        assert llm.calls == 2   # one tool call turn + one final answer, for all five requests
+
+    def test_idempotency_key_replay(self, llm):
+        async def main():
+            async with client() as c:
+                first = await c.post("/chat", json=CHAT, headers={"Idempotency-Key": "abc"})
+                retry = await c.post("/chat", json=CHAT, headers={"Idempotency-Key": "abc"})
+                conflict = await c.post("/chat", json={**CHAT, "message": "Something else"},
+                                        headers={"Idempotency-Key": "abc"})
+                return first, retry, conflict
+
+        first, retry, conflict = asyncio.run(main())
+        assert retry.json()["message"] == first.json()["message"]
+        assert retry.headers["idempotent-replayed"] == "true"
+        assert "idempotent-replayed" not in first.headers
+        assert conflict.status_code == 422
+        assert llm.calls == 2
+
+    def test_double_clicked_session_message_is_stored_once(self, llm):
+        async def main():
+            async with client() as c:
+                created = await c.post("/sessions/chat", json={"message": "Hi"})
+                session_id = created.json()["session_id"]
+                payload = {"message": "How is my money doing?", "session_id": session_id}
+                await asyncio.gather(c.post("/sessions/chat", json=payload), c.post("/sessions/chat", json=payload))
+                return session_id
+
+        session_id = asyncio.run(main())
+        assert len(chat_endpoint.sessions.get(session_id).messages) == 4
+
+    def test_first_messages_from_two_clients_get_their_own_sessions(self, llm):
+        async def main():
+            async with client() as a, client() as b:
+                payload = {"message": "How is my money doing?"}
+                return await asyncio.gather(a.post("/sessions/chat", json=payload),
+                                            b.post("/sessions/chat", json=payload))
+
+        first, second = asyncio.run(main())
+        assert first.json()["session_id"] != second.json()["session_id"]
+        for response in (first, second):
+            assert len(chat_endpoint.sessions.get(response.json()["session_id"]).messages) == 2
+
+    def test_retried_first_message_shares_its_session(self, llm):
+        async def main():
+            async with client() as c:
+                payload, headers = {"message": "How is my money doing?"}, {"Idempotency-Key": "first-turn"}
+                return await asyncio.gather(c.post("/sessions/chat", json=payload, headers=headers),
+                                            c.post("/sessions/chat", json=payload, headers=headers))
+
+        first, retry = asyncio.run(main())
+        assert first.json()["session_id"] == retry.json()["session_id"]
+
+    def test_stream_replay(self, llm):
+        async def main():
+            async with client() as c:
+                headers = {"Idempotency-Key": "stream-1"}
+                first = await c.post("/chat/stream", json=CHAT, headers=headers)
+                retry = await c.post("/chat/stream", json=CHAT, headers=headers)
+                return first, retry
+
+        first, retry = asyncio.run(main())
+        events = [json.loads(line) for line in first.text.splitlines()]
+        assert events[-1]["type"] == "done"
+        assert retry.text == first.text
+        assert llm.calls == 2
+
+
+if __name__ == "__main__":
+
+    pytest.main([__file__, "-v", "--tb=short"])
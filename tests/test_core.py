@@ -0,0 +1,107 @@
+"""
+test_core.py - Tests for the framework-free formulas in tools/core.py
+Run with: pytest test_core.py -v
+"""
+
+import itertools
+import math
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from src.tools import batch, core
+from src.tools.formulas import future_value, nper, rule_of_72
+
+RATES = [-1.0, -0.5, 0.0, 0.004167, 0.05, 0.25]
+PERIODS = [0, 0.5, 10, 360, 100000]
+AMOUNTS = [0.0, -1000.0, 1000.0]
+
+
+def _batch_or_error(fn, *args):
+    """The batch result for one element, mapped to the error core should raise."""
+    value = float(fn(*args))
+    if math.isnan(value):
+        return ValueError
+    if math.isinf(value):
+        return ZeroDivisionError
+    return value
+
+
+def _assert_matches_batch(name, args):
+    expected = _batch_or_error(batch.FORMULAS[name], *args)
+    if isinstance(expected, type):
+        with pytest.raises(expected):
+            core.FORMULAS[name](*args)
+    else:
+        assert core.FORMULAS[name](*args) == pytest.approx(expected, rel=1e-12, abs=1e-9)
+
+
+class TestCoreMatchesBatch:
+    """Every scalar result (or error) must agree with the batch formulas"""
+
+    @pytest.mark.parametrize("name", ["future_value", "present_value", "fv_annuity", "pv_annuity"])
+    def test_amount_rate_period_formulas(self, name):
+        """Test FV/PV and both annuities over a grid including zero and negative rates"""
+        for args in itertools.product(AMOUNTS, RATES, PERIODS):
+            _assert_matches_batch(name, args)
+
+    def test_rule_of_72(self):
+        """Test Rule of 72 including the undefined zero rate"""
+        for r in RATES:
+            _assert_matches_batch("rule_of_72", (r,))
+
+    def test_nper_branches(self):
+        """Test the pmt == 0, r == 0 and general NPER branches"""
+        for args in itertools.product([1000.0, 0.0], [2000.0, 500.0], RATES, [0.0, 100.0, -100.0]):
+            _assert_matches_batch("nper", args)
+
+    def test_returns_plain_floats(self):
+        """Test results are Python floats, not NumPy scalars"""
+        for name, args in [("future_value", (1000, 0.05, 10)), ("rule_of_72", (0.08,)),
+                           ("nper", (1000, 2000, 0.05))]:
+            assert type(core.FORMULAS[name](*args)) is float
+
+
+class TestCoreValues:
+    """Known values and error types"""
+
+    def test_known_values(self):
+        assert core.future_value(1000, 0.05, 10) == pytest.approx(1628.894627)
+        assert core.present_value(1628.894627, 0.05, 10) == pytest.approx(1000)
+        assert core.rule_of_72(0.08) == pytest.approx(9.0)
+        assert core.fv_annuity(1000, 0.0, 10) == 10000
+        assert core.pv_annuity(1000, 0.0, 10) == 10000
+        assert core.nper(1000, 5000, 0.0, 200) == pytest.approx(20.0)
+
+    def test_errors(self):
+        """Test diverging results raise ZeroDivisionError and undefined ones ValueError"""
+        with pytest.raises(ZeroDivisionError, match="Rule of 72"):
+            core.rule_of_72(0.0)
+        with pytest.raises(ZeroDivisionError, match="Future value"):
+            core.future_value(1000, 0.05, 100000)
+        with pytest.raises(ValueError, match="Present value"):
+            core.present_value(1000, -2.0, 0.5)
+
+    def test_tools_use_core(self):
+        """Test the tools format exactly what the core returns"""
+        assert f"${core.future_value(1000, 0.05, 10):.2f}" in future_value.invoke({"pv": 1000, "r": 0.05, "n": 10})
+        assert f"{core.nper(1000, 2000, 0.05):.2f}" in nper.invoke({"pv": 1000, "fv": 2000, "r": 0.05})
+        with pytest.raises(ZeroDivisionError):
+            rule_of_72.invoke({"r": 0.0})
+
+    def test_no_framework_imports(self):
+        """Test importing the core pulls in neither LangChain, pydantic nor NumPy"""
+        code = ("import sys; import tools.core; "
+                "print(sorted({m.split('.')[0] for m in sys.modules} & {'langchain_core', 'pydantic', 'numpy'}))")
+        result = subprocess.run([sys.executable, "-c", code], cwd=os.path.join(ROOT, "src"),
+                                capture_output=True, text=True, check=True)
+        assert result.stdout.strip() == "[]"
+
+
+if __name__ == "__main__":
+
+    pytest.main([__file__, "-v", "--tb=short"])
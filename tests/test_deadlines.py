@@ -0,0 +1,173 @@
+"""
+test_deadlines.py - Tests for request deadlines, stage budgets and cancellation on disconnect
+Run with: pytest test_deadlines.py -v
+"""
+
+import asyncio
+import json
+import time
+import sys
+import os
+import httpx
+import pytest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+import deadlines
+import financial_agent
+import metrics
+from chat_endpoint import app
+from deadlines import DeadlineExceeded, DeadlineMiddleware
+from llm_backends import ScriptedLLM, set_backend
+
+FV_CALL = {"name": "future_value", "args": {"pv": 1000, "r": 0.05, "n": 10}}
+
+
+@pytest.fixture
+def slow_llm():
+    backend = ScriptedLLM(tool_calls=[FV_CALL], latency=0.5)
+    set_backend(backend)
+    financial_agent.tool_cache.clear()
+    yield backend
+    set_backend(None)
+
+
+def client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+class Recorder:
+    """ASGI app that sleeps for ``seconds`` and notes whether it was cancelled."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.cancelled = False
+        self.deadline = None
+
+    async def __call__(self, scope, receive, send):
+        await receive()
+        self.deadline = deadlines.remaining()
+        try:
+            await asyncio.sleep(self.seconds)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def call(middleware, headers=(), disconnect_after: float = 10.0) -> list:
+    """Drive one request through ``middleware``; the client disconnects after ``disconnect_after`` seconds."""
+    scope = {"type": "http", "path": "/chat", "method": "POST", "headers": list(headers)}
+    sent, body_sent = [], False
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": b"{}", "more_body": False}
+        await asyncio.sleep(disconnect_after)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await middleware(scope, receive, send)
+    return sent
+
+
+class TestStageBudgets:
+    """Stages get what is left of the deadline"""
+
+    def test_within_cancels_at_the_deadline(self):
+        cancelled = False
+
+        async def slow():
+            nonlocal cancelled
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+
+        async def main():
+            deadlines.current_deadline.set(time.monotonic() + 0.02)
+            with pytest.raises(DeadlineExceeded) as exceeded:
+                await deadlines.within(slow(), "llm_first")
+            return exceeded.value
+
+        assert asyncio.run(main()).stage == "llm_first"
+        assert cancelled
+
+    def test_no_deadline_means_no_limit(self):
+        async def main():
+            return await deadlines.within(asyncio.sleep(0.01, result="done"), "tools")
+
+        assert deadlines.remaining() is None
+        assert asyncio.run(main()) == "done"
+
+    def test_sync_agent_checks_between_stages(self, slow_llm):
+        token = deadlines.current_deadline.set(time.monotonic() - 1)
+        try:
+            with pytest.raises(DeadlineExceeded):
+                financial_agent.ai_invoke("How is my money doing?", [])
+        finally:
+            deadlines.current_deadline.reset(token)
+        assert slow_llm.calls == 0
+
+
+class TestMiddleware:
+    """Deadlines from headers, cancellation on disconnect and past the deadline"""
+
+    def test_header_can_only_shorten_the_budget(self):
+        inner = Recorder(0)
+        asyncio.run(call(DeadlineMiddleware(inner, default=5), headers=[(b"x-request-timeout", b"60")]))
+        assert 4 < inner.deadline <= 5
+        asyncio.run(call(DeadlineMiddleware(inner, default=5), headers=[(b"x-request-timeout", b"0.5")]))
+        assert inner.deadline <= 0.5
+
+    def test_disconnect_cancels_the_handler(self):
+        inner = Recorder(1)
+        abandoned = metrics.REQUESTS_ABANDONED.labels(reason="disconnect").value
+        start = time.perf_counter()
+        sent = asyncio.run(call(DeadlineMiddleware(inner, default=5), disconnect_after=0.05))
+        assert time.perf_counter() - start < 0.5
+        assert inner.cancelled and sent == []
+        assert metrics.REQUESTS_ABANDONED.labels(reason="disconnect").value == abandoned + 1
+
+    def test_handler_past_the_deadline_is_cancelled_with_504(self):
+        inner = Recorder(1)
+        sent = asyncio.run(call(DeadlineMiddleware(inner, default=0.05, grace=0.05)))
+        assert inner.cancelled
+        assert sent[0]["status"] == 504
+
+
+class TestAPI:
+    """Slow turns give up within the client's budget"""
+
+    def test_chat_times_out_with_504(self, slow_llm):
+        async def main():
+            async with client() as c:
+                return await c.post("/chat", json={"message": "How is my money doing?", "chat_history": []},
+                                    headers={"X-Request-Timeout": "0.1"})
+
+        start = time.perf_counter()
+        response = asyncio.run(main())
+        assert time.perf_counter() - start < 0.4
+        assert response.status_code == 504
+        assert "llm_first" in response.json()["detail"]
+        assert financial_agent.llm_limiter.active == 0   # the cancelled call gave its slot back
+
+    def test_stream_reports_the_deadline(self, slow_llm):
+        async def main():
+            async with client() as c:
+                return await c.post("/chat/stream", json={"message": "Where do I stand?", "chat_history": []},
+                                    headers={"X-Request-Timeout": "0.1"})
+
+        events = [json.loads(line) for line in asyncio.run(main()).text.splitlines()]
+        assert events[-1]["type"] == "error" and "deadline" in events[-1]["detail"]
+
+
+if __name__ == "__main__":
+
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,62 @@
+"""
+test_fast_path.py - Precision tests for the LLM-free fast path parser
+Run with: pytest test_fast_path.py -v
+"""
+
+import json
+import pytest
+import sys
+import os
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+from src.fast_path import Intent, parse_intent, render_answer
+
+# Labelled questions: "tool" is the expected intent, or null when the LLM must answer
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "fast_path_corpus.json")) as f:
+    CORPUS = json.load(f)
+
+
+def matches(intent, entry):
+    if intent is None or intent.tool != entry["tool"] or set(intent.args) != set(entry["args"]):
+        return False
+    return all(intent.args[k] == pytest.approx(v) for k, v in entry["args"].items())
+
+
+class TestFastPathCorpus:
+    """Tests the parser against the labelled corpus"""
+
+    def test_precision(self):
+        """Test every question the parser accepts is parsed exactly right"""
+        accepted = [(entry, parse_intent(entry["message"])) for entry in CORPUS]
+        accepted = [(entry, intent) for entry, intent in accepted if intent is not None]
+        wrong = [entry["message"] for entry, intent in accepted if not matches(intent, entry)]
+        assert accepted
+        assert wrong == []
+
+    def test_recall(self):
+        """Test most fully specified questions skip the LLM"""
+        positives = [entry for entry in CORPUS if entry["tool"] is not None]
+        hits = sum(matches(parse_intent(entry["message"]), entry) for entry in positives)
+        assert hits / len(positives) >= 0.9
+
+    @pytest.mark.parametrize("entry", [e for e in CORPUS if e["tool"] is None], ids=lambda e: e["message"][:40])
+    def test_falls_back_when_not_confident(self, entry):
+        """Test underspecified, ambiguous or persona questions go to the LLM"""
+        assert parse_intent(entry["message"]) is None
+
+
+class TestFastPathAnswer:
+    """Tests for the templated answer"""
+
+    def test_answer_includes_result_and_formula(self):
+        """Test the answer carries the tool output and the formula"""
+        intent = Intent("future_value", {"pv": 1000, "r": 0.05, "n": 10})
+        answer = render_answer(intent, "Future Value: $1628.89 (Principal: $1000, Rate: 5.0%, Periods: 10)")
+        assert answer.startswith("Future Value: $1628.89")
+        assert "FV = PV × (1 + r)^n" in answer
+
+
+if __name__ == "__main__":
+
+    pytest.main([__file__, "-v", "--tb=short"])
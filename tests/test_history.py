@@ -0,0 +1,87 @@
+"""
+test_history.py - Tests for the token-budgeted history window
+Run with: pytest test_history.py -v
+"""
+
+import pytest
+import sys
+import os
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from src.history import SUMMARY_HEADER, HistoryWindow, estimate_tokens, extractive_summarizer
+
+
+def conversation(turns):
+    history = []
+    for i in range(turns):
+        history.append(HumanMessage(content=f"Question {i}: I am {30 + i} years old. What should I save?"))
+        history.append(AIMessage(content=f"Answer {i}: Save ${1000 * (i + 1)} per month. That is a good start."))
+    return history
+
+
+class CountingSummarizer:
+    def __init__(self):
+        self.folded = 0
+
+    def __call__(self, summary, messages, token_budget):
+        self.folded += len(messages)
+        return extractive_summarizer(summary, messages, token_budget)
+
+
+class TestHistoryWindow:
+    """Tests for HistoryWindow.build"""
+
+    def test_short_history_passes_through(self):
+        """Test a history within budget is returned unchanged"""
+        history = conversation(2)
+        window, stats = HistoryWindow(token_budget=2000).build(history)
+        assert window == history
+        assert stats["summarized_messages"] == 0
+        assert stats["summary_tokens"] == 0
+
+    def test_no_budget_disables_window(self):
+        """Test token_budget=None keeps the whole history"""
+        history = conversation(50)
+        window, stats = HistoryWindow(token_budget=None).build(history)
+        assert window == history
+        assert stats["window_tokens"] == stats["history_tokens"]
+
+    def test_long_history_is_windowed_and_summarized(self):
+        """Test old turns are folded into a summary and the window stays in budget"""
+        history = conversation(40)
+        window, stats = HistoryWindow(token_budget=200, summary_token_budget=100).build(history)
+        assert isinstance(window[0], SystemMessage)
+        assert window[0].content.startswith(SUMMARY_HEADER)
+        assert isinstance(window[1], HumanMessage)
+        assert window[-1] is history[-1]
+        assert sum(estimate_tokens(m.content) for m in window[1:]) <= 200
+        assert stats["summarized_messages"] + stats["window_messages"] == len(history)
+        assert stats["summary_tokens"] <= 100
+        assert stats["window_tokens"] < stats["history_tokens"]
+
+    def test_summary_keeps_numbers(self):
+        """Test the extractive summary keeps number-bearing sentences"""
+        summary = extractive_summarizer("", [AIMessage(content="Sounds good. Save $500 per month.")], 100)
+        assert summary == "Assistant: Save $500 per month."
+
+    def test_only_new_messages_are_summarized(self):
+        """Test each turn summarizes just the messages that left the window"""
+        summarizer = CountingSummarizer()
+        window = HistoryWindow(token_budget=200, summarizer=summarizer)
+        history = conversation(20)
+        _, first = window.build(history)
+        assert summarizer.folded == first["summarized_messages"]
+
+        _, again = window.build(history)
+        assert summarizer.folded == first["summarized_messages"]
+
+        history += conversation(21)[-2:]
+        _, second = window.build(history)
+        assert summarizer.folded == second["summarized_messages"]
+
+
+if __name__ == "__main__":
+
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,138 @@
+"""
+test_llm_backends.py - Tests for the offline LLM backends
+Run with: pytest test_llm_backends.py -v
+"""
+
+import asyncio
+import time
+import pytest
+import sys
+import os
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage, message_to_dict
+from llm_backends import FlakyLLM, LLMBackend, RecordingLLM, ReplayLLM, ScriptedLLM, create_backend
+
+CALL = {"name": "future_value", "args": {"pv": 1000, "r": 0.05, "n": 10}, "id": "call_fv"}
+
+
+def first_turn():
+    return [HumanMessage(content="What is $1000 worth at 5% for 10 years?")]
+
+
+def second_turn(llm):
+    ai_msg = llm.invoke(first_turn())
+    return first_turn() + [ai_msg, ToolMessage(content="Future Value: $1628.89", tool_call_id="call_fv")]
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+class TestScriptedLLM:
+    """Tests for the scripted fake model"""
+
+    def test_tool_calls_then_answer(self):
+        """Test the fake asks for the scripted tools, then answers with their results"""
+        llm = ScriptedLLM(tool_calls=[CALL], answer="FV is {tool_results}")
+        ai_msg = llm.invoke(first_turn())
+        assert ai_msg.tool_calls[0]["name"] == "future_value"
+        assert ai_msg.tool_calls[0]["args"] == CALL["args"]
+        assert llm.invoke(second_turn(llm)).content == "FV is Future Value: $1628.89"
+        assert llm.calls == 3
+
+    def test_reports_usage(self):
+        """Test fake responses carry token usage"""
+        usage = ScriptedLLM().invoke(first_turn()).usage_metadata
+        assert usage["input_tokens"] > 0 and usage["output_tokens"] > 0
+
+    def test_latency(self):
+        """Test the configured latency applies to sync and async calls"""
+        llm = ScriptedLLM(latency=0.05)
+        start = time.perf_counter()
+        llm.invoke(first_turn())
+        asyncio.run(llm.ainvoke(first_turn()))
+        assert time.perf_counter() - start >= 0.1
+
+    def test_stream_adds_up_to_invoke(self):
+        """Test the streamed chunks merge into the same message as invoke"""
+        llm = ScriptedLLM(tool_calls=[CALL])
+        for messages in (first_turn(), second_turn(llm)):
+            chunks = asyncio.run(collect(llm.astream(messages)))
+            merged = chunks[0]
+            for chunk in chunks[1:]:
+                merged = merged + chunk
+            expected = llm.invoke(messages)
+            assert merged.content == expected.content
+            assert [(c["name"], c["args"]) for c in merged.tool_calls] == \
+                [(c["name"], c["args"]) for c in expected.tool_calls]
+
+    def test_satisfies_backend_interface(self):
+        """Test the offline backends implement LLMBackend"""
+        assert isinstance(ScriptedLLM(), LLMBackend)
+        assert isinstance(create_backend("fake"), ScriptedLLM)
+        with pytest.raises(ValueError):
+            create_backend("nope")
+
+
+class TestRecordReplay:
+    """Tests for recording sessions and replaying them"""
+
+    def test_replay_is_byte_for_byte(self, tmp_path):
+        """Test replayed responses serialize exactly like the recorded ones"""
+        path = str(tmp_path / "session.jsonl")
+        recorder = RecordingLLM(ScriptedLLM(tool_calls=[CALL]), path)
+        recorded = [recorder.invoke(first_turn()), asyncio.run(recorder.ainvoke(second_turn(recorder)))]
+        streamed = asyncio.run(collect(recorder.astream(first_turn())))
+
+        replay = ReplayLLM(path)
+        assert [message_to_dict(m) for m in [replay.invoke(first_turn()), replay.invoke(second_turn(replay))]] == \
+            [message_to_dict(m) for m in [recorded[0], recorded[1]]]
+        replayed = asyncio.run(collect(replay.astream(first_turn())))
+        assert [message_to_dict(c) for c in replayed] == [message_to_dict(c) for c in streamed]
+
+    def test_repeated_requests_replay_in_order(self, tmp_path):
+        """Test one request recorded twice replays both answers in order, then repeats the last"""
+        path = str(tmp_path / "session.jsonl")
+        answers = iter(["first", "second"])
+        recorder = RecordingLLM(ScriptedLLM(responder=lambda messages: AIMessage(content=next(answers))), path)
+        recorder.invoke(first_turn())
+        recorder.invoke(first_turn())
+
+        replay = ReplayLLM(path)
+        assert [replay.invoke(first_turn()).content for _ in range(3)] == ["first", "second", "second"]
+
+    def test_unknown_request(self, tmp_path):
+        """Test a request that was never recorded fails loudly"""
+        path = tmp_path / "session.jsonl"
+        path.write_text("")
+        with pytest.raises(LookupError):
+            ReplayLLM(str(path)).invoke(first_turn())
+
+
+class TestFlakyLLM:
+    """Tests for injected latency and failures"""
+
+    def test_injects_latency_and_failures(self):
+        """Test delays and errors are applied per call before the wrapped model answers"""
+        outcomes = iter([False, True])
+        llm = FlakyLLM(ScriptedLLM(answer="ok"), delay=lambda: 0.05, fail=lambda: next(outcomes))
+        start = time.perf_counter()
+        assert asyncio.run(llm.ainvoke(first_turn())).content == "ok"
+        assert time.perf_counter() - start >= 0.05
+        with pytest.raises(ConnectionError):
+            llm.invoke(first_turn())
+
+    def test_fake_backend_from_env(self, monkeypatch):
+        """Test LLM_FAKE_ERROR_RATE wraps the scripted model"""
+        monkeypatch.setenv("LLM_FAKE_ERROR_RATE", "1")
+        llm = create_backend("fake")
+        assert isinstance(llm, FlakyLLM) and isinstance(llm, LLMBackend)
+        with pytest.raises(ConnectionError):
+            llm.invoke(first_turn())
+
+
+if __name__ == "__main__":
+
+    pytest.main([__file__, "-v", "--tb=short"])
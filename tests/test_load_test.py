@@ -0,0 +1,61 @@
+"""
+test_load_test.py - Tests for the API load-testing harness
+Run with: pytest test_load_test.py -v
+"""
+
+import asyncio
+import json
+import pytest
+import sys
+import os
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+from benchmarks.load_test import LoadConfig, _percentile, run
+from llm_backends import get_backend, set_backend
+
+
+@pytest.fixture(autouse=True)
+def reset_backend():
+    yield
+    set_backend(None)
+
+
+class TestLoadTest:
+    """Tests for the in-process load generator"""
+
+    def test_percentile(self):
+        """Test linear-interpolated percentiles"""
+        values = [float(v) for v in range(1, 101)]
+        assert _percentile(values, 50) == pytest.approx(50.5)
+        assert _percentile(values, 99) == pytest.approx(99.01)
+        assert _percentile([], 95) == 0.0
+
+    @pytest.mark.parametrize("endpoint", ["chat", "sessions", "stream"])
+    def test_report(self, endpoint):
+        """Test every request succeeds and the report is JSON with the latency percentiles"""
+        config = LoadConfig(endpoint=endpoint, concurrency=4, conversations=6, turns=2, llm_latency=0.01)
+        report = asyncio.run(run(config))
+        assert report["requests"] == report["succeeded"] == 12
+        assert report["errors"] == {} and report["error_rate"] == 0.0
+        assert report["throughput_rps"] > 0
+        latency = report["latency_ms"]
+        assert 20 <= latency["p50"] <= latency["p95"] <= latency["p99"] <= latency["max"]
+        assert json.loads(json.dumps(report)) == report
+        assert get_backend().calls == 2 * 12   # every request ran its own turn, none was coalesced
+
+    def test_concurrency_overlaps_llm_waits(self):
+        """Test conversations run concurrently rather than one after another"""
+        config = LoadConfig(concurrency=10, conversations=10, turns=1, llm_latency=0.1)
+        report = asyncio.run(run(config))
+        assert report["duration_s"] < 1.0      # 10 x 2 LLM calls x 0.1 s would be 2 s serially
+
+    def test_unknown_endpoint(self):
+        """Test a bad endpoint name is rejected"""
+        with pytest.raises(ValueError):
+            asyncio.run(run(LoadConfig(endpoint="nope")))
+
+
+if __name__ == "__main__":
+
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,123 @@
+"""
+test_metrics.py - Tests for the in-process metrics and the /metrics endpoint
+Run with: pytest test_metrics.py -v
+"""
+
+import re
+import sys
+import os
+import pytest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+from fastapi.testclient import TestClient
+import financial_agent
+from chat_endpoint import app
+from llm_backends import ScriptedLLM, set_backend
+from metrics import Counter, Gauge, Histogram, Registry
+
+FV_CALL = {"name": "future_value", "args": {"pv": 1000, "r": 0.05, "n": 10}}
+
+
+def sample(text: str, name: str, **labels) -> float:
+    """The value of one sample in a rendered exposition (0 when absent)."""
+    label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    pattern = re.escape(name + ("{" + label_text + "}" if labels else "")) + r" (\S+)"
+    match = re.search("^" + pattern + "$", text, re.M)
+    return float(match.group(1)) if match else 0.0
+
+
+@pytest.fixture
+def llm():
+    backend = ScriptedLLM(tool_calls=[FV_CALL, {"name": "no_such_tool", "args": {}}])
+    set_backend(backend)
+    financial_agent.tool_cache.clear()
+    yield backend
+    set_backend(None)
+
+
+class TestPrimitives:
+    """Counters, gauges and histograms render in the Prometheus text format"""
+
+    def test_counter_and_gauge(self):
+        registry = Registry()
+        calls = registry.register(Counter("calls_total", "Calls", ["tool"]))
+        active = registry.register(Gauge("active", "Active"))
+        calls.labels(tool="fv").inc()
+        calls.labels(tool="fv").inc(2)
+        active.inc()
+        with active.track():
+            assert sample(registry.render(), "active") == 2
+        text = registry.render()
+        assert "# TYPE calls_total counter" in text
+        assert sample(text, "calls_total", tool="fv") == 3
+        assert sample(text, "active") == 1
+        with pytest.raises(ValueError):
+            Counter("x_total", "X").inc(-1)
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = Registry()
+        latency = registry.register(Histogram("latency_seconds", "Latency", ["stage"], buckets=(0.1, 1.0)))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            latency.observe(value, stage="llm")
+        text = registry.render()
+        assert sample(text, "latency_seconds_bucket", stage="llm", le="0.1") == 2
+        assert sample(text, "latency_seconds_bucket", stage="llm", le="1") == 3
+        assert sample(text, "latency_seconds_bucket", stage="llm", le="+Inf") == 4
+        assert sample(text, "latency_seconds_count", stage="llm") == 4
+        assert sample(text, "latency_seconds_sum", stage="llm") == pytest.approx(2.65)
+
+    def test_label_values_are_escaped(self):
+        registry = Registry()
+        errors = registry.register(Counter("errors_total", "Errors", ["detail"]))
+        errors.labels(detail='say "hi"\n').inc()
+        assert 'errors_total{detail="say \\"hi\\"\\n"} 1' in registry.render()
+
+    def test_duplicate_names_rejected(self):
+        registry = Registry()
+        registry.register(Counter("calls_total", "Calls"))
+        with pytest.raises(ValueError):
+            registry.register(Counter("calls_total", "Calls"))
+
+
+class TestMetricsEndpoint:
+    """/metrics reflects the requests served"""
+
+    def test_chat_is_instrumented(self, llm):
+        client = TestClient(app)
+        before = client.get("/metrics").text
+        response = client.post("/chat", json={"message": "How is my money doing?", "chat_history": []})
+        assert response.status_code == 200
+
+        metrics = client.get("/metrics")
+        assert metrics.status_code == 200
+        assert metrics.headers["content-type"].startswith("text/plain; version=0.0.4")
+        text = metrics.text
+
+        def delta(name, **labels):
+            return sample(text, name, **labels) - sample(before, name, **labels)
+
+        assert delta("chat_requests_total", endpoint="chat", status="ok") == 1
+        assert delta("chat_request_seconds_count", endpoint="chat") == 1
+        assert sample(text, "chat_requests_in_flight", endpoint="chat") == 0
+        for stage in ("prepare", "format_prompt", "llm_first", "tools", "llm_final"):
+            assert delta("chat_stage_seconds_count", stage=stage) == 1
+        assert delta("tool_calls_total", tool="future_value") == 1
+        assert delta("tool_execution_seconds_count", tool="future_value") == 1
+        assert delta("tool_errors_total", tool="unknown") == 1
+        assert delta("llm_tokens_total", kind="prompt") > 0
+        assert delta("llm_tokens_total", kind="completion") > 0
+
+    def test_fast_path_is_counted(self, llm):
+        client = TestClient(app)
+        before = client.get("/metrics").text
+        client.post("/chat", json={"message": "What will $1,000 grow to in 10 years at 5%?", "chat_history": []})
+        text = client.get("/metrics").text
+        assert sample(text, "chat_fast_path_total", tool="future_value") - \
+            sample(before, "chat_fast_path_total", tool="future_value") == 1
+        assert llm.calls == 0
+
+
+if __name__ == "__main__":
+
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,171 @@
+"""
+test_persona.py - Tests for persona extraction and persona-aware tools
+Run with: pytest test_persona.py -v
+"""
+
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from langchain_core.messages import AIMessage, HumanMessage
+from src.tools.formulas import retirement_projection
+from src.tools.persona import Persona, current_persona
+
+
+class TestPersonaExtraction:
+    """Tests for reading persona fields from user messages"""
+
+    @pytest.mark.parametrize("text,field,expected", [
+        ("I'm 35 and want to plan ahead", "age", 35),
+        ("I am 42 years old", "age", 42),
+        ("I earn $85,000 a year", "annual_income", 85000),
+        ("My salary is 7000 per month", "annual_income", 84000),
+        ("I have $50k saved", "current_savings", 50000),
+        ("My savings are 120000", "current_savings", 120000),
+        ("I save $1,000/month", "monthly_contribution", 1000),
+        ("I expect a 7% return", "expected_return", 0.07),
+        ("I want to retire at 62", "retirement_age", 62),
+        ("I'll spend $4000 per month in retirement", "monthly_spending", 4000),
+        ("I have $2 million put away", "current_savings", 2000000),
+        ("I want to retire at age 65", "age", None),
+        ("I have 2 kids", "current_savings", None),
+        ("I need $1 million saved by 65", "current_savings", None),
+        ("My goal is to have $2M when I retire", "current_savings", None),
+        ("I want to have $800k by age 60", "current_savings", None),
+    ])
+    def test_fields(self, text, field, expected):
+        """Test each persona field is extracted, and not read from phrasings that only look similar"""
+        persona = Persona()
+        changed = persona.update(text)
+        if expected is None:
+            assert field not in changed and getattr(persona, field) is None
+        else:
+            assert field in changed
+            assert getattr(persona, field) == pytest.approx(expected)
+
+    def test_retirement_age_is_not_the_users_age(self):
+        """Test "retire at age 65" sets only the retirement age, even ahead of the real age"""
+        persona = Persona()
+        persona.update("I want to retire at age 65 and I'm 40")
+        assert persona.retirement_age == 65 and persona.age == 40
+
+    @pytest.mark.parametrize("question,answer,field,expected", [
+        ("How old are you?", "35", "age", 35),
+        ("How much have you saved so far?", "$50,000", "current_savings", 50000),
+        ("What annual return do you expect on your investments?", "6%", "expected_return", 0.06),
+        ("What return do you expect?", "I expect 6%", "expected_return", 0.06),
+        ("Thanks! At what age would you like to retire?", "65", "retirement_age", 65),
+        ("How much can you save each month?", "I can put away $500 monthly", "monthly_contribution", 500),
+        ("How much will you spend per month in retirement?", "About $4,000 a month", "monthly_spending", 4000),
+        ("What is your annual income?", "$7,000 a month", "annual_income", 84000),
+        ("How old are you?", "6%", "age", None),
+        ("How much have you saved so far?", "$500 a month", "current_savings", None),
+        ("How old are you?", "I have 2 kids aged 5 and 7", "age", None),
+        ("Got it. Let me run the numbers.", "35", "age", None),
+    ])
+    def test_short_answers(self, question, answer, field, expected):
+        """Test a reply holding just a number is read as the field the assistant asked for"""
+        persona = Persona()
+        changed = persona.update(answer, question)
+        if expected is None:
+            assert changed == []
+        else:
+            assert changed == [field]
+            assert getattr(persona, field) == pytest.approx(expected)
+
+    def test_question_and_answer_turns(self):
+        """Test a one-question-at-a-time exchange fills the persona"""
+        persona = Persona.from_messages([
+            HumanMessage(content="Can you help me plan for retirement?"),
+            AIMessage(content="Of course! First, how old are you?"),
+            HumanMessage(content="35"),
+            AIMessage(content="Thanks. How much do you currently have saved?"),
+            HumanMessage(content="$50,000"),
+            HumanMessage(content="65"),
+        ])
+        assert persona.age == 35 and persona.current_savings == 50000
+        assert persona.retirement_age is None   # no question before it
+
+    def test_goal_is_not_the_balance(self):
+        """Test a savings target next to the real balance leaves the balance alone"""
+        persona = Persona()
+        persona.update("I have $50,000 saved, but I need $1 million saved by 65")
+        assert persona.current_savings == 50000
+        assert persona.update("I need $1 million saved by 65") == []
+
+    def test_monthly_amounts_are_not_savings(self):
+        """Test a monthly contribution is not mistaken for the savings balance"""
+        persona = Persona()
+        persona.update("I have $1000 per month to invest and save $1000/month")
+        assert persona.current_savings is None
+        assert persona.monthly_contribution == 1000
+
+    def test_plain_calculation_leaves_persona_empty(self):
+        """Test a generic formula question sets nothing"""
+        persona = Persona()
+        assert persona.update("What is the future value of $1000 at 5% for 10 years?") == []
+        assert persona.to_prompt() == ""
+
+    def test_incremental_updates(self):
+        """Test later messages add and overwrite fields without clearing earlier ones"""
+        persona = Persona()
+        persona.update("I'm 35 and I have $50,000 saved")
+        assert persona.update("Actually I'm 36. Saving for my kid's college too") == ["age", "goals"]
+        assert persona.age == 36
+        assert persona.current_savings == 50000
+        assert persona.goals == ["college"]
+        assert persona.update("college again") == []
+
+    def test_from_messages_reads_user_turns_only(self):
+        """Test the assistant's numbers are never taken as the user's"""
+        persona = Persona.from_messages([
+            HumanMessage(content="I'm 35"),
+            AIMessage(content="Great. Many people your age have $100,000 saved."),
+            HumanMessage(content="I want to retire at 60"),
+        ])
+        assert persona.age == 35
+        assert persona.retirement_age == 60
+        assert persona.current_savings is None
+
+    def test_prompt_block(self):
+        """Test the compact prompt block"""
+        persona = Persona(age=35, current_savings=50000, expected_return=0.06)
+        assert persona.to_prompt().endswith("age 35; savings $50,000; expected return 6%")
+        assert persona.tool_args() == {"current_age": 35, "current_savings": 50000, "annual_return": 0.06}
+
+
+class TestPersonaTools:
+    """Tests for tools reading the current persona"""
+
+    ARGS = {"current_age": 35, "current_savings": 50000, "monthly_contribution": 1000,
+            "annual_return": 0.06, "retirement_age": 65, "monthly_spending": 4000}
+
+    def test_missing_arguments_come_from_persona(self):
+        """Test omitted arguments are filled from the persona"""
+        persona = Persona(age=35, current_savings=50000, monthly_contribution=1000,
+                          expected_return=0.06, monthly_spending=4000)
+        token = current_persona.set(persona)
+        try:
+            result = retirement_projection.invoke({"retirement_age": 65})
+        finally:
+            current_persona.reset(token)
+        assert result == retirement_projection.invoke(self.ARGS)
+
+    def test_explicit_arguments_win(self):
+        """Test arguments passed by the LLM override the persona"""
+        token = current_persona.set(Persona(age=50))
+        try:
+            result = retirement_projection.invoke(self.ARGS)
+        finally:
+            current_persona.reset(token)
+        assert "Age 35 -> 65" in result
+
+    def test_missing_without_persona(self):
+        """Test a clear error names the arguments still missing"""
+        with pytest.raises(ValueError, match="Missing monthly_spending"):
+            retirement_projection.invoke({k: v for k, v in self.ARGS.items() if k != "monthly_spending"})
+
+
+if __name__ == "__main__":
+
+    pytest.main([__file__, "-v", "--tb=short"])
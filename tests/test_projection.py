@@ -0,0 +1,95 @@
+"""
+test_projection.py - Tests for the month-by-month retirement projection
+Run with: pytest test_projection.py -v
+"""
+
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.tools import batch
+from src.tools.projection import project_retirement
+from src.tools.formulas import retirement_projection
+
+
+PERSONA = {
+    "current_age": 35,
+    "current_savings": 50000,
+    "monthly_contribution": 1000,
+    "annual_return": 0.06,
+    "retirement_age": 65,
+    "monthly_spending": 4000,
+    "inflation": 0.03,
+}
+
+
+class TestRetirementProjection:
+    """Tests for project_retirement and the retirement_projection tool"""
+
+    def test_accumulation_matches_closed_form(self):
+        """Test balance at retirement equals FV of savings plus FV of contributions"""
+        plan = project_retirement(**PERSONA)
+        expected = float(batch.future_value(50000, 0.005, 360) + batch.fv_annuity(1000, 0.005, 360))
+        assert plan.retirement_month == 360
+        assert plan.balance_at_retirement == pytest.approx(expected)
+
+    def test_path_matches_monthly_loop(self):
+        """Test the vectorized path against a plain month-by-month loop"""
+        plan = project_retirement(**PERSONA)
+        balance = 50000.0
+        for month in range(1, len(plan.balances) + 1):
+            balance *= 1.005
+            if month <= 360:
+                balance += 1000
+            else:
+                balance -= 4000 * 1.03 ** (month / 12)
+            if balance < 0:
+                break
+            assert plan.balances[month - 1] == pytest.approx(balance)
+        assert plan.depletion_age == pytest.approx(35 + month / 12)
+        assert plan.balances[month - 1:].max() == 0
+
+    def test_zero_return_depletion(self):
+        """Test savings longevity with no growth and no inflation"""
+        plan = project_retirement(60, 400000, 0, 0.0, 60, 4000, life_expectancy=100)
+        assert plan.retirement_month == 0
+        assert plan.balance_at_retirement == 400000
+        assert plan.required_monthly_contribution is None
+        # 400000 / 4000 = 100 months; depleted in month 101
+        assert plan.depletion_age == pytest.approx(60 + 101 / 12)
+        assert plan.required_savings == pytest.approx(4000 * 480)
+
+    def test_required_contribution_funds_plan(self):
+        """Test saving the required contribution exactly funds spending to life expectancy"""
+        plan = project_retirement(**PERSONA)
+        funded = project_retirement(**{**PERSONA, "monthly_contribution": plan.required_monthly_contribution})
+        assert funded.balance_at_retirement == pytest.approx(plan.required_savings)
+        assert funded.depletion_age is None
+        assert funded.final_balance == pytest.approx(0, abs=1e-3)
+        assert funded.shortfall == pytest.approx(0, abs=1e-3)
+
+    def test_invalid_ages(self):
+        """Test retirement before today or after life expectancy is rejected"""
+        with pytest.raises(ValueError):
+            project_retirement(**{**PERSONA, "retirement_age": 30})
+        with pytest.raises(ValueError):
+            project_retirement(**{**PERSONA, "life_expectancy": 60})
+
+    def test_less_than_a_month(self):
+        """Test a horizon that rounds to no months is rejected"""
+        with pytest.raises(ValueError, match="at least a month"):
+            project_retirement(**{**PERSONA, "retirement_age": PERSONA["current_age"],
+                                  "life_expectancy": PERSONA["current_age"] + 0.01})
+
+    def test_tool_output(self):
+        """Test the retirement_projection tool summary"""
+        result = retirement_projection.invoke(PERSONA)
+        assert "Balance at retirement: $1,305,643.80" in result
+        assert "Savings run out at age 78.8" in result
+        assert "Required monthly contribution:" in result
+        assert "65: $1,305,644" in result
+
+
+if __name__ == "__main__":
+
+    pytest.main([__file__, "-v", "--tb=short"])
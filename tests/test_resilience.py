@@ -0,0 +1,209 @@
+"""
+test_resilience.py - Tests for hedged LLM requests and the LLM circuit breaker
+Run with: pytest test_resilience.py -v
+"""
+
+import asyncio
+import time
+import sys
+import os
+import httpx
+import pytest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+import financial_agent
+import metrics
+from admission import Overloaded
+from chat_endpoint import app
+from llm_backends import FlakyLLM, ScriptedLLM, set_backend
+from resilience import CircuitBreaker, CircuitOpen, HedgePolicy
+
+FV_QUESTION = "What is the future value of $1000 invested at 5% for 10 years?"
+
+
+def warmed_policy(latency: float = 0.01, samples: int = 20, **kwargs) -> HedgePolicy:
+    """A policy that has already seen ``samples`` calls of ``latency`` seconds."""
+    policy = HedgePolicy(min_delay=0.02, min_samples=samples, **kwargs)
+    for _ in range(samples):
+        policy.latencies.add(latency)
+    return policy
+
+
+def slow_then_fast(slow: float = 0.5):
+    """Delays for successive calls: the first takes ``slow`` seconds, the rest are instant."""
+    delays = iter([slow])
+    return lambda: next(delays, 0.0)
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    """Fresh hedging policy and breaker on the agent, with a fast path that is switched off."""
+    monkeypatch.setattr(financial_agent, "llm_hedge", warmed_policy())
+    monkeypatch.setattr(financial_agent, "llm_breaker", CircuitBreaker(min_calls=4, window=4, cooldown=60))
+    monkeypatch.setattr(financial_agent, "FAST_PATH", False)
+    financial_agent.tool_cache.clear()
+    yield financial_agent
+    set_backend(None)
+
+
+class TestHedgePolicy:
+    """A slow call gets a second request and the faster answer wins"""
+
+    def test_no_hedging_without_history(self):
+        assert HedgePolicy(min_samples=20).delay() is None
+        assert warmed_policy(samples=20, enabled=False).delay() is None
+        assert warmed_policy(latency=0.3).delay() == 0.3
+
+    def test_slow_call_is_hedged(self):
+        policy = warmed_policy()
+        started, cancelled = [], []
+        delay = slow_then_fast()
+
+        async def attempt():
+            started.append(time.perf_counter())
+            try:
+                await asyncio.sleep(delay())
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+            return len(started)
+
+        hedge_wins = metrics.LLM_HEDGES.labels(winner="hedge").value
+        start = time.perf_counter()
+        assert asyncio.run(policy.arun(attempt)) == 2
+        assert time.perf_counter() - start < 0.2
+        assert len(started) == 2 and cancelled == [True]
+        assert metrics.LLM_HEDGES.labels(winner="hedge").value == hedge_wins + 1
+
+    def test_fast_call_is_not_hedged(self):
+        policy = warmed_policy(latency=0.2)
+        calls = []
+
+        async def attempt():
+            calls.append(1)
+            return "answer"
+
+        assert asyncio.run(policy.arun(attempt)) == "answer"
+        assert len(calls) == 1
+
+    def test_no_hedge_without_capacity(self):
+        policy = warmed_policy()
+        calls = []
+
+        async def attempt():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        assert asyncio.run(policy.arun(attempt, can_hedge=lambda: False)) == "answer"
+        assert len(calls) == 1
+
+    def test_both_failing_raises_primary_error(self):
+        policy = warmed_policy()
+        calls = []
+
+        async def attempt():
+            calls.append(1)
+            await asyncio.sleep(0.05 if len(calls) == 1 else 0)
+            raise ConnectionError(f"attempt {len(calls)}")
+
+        with pytest.raises(ConnectionError):
+            asyncio.run(policy.arun(attempt))
+        assert len(calls) == 2
+
+    def test_blocking_calls_are_hedged(self):
+        policy = warmed_policy()
+        delay = slow_then_fast()
+        calls = []
+
+        def attempt():
+            calls.append(1)
+            time.sleep(delay())
+            return "answer"
+
+        start = time.perf_counter()
+        assert policy.run(attempt) == "answer"
+        assert time.perf_counter() - start < 0.2
+        assert len(calls) == 2
+
+
+class TestCircuitBreaker:
+    """Opens on a high error rate, then probes with a single trial call"""
+
+    @staticmethod
+    def fail(breaker: CircuitBreaker, error=ConnectionError) -> None:
+        with pytest.raises(error):
+            with breaker:
+                raise error("provider down")
+
+    def test_opens_on_error_rate(self):
+        breaker = CircuitBreaker(min_calls=4, window=4, failure_rate=0.5, cooldown=30)
+        with breaker:
+            pass
+        with breaker:
+            pass
+        self.fail(breaker)
+        assert not breaker.is_open()
+        self.fail(breaker)
+        assert breaker.is_open()
+        with pytest.raises(CircuitOpen) as rejected:
+            breaker.allow()
+        assert isinstance(rejected.value, Overloaded) and 29 <= rejected.value.retry_after <= 30
+
+    def test_half_open_trial(self):
+        breaker = CircuitBreaker(min_calls=1, window=1, cooldown=0.02)
+        self.fail(breaker)
+        time.sleep(0.03)
+        breaker.allow()   # the trial call
+        with pytest.raises(CircuitOpen):
+            breaker.allow()
+        breaker.record(False)
+        assert breaker.state == CircuitBreaker.CLOSED
+
+        self.fail(breaker)
+        time.sleep(0.03)
+        self.fail(breaker)   # a failed trial opens the circuit again
+        assert breaker.state == CircuitBreaker.OPEN
+
+    def test_rejections_and_cancellations_are_not_failures(self):
+        breaker = CircuitBreaker(min_calls=1, window=1)
+        with pytest.raises(Overloaded):
+            with breaker:
+                raise Overloaded("queue_full", 1)
+        with pytest.raises(asyncio.CancelledError):
+            with breaker:
+                raise asyncio.CancelledError()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+
+class TestAgent:
+    """Hedging and the breaker on the agent, against a fake backend with injected latency and errors"""
+
+    def test_slow_llm_call_is_hedged(self, agent):
+        set_backend(FlakyLLM(ScriptedLLM(), delay=slow_then_fast()))
+        start = time.perf_counter()
+        answer = asyncio.run(agent.ai_ainvoke("How is my money doing?", []))
+        assert answer and time.perf_counter() - start < 0.3
+
+    def test_open_circuit_fails_fast_and_keeps_the_fast_path(self, agent):
+        set_backend(FlakyLLM(ScriptedLLM(), fail=lambda: True))
+        for _ in range(4):
+            with pytest.raises(ConnectionError):
+                agent.ai_invoke("How is my money doing?", [])
+        assert agent.llm_breaker.is_open()
+
+        async def main():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+                llm_question = await c.post("/chat", json={"message": "Should I buy bonds?", "chat_history": []})
+                formula = await c.post("/chat", json={"message": FV_QUESTION, "chat_history": []})
+                return llm_question, formula
+
+        llm_question, formula = asyncio.run(main())
+        assert llm_question.status_code == 503 and int(llm_question.headers["retry-after"]) > 1
+        assert formula.status_code == 200 and "$1628.89" in formula.json()["message"]
+
+
+if __name__ == "__main__":
+
+    pytest.main([__file__, "-v", "--tb=short"])
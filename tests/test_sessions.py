@@ -0,0 +1,78 @@
+"""
+test_sessions.py - Tests for the in-memory session store
+Run with: pytest test_sessions.py -v
+"""
+
+import pytest
+import sys
+import os
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+from src.sessions import SessionStore
+
+
+class TestSessionStore:
+    """Tests for SessionStore bounds and eviction"""
+
+    def test_create_and_get(self):
+        """Test a created session can be fetched by id"""
+        store = SessionStore()
+        session = store.create()
+        assert store.get(session.id) is session
+        assert store.get("missing") is None
+
+    def test_append_keeps_most_recent_messages(self):
+        """Test the per-session message bound drops the oldest messages"""
+        store = SessionStore(max_messages=4)
+        session = store.create()
+        for i in range(3):
+            store.append(session, {"role": "user", "content": f"q{i}"}, {"role": "assistant", "content": f"a{i}"})
+        assert [m["content"] for m in session.messages] == ["q1", "a1", "q2", "a2"]
+
+    def test_evicts_least_recently_used_session(self):
+        """Test the store never exceeds max_sessions"""
+        store = SessionStore(max_sessions=2)
+        first = store.create()
+        second = store.create()
+        store.get(first.id)                 # second is now least recently used
+        third = store.create()
+        assert len(store) == 2
+        assert store.get(second.id) is None
+        assert store.get(first.id) is first
+        assert store.get(third.id) is third
+
+    def test_idle_sessions_expire(self, monkeypatch):
+        """Test sessions idle past the TTL are dropped"""
+        now = [0.0]
+        monkeypatch.setattr("src.sessions.time.monotonic", lambda: now[0])
+        store = SessionStore(idle_ttl=60)
+        idle = store.create()
+        now[0] = 30
+        active = store.create()
+        now[0] = 70
+        assert store.get(idle.id) is None
+        assert store.get(active.id) is active
+        assert len(store) == 1
+
+    def test_delete(self):
+        """Test deleting a session"""
+        store = SessionStore()
+        session = store.create()
+        assert store.delete(session.id)
+        assert not store.delete(session.id)
+        assert store.get(session.id) is None
+
+    def test_on_remove(self):
+        """Test evicted and deleted sessions are reported"""
+        removed = []
+        store = SessionStore(max_sessions=1, on_remove=removed.append)
+        first = store.create()
+        second = store.create()
+        store.delete(second.id)
+        assert removed == [first.id, second.id]
+
+
+if __name__ == "__main__":
+
+    pytest.main([__file__, "-v", "--tb=short"])
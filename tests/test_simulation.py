@@ -0,0 +1,107 @@
+"""
+test_simulation.py - Tests for the Monte Carlo retirement simulation
+Run with: pytest test_simulation.py -v
+"""
+
+import pytest
+import numpy as np
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.tools.projection import project_retirement
+from src.tools import simulation
+from src.tools.simulation import BLOCK_SIZE, PARALLEL_MIN_PATHS, simulate_retirement
+from src.tools.formulas import retirement_monte_carlo
+
+
+PERSONA = {
+    "current_age": 40,
+    "current_savings": 200000,
+    "monthly_contribution": 2000,
+    "annual_return": 0.06,
+    "retirement_age": 65,
+    "monthly_spending": 5000,
+    "inflation": 0.02,
+    "life_expectancy": 90,
+}
+
+
+class TestMonteCarloRetirement:
+    """Tests for simulate_retirement and the retirement_monte_carlo tool"""
+
+    def test_same_seed_same_result(self):
+        """Test results are reproducible from the seed"""
+        first = simulate_retirement(**PERSONA, n_paths=3000, seed=7)
+        second = simulate_retirement(**PERSONA, n_paths=3000, seed=7)
+        other = simulate_retirement(**PERSONA, n_paths=3000, seed=8)
+        assert first.success_rate == second.success_rate
+        np.testing.assert_array_equal(first.final_balance, second.final_balance)
+        assert not np.array_equal(first.balance_at_retirement, other.balance_at_retirement)
+
+    def test_result_independent_of_worker_count(self):
+        """Test the process pool gives exactly the inline result"""
+        n_paths = 3 * BLOCK_SIZE + 17
+        inline = simulate_retirement(**PERSONA, n_paths=n_paths, workers=1)
+        pooled = simulate_retirement(**PERSONA, n_paths=n_paths, workers=2)
+        assert pooled.success_rate == inline.success_rate
+        np.testing.assert_array_equal(pooled.balance_at_retirement, inline.balance_at_retirement)
+        np.testing.assert_array_equal(pooled.final_balance, inline.final_balance)
+        assert pooled.median_depletion_age == inline.median_depletion_age
+
+    def test_process_pool_is_reused(self):
+        """Test pooled runs share one pool that does not fork"""
+        simulate_retirement(**PERSONA, n_paths=2 * BLOCK_SIZE, workers=2)
+        pool = simulation._pool
+        simulate_retirement(**PERSONA, n_paths=2 * BLOCK_SIZE, workers=2)
+        assert simulation._pool is pool
+        assert pool._mp_context.get_start_method() in ("forkserver", "spawn")
+
+    def test_zero_volatility_matches_projection(self):
+        """Test a deterministic simulation reproduces the projection engine"""
+        result = simulate_retirement(**PERSONA, return_volatility=0.0, n_paths=100)
+        plan = project_retirement(**PERSONA)
+        assert result.success_rate == (1.0 if plan.depletion_age is None else 0.0)
+        np.testing.assert_allclose(result.balance_at_retirement, plan.balance_at_retirement)
+        np.testing.assert_allclose(result.final_balance, plan.final_balance)
+
+    def test_stochastic_inflation(self):
+        """Test a comfortable plan succeeds and stochastic inflation paths run"""
+        comfortable = {**PERSONA, "monthly_spending": 1000}
+        fixed = simulate_retirement(**comfortable, n_paths=2000)
+        assert fixed.success_rate > 0.95
+        volatile = simulate_retirement(**comfortable, inflation_volatility=0.05, n_paths=2000)
+        assert 0 <= volatile.success_rate <= 1
+
+    def test_full_size_run(self):
+        """Test 10k paths x 600 months completes"""
+        result = simulate_retirement(**PERSONA, n_paths=10000)  # age 40 -> 90 = 600 months
+        assert result.n_paths == 10000
+        assert 0 < result.success_rate < 1
+        assert list(result.final_balance) == sorted(result.final_balance)
+
+    def test_tool_output(self):
+        """Test the retirement_monte_carlo tool summary"""
+        result = retirement_monte_carlo.invoke({**PERSONA, "n_paths": 1000})
+        assert "Monte Carlo Retirement (1,000 paths" in result
+        assert "Probability savings last to age 90:" in result
+        assert "P50:" in result
+
+    def test_tool_path_cap(self):
+        """Test the tool refuses runs large enough to need the process pool"""
+        with pytest.raises(ValueError):
+            retirement_monte_carlo.invoke({**PERSONA, "n_paths": PARALLEL_MIN_PATHS + 1})
+
+    def test_invalid_inputs(self):
+        """Test invalid ages and path counts are rejected"""
+        with pytest.raises(ValueError):
+            simulate_retirement(**{**PERSONA, "retirement_age": 30})
+        with pytest.raises(ValueError):
+            simulate_retirement(**PERSONA, n_paths=0)
+        with pytest.raises(ValueError, match="at least a month"):
+            simulate_retirement(**{**PERSONA, "retirement_age": PERSONA["current_age"],
+                                   "life_expectancy": PERSONA["current_age"] + 0.01})
+
+
+if __name__ == "__main__":
+
+    pytest.main([__file__, "-v", "--tb=short"])
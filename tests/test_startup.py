@@ -0,0 +1,49 @@
+"""
+test_startup.py - Tests that worker start-up is lazy and offline
+Run with: pytest test_startup.py -v
+"""
+
+import pytest
+import sys
+import os
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+from benchmarks.startup_time import measure
+
+
+class TestStartup:
+    """Tests for lazy LLM client construction"""
+
+    @pytest.mark.parametrize("module", ["gemini", "chat_endpoint"])
+    def test_import_needs_no_network(self, module):
+        """Test importing the API modules sends no request (connections are blocked in the child)"""
+        timings = measure(module)
+        assert timings["import_s"] > 0
+
+    def test_warm_up_needs_no_network(self):
+        """Test the start-up warm-up only builds the client"""
+        assert measure("chat_endpoint", warm_up=True)["warm_up_s"] > 0
+
+    def test_client_is_built_once_on_first_use(self, monkeypatch):
+        """Test the factory builds and binds the client lazily, exactly once"""
+        import financial_agent
+        import gemini
+        built = []
+
+        class FakeLLM:
+            def bind_tools(self, tools, tool_choice=None):
+                built.append(len(tools))
+                return "bound"
+
+        monkeypatch.setattr(gemini, "_llm_with_tools", None)
+        monkeypatch.setattr(gemini, "build_llm", FakeLLM)
+        assert built == []
+        assert gemini.get_llm_with_tools() == "bound"
+        assert gemini.llm_with_tools == "bound"
+        assert built == [len(financial_agent.TOOLS)]
+
+
+if __name__ == "__main__":
+
+    pytest.main([__file__, "-v", "--tb=short"])
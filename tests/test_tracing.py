@@ -0,0 +1,200 @@
+"""
+test_tracing.py - Tests for structured logging, request spans and per-request profiling
+Run with: pytest test_tracing.py -v
+"""
+
+import io
+import json
+import logging
+import logging.handlers
+import sys
+import os
+import pytest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+from fastapi.testclient import TestClient
+import chat_endpoint
+import financial_agent
+import profiling
+import tracing
+from chat_endpoint import app, profiles
+from llm_backends import ScriptedLLM, set_backend
+
+FV_CALL = {"name": "future_value", "args": {"pv": 1000, "r": 0.05, "n": 10}}
+CHAT = {"message": "How is my money doing?", "chat_history": []}
+
+
+@pytest.fixture
+def llm():
+    backend = ScriptedLLM(tool_calls=[FV_CALL], latency=0.03)
+    set_backend(backend)
+    financial_agent.tool_cache.clear()
+    yield backend
+    set_backend(None)
+
+
+@pytest.fixture
+def log_stream():
+    """Route logging to a buffer as JSON lines for the duration of the test."""
+    stream = io.StringIO()
+    tracing.setup_logging(level="DEBUG", fmt="json", stream=stream)
+    yield stream
+    tracing.shutdown_logging()
+    root = logging.getLogger()
+    root.handlers = [h for h in root.handlers if not isinstance(h, logging.handlers.QueueHandler)]
+    root.setLevel(logging.WARNING)
+
+
+def read_records(stream) -> list:
+    """Flush the log queue and parse what was written."""
+    tracing.shutdown_logging()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+class TestSpans:
+    """Spans nest, time their block and join the request trace"""
+
+    def test_nested_spans_join_trace(self):
+        trace = []
+        token = tracing.current_trace.set(trace)
+        try:
+            with tracing.span("outer") as outer:
+                with tracing.span("inner", tool="future_value"):
+                    pass
+        finally:
+            tracing.current_trace.reset(token)
+        inner, outer_entry = trace
+        assert inner["span"] == "inner" and inner["tool"] == "future_value"
+        assert inner["parent_id"] == outer.span_id == outer_entry["span_id"]
+        assert outer_entry["parent_id"] is None
+        assert outer_entry["duration_ms"] >= inner["duration_ms"] >= 0
+
+    def test_span_records_errors(self):
+        trace = []
+        token = tracing.current_trace.set(trace)
+        try:
+            with pytest.raises(KeyError):
+                with tracing.stage("llm_first"):
+                    raise KeyError("boom")
+        finally:
+            tracing.current_trace.reset(token)
+        assert trace[0]["stage"] == "llm_first" and trace[0]["error"] == "KeyError"
+
+    def test_spans_outside_requests_are_not_collected(self):
+        with tracing.span("standalone"):
+            pass
+        assert tracing.current_trace.get() is None
+
+
+class TestRequestLogging:
+    """Every request gets an id, echoed back and stamped on its log records"""
+
+    def test_request_id_and_trace(self, llm, log_stream):
+        client = TestClient(app)
+        response = client.post("/chat", json=CHAT, headers={"X-Request-ID": "req-123"})
+        assert response.status_code == 200
+        assert response.headers["x-request-id"] == "req-123"
+
+        records = read_records(log_stream)
+        finished = [r for r in records if r["message"] == "request finished"]
+        assert len(finished) == 1
+        summary = finished[0]
+        assert summary["request_id"] == "req-123" and summary["status"] == 200
+        assert summary["path"] == "/chat" and summary["duration_ms"] > 0
+        stages = [span["stage"] for span in summary["spans"] if span["span"] == "stage"]
+        assert stages == ["prepare", "format_prompt", "llm_first", "tools", "llm_final"]
+        assert any(span["span"] == "tool" and span["tool"] == "future_value" for span in summary["spans"])
+
+        # Tool arguments and results are only logged at DEBUG, with the request id
+        tool_logs = [r for r in records if r.get("tool") == "future_value" and r["level"] == "DEBUG"]
+        assert tool_logs and all(r["request_id"] == "req-123" for r in tool_logs)
+
+    def test_generated_request_ids_are_unique(self, llm):
+        client = TestClient(app)
+        ids = {client.post("/chat", json=CHAT).headers["x-request-id"] for _ in range(3)}
+        assert len(ids) == 3
+
+    def test_unsafe_request_id_is_replaced(self, llm):
+        client = TestClient(app)
+        response = client.post("/chat", json=CHAT, headers={"X-Request-ID": "../../etc/passwd"})
+        assert response.headers["x-request-id"] != "../../etc/passwd"
+
+
+class TestProfiling:
+    """Opt-in per-request profiles"""
+
+    @pytest.mark.parametrize("header,rate,expected", [
+        ("cprofile", 0.0, "cprofile"),
+        ("stack", 0.0, "stack"),
+        ("1", 0.0, "cprofile"),
+        ("bogus", 1.0, None),
+        (None, 0.0, None),
+        (None, 1.0, "cprofile"),
+    ])
+    def test_choose_mode(self, header, rate, expected):
+        assert profiling.choose_mode(header, rate) == expected
+
+    def test_one_profile_at_a_time(self):
+        first = profiling.try_start("stack")
+        assert first is not None
+        try:
+            assert profiling.try_start("cprofile") is None
+        finally:
+            profiling.finish(first)
+        second = profiling.try_start("stack")
+        assert second is not None
+        profiling.finish(second)
+
+    @pytest.mark.parametrize("mode,marker", [("cprofile", "cumulative"), ("stack", ";")])
+    def test_profiled_request(self, llm, mode, marker, monkeypatch):
+        # X-Profile is ignored by default: rebuild the middleware stack with PROFILE_HEADER=1
+        context = next(m for m in app.user_middleware if m.cls is tracing.RequestContextMiddleware)
+        monkeypatch.setitem(context.kwargs, "allow_header", True)
+        monkeypatch.setattr(app, "middleware_stack", None)
+        monkeypatch.setattr(chat_endpoint, "DEBUG_ENDPOINTS", True)
+        client = TestClient(app)
+        response = client.post("/chat", json=CHAT, headers={"X-Profile": mode})
+        assert response.status_code == 200
+        assert response.headers["x-profile"] == mode
+        request_id = response.headers["x-request-id"]
+
+        listed = client.get("/debug/profiles").json()["profiles"]
+        assert listed[0]["request_id"] == request_id and listed[0]["mode"] == mode
+        report = client.get(f"/debug/profiles/{request_id}")
+        assert report.status_code == 200 and marker in report.text
+
+    def test_unprofiled_request(self, llm, monkeypatch):
+        monkeypatch.setattr(chat_endpoint, "DEBUG_ENDPOINTS", True)
+        client = TestClient(app)
+        response = client.post("/chat", json=CHAT)
+        assert "x-profile" not in response.headers
+        assert profiles.get(response.headers["x-request-id"]) is None
+        assert client.get("/debug/profiles/unknown").status_code == 404
+
+    def test_off_by_default(self, llm):
+        client = TestClient(app)
+        response = client.post("/chat", json=CHAT, headers={"X-Profile": "cprofile"})
+        assert "x-profile" not in response.headers
+        assert client.get("/debug/profiles").status_code == 404
+
+    def test_debug_token(self, monkeypatch):
+        monkeypatch.setattr(chat_endpoint, "DEBUG_ENDPOINTS", True)
+        monkeypatch.setattr(chat_endpoint, "DEBUG_TOKEN", "s3cret")
+        client = TestClient(app)
+        assert client.get("/debug/profiles").status_code == 403
+        assert client.get("/debug/profiles", headers={"X-Debug-Token": "wrong"}).status_code == 403
+        assert client.get("/debug/profiles", headers={"X-Debug-Token": "s3cret"}).status_code == 200
+
+    def test_store_is_bounded_and_written(self, tmp_path):
+        store = profiling.ProfileStore(maxsize=2, directory=str(tmp_path))
+        for i in range(3):
+            store.add(profiling.Profile(f"r{i}", "stack", "/chat", report=f"main;work {i}"))
+        store.close()   # files are written in the background
+        assert [p["request_id"] for p in store.list()] == ["r2", "r1"]
+        assert (tmp_path / "r0.folded").read_text() == "main;work 0"
+
+
+if __name__ == "__main__":
+
+    pytest.main([__file__, "-v", "--tb=short"])